@@ -1,53 +1,66 @@
-from mpi4py import MPI
-from source.VectorAdditionAveraging import VectorAdditionAveraging
-from source.MonteCarlo import MonteCarlo
-import numpy as np
+import argparse
+import json
+from source.Driver import RunDriver, WORKLOADS
+from source.Backend import BACKENDS
 
-if __name__ == "__main__":
-
-    # Simple/Basic MPI setup
-    world_comm = MPI.COMM_WORLD
-    world_size = world_comm.Get_size()
-    rank = world_comm.Get_rank()
 
-    print("Hello World from rank " + str(rank) + " out of " + str(world_size) + " processors.")
+def parse_value(value):
+    """
+    Parameter value of the command line: JSON if possible (numbers, booleans, lists), otherwise a string
+    """
 
-    # Vector addition and averaging using MPI
-    vector_addition_averaging = VectorAdditionAveraging()
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
 
-    vector_addition_averaging.without_communication()
-    vector_addition_averaging.point_to_point_communication()
-    vector_addition_averaging.point_to_point_communication()
-    vector_addition_averaging.collective_communication()
 
+def parse_arguments():
 
-    # Monte Carlo simulation using MPI
-    reduced_temperature = 0.9
-    reduced_density = 0.9
-    n_steps = 10000#10#10000
-    freq = 1000#1#1000
-    num_particles = 100
-    simulation_cutoff = 3.0
-    max_displacement = 0.1
-    tune_displacement = 0.1
-    plot = True
-    build_method = 'random'
+    parser = argparse.ArgumentParser(description="Run the MPI workloads from a JSON configuration file or from "
+                                                 "the command line, e.g. mpiexec -n 4 python3 main.py demo.json")
+    parser.add_argument('config', nargs='?', help="JSON configuration file with a list of runs")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), help="single run of this workload")
+    parser.add_argument('--backend', choices=BACKENDS, help="backend (overrides the configuration file)")
+    parser.add_argument('--method', action='append', dest='methods',
+                        help="vector_addition method to call (repeatable)")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="workload parameter (repeatable), the value is parsed as JSON if possible, lists "
+                             "are swept with --sweep (list valued parameters go into a configuration file)")
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=[VALUES]',
+                        help="workload parameter swept over a JSON list of values (repeatable)")
+    parser.add_argument('--ranks-per-job', type=int, help="ranks of every job of a sweep")
+    parser.add_argument('--output-dir', help="write the output of every job to its own log file")
+    arguments = parser.parse_args()
 
-    monte_carlo = MonteCarlo(use_mpi=False, reduced_temperature=reduced_temperature,
-                             reduced_density=reduced_density,
-                             n_steps=n_steps, freq=freq, num_particles=num_particles,
-                             simulation_cutoff=simulation_cutoff, max_displacement=max_displacement,
-                             tune_displacement=tune_displacement, plot=plot, build_method=build_method)
-    monte_carlo.main()
+    if arguments.config is None and arguments.workload is None:
+        parser.error("either a configuration file or --workload is required")
+    for setting in arguments.set:
+        if isinstance(parse_value(setting.partition('=')[2]), list):
+            parser.error("--set takes a single value, use --sweep to sweep a parameter over a list: " + setting)
+    for setting in arguments.sweep:
+        if not isinstance(parse_value(setting.partition('=')[2]), list):
+            parser.error("--sweep requires a JSON list of values, got: " + setting)
+    return arguments
 
-    monte_carlo_mpi = MonteCarlo(use_mpi=True, reduced_temperature=reduced_temperature,
-                                 reduced_density=reduced_density,
-                                 n_steps=n_steps, freq=freq, num_particles=num_particles,
-                                 simulation_cutoff=simulation_cutoff, max_displacement=max_displacement,
-                                 tune_displacement=tune_displacement, plot=plot, build_method=build_method)
-    monte_carlo_mpi.main()
-    
 
+if __name__ == "__main__":
 
+    arguments = parse_arguments()
 
+    runs = []
+    if arguments.workload is not None:
+        run = {'workload': arguments.workload, 'parameters': {}, 'sweep': {}}
+        for setting in arguments.set:
+            name, _, value = setting.partition('=')
+            run['parameters'][name] = parse_value(value)
+        for setting in arguments.sweep:
+            name, _, values = setting.partition('=')
+            run['sweep'][name] = parse_value(values)
+        if arguments.methods is not None:
+            run['methods'] = arguments.methods
+        if arguments.ranks_per_job is not None:
+            run['ranks_per_job'] = arguments.ranks_per_job
+        runs.append(run)
 
+    RunDriver.from_file(arguments.config, runs, backend=arguments.backend, output_dir=arguments.output_dir).main()
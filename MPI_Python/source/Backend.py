@@ -0,0 +1,316 @@
+import numpy as np
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+from source.Partition import Partition
+
+
+BACKENDS = ('mpi', 'serial', 'multiprocessing')
+
+
+def load_mpi(thread_level=None):
+    """
+    Import (and thereby initialize) MPI, only needed by the 'mpi' backend
+    The thread level ('single', 'funneled', 'serialized' or 'multiple') only has an effect if MPI is not
+    initialized yet, MPI.Query_thread() returns the level provided by the library.
+    """
+
+    import mpi4py
+    if thread_level is not None and 'mpi4py.MPI' not in sys.modules:
+        mpi4py.rc.thread_level = thread_level
+    from mpi4py import MPI
+    return MPI
+
+
+class SerialRequest:
+
+    def Wait(self):
+        pass
+
+    def Test(self):
+        return True
+
+
+class SerialComm:
+
+    def __init__(self):
+        """
+        Communicator of a single process with the subset of the mpi4py API used by the workloads
+        Reductions, gathers and scatters copy the send buffer into the receive buffer, broadcasts do nothing.
+        """
+
+        pass
+
+    @staticmethod
+    def copy_buffer(sendbuf, recvbuf):
+        """
+        Copy a buffer specification ([array, type] or array) into another one
+        """
+
+        send = sendbuf[0] if isinstance(sendbuf, (list, tuple)) else sendbuf
+        receive = recvbuf[0] if isinstance(recvbuf, (list, tuple)) else recvbuf
+        np.asarray(receive).reshape(-1)[:np.size(send)] = np.asarray(send).reshape(-1)
+
+    @staticmethod
+    def copy_scattered(sendbuf, recvbuf):
+        """
+        Copy the part of rank 0 of a [array, counts, displacements, type] buffer into the receive buffer
+        """
+
+        send, counts, displacements = sendbuf[0], sendbuf[1], sendbuf[2]
+        receive = recvbuf[0] if isinstance(recvbuf, (list, tuple)) else recvbuf
+        start = int(displacements[0])
+        np.asarray(receive).reshape(-1)[:counts[0]] = np.asarray(send).reshape(-1)[start:start + counts[0]]
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def Barrier(self):
+        pass
+
+    def Bcast(self, buf, root=0):
+        pass
+
+    def bcast(self, obj, root=0):
+        return obj
+
+    def gather(self, sendobj, root=0):
+        return [sendobj]
+
+    def allgather(self, sendobj):
+        return [sendobj]
+
+    def Reduce(self, sendbuf, recvbuf, op=None, root=0):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Allreduce(self, sendbuf, recvbuf, op=None):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Iallreduce(self, sendbuf, recvbuf, op=None):
+        self.copy_buffer(sendbuf, recvbuf)
+        return SerialRequest()
+
+    def Gather(self, sendbuf, recvbuf, root=0):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Allgather(self, sendbuf, recvbuf):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Allgatherv(self, sendbuf, recvbuf):
+        self.copy_buffer(sendbuf, recvbuf)
+
+    def Scatterv(self, sendbuf, recvbuf, root=0):
+        self.copy_scattered(sendbuf, recvbuf)
+
+    def Iscatterv(self, sendbuf, recvbuf, root=0):
+        self.copy_scattered(sendbuf, recvbuf)
+        return SerialRequest()
+
+    def Split(self, color=0, key=0):
+        return self if color != SerialMPI.UNDEFINED else SerialMPI.COMM_NULL
+
+    def Free(self):
+        pass
+
+
+class SerialMPI:
+    """
+    Stand-in for the mpi4py.MPI module in a single process without MPI
+    """
+
+    COMM_WORLD = SerialComm()
+    COMM_NULL = None
+    UNDEFINED = -32766
+
+    DOUBLE = 'DOUBLE'
+    INT = 'INT'
+    INT64_T = 'INT64_T'
+    BYTE = 'BYTE'
+
+    SUM = 'SUM'
+    MAX = 'MAX'
+    MIN = 'MIN'
+
+    Wtime = staticmethod(time.perf_counter)
+
+    class Request:
+
+        @staticmethod
+        def Waitall(requests):
+            pass
+
+
+class LazyMPI:
+    """
+    Module level MPI name of the workloads, resolved at the first attribute access after MPI is loaded
+    Once mpi4py.MPI has been imported (by load_mpi or by the driver script) the attributes are those of
+    mpi4py.MPI and are cached on first use, before that those of SerialMPI, so serial runs never import
+    (and initialize) MPI. Pool workers switch to SerialMPI for good with use_serial, as a process forked
+    from an MPI rank must not call MPI.
+    """
+
+    def __getattr__(self, name):
+        if self.__dict__.get('serial', False):
+            module = SerialMPI
+        else:
+            module = sys.modules.get('mpi4py.MPI')
+            if module is None:
+                return getattr(SerialMPI, name)
+
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def use_serial(self):
+        """
+        Resolve all attributes to SerialMPI from now on, dropping those cached from mpi4py.MPI
+        """
+
+        self.__dict__.clear()
+        self.serial = True
+
+
+MPI = LazyMPI()
+
+
+def wait_all(requests):
+    """
+    Wait for requests of mpi4py or of a SerialComm (which are complete when they are returned)
+    A SerialComm can be passed as comm while mpi4py is loaded, whose Waitall rejects its requests.
+    """
+
+    requests = [request for request in requests if not isinstance(request, SerialRequest)]
+    if requests:
+        MPI.Request.Waitall(requests)
+
+
+# state of a pool worker process, set by initialize_worker
+worker_arrays = {}
+worker_shared_memory = []
+worker_context = None
+
+
+def initialize_worker(specs, initializer, initargs):
+    """
+    Attach a pool worker to the shared arrays and create its context with the initializer
+    """
+
+    global worker_context
+
+    # a worker forked from an MPI rank inherits mpi4py, but must not call MPI
+    MPI.use_serial()
+
+    for key, (name, shape, dtype) in specs.items():
+        shared = shared_memory.SharedMemory(name=name)
+        worker_shared_memory.append(shared)
+        worker_arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shared.buf)
+
+    if initializer is not None:
+        worker_context = initializer(*initargs)
+
+
+def worker_array(key):
+    """
+    Shared array of the pool within a worker process (zero-copy)
+    """
+
+    return worker_arrays[key]
+
+
+def get_worker_context():
+    """
+    Object returned by the initializer of the pool within a worker process
+    """
+
+    return worker_context
+
+
+class SharedMemoryPool:
+
+    def __init__(self, n_workers=None, start_method=None):
+        """
+        Pool of worker processes sharing NumPy arrays through multiprocessing.shared_memory
+        The arrays are created by the parent before start() and attached by every worker, so tasks only
+        carry indices and small arguments and results are written into the shared arrays without copies.
+        Task functions have to be picklable (module level functions or static methods).
+        """
+
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+        self.context = multiprocessing.get_context(start_method)
+        self.shared_memory = {}
+        self.specs = {}
+        self.pool = None
+
+    def array(self, key, shape, dtype=np.float64):
+        """
+        Shared array of the given shape, zero initialized (before start)
+        """
+
+        if self.pool is not None:
+            raise ValueError("Shared arrays have to be created before the pool is started: " + str(key))
+
+        dtype = np.dtype(dtype)
+        shared = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self.shared_memory[key] = shared
+        self.specs[key] = (shared.name, shape, dtype.str)
+
+        array = np.ndarray(shape, dtype=dtype, buffer=shared.buf)
+        array[...] = 0
+        return array
+
+    def start(self, initializer=None, initargs=()):
+        """
+        Start the worker processes, every worker attaches to all shared arrays and calls initializer(*initargs)
+        """
+
+        self.pool = self.context.Pool(self.n_workers, initializer=initialize_worker,
+                                      initargs=(self.specs, initializer, initargs))
+
+    def map(self, function, tasks):
+        """
+        Apply function to every task in the workers, returns the results in order
+        """
+
+        return self.pool.map(function, tasks, chunksize=1)
+
+    def partitions(self):
+        """
+        Start and stride of the cyclic partition of every worker
+        """
+
+        return [(worker, self.n_workers) for worker in range(self.n_workers)]
+
+    def blocks(self, n):
+        """
+        Contiguous blocks [start, end) of n elements, one per worker
+        """
+
+        return Partition(n, self.n_workers).blocks()
+
+    def close(self):
+        """
+        Stop the workers and release the shared arrays
+        Arrays of the parent still pointing into a block keep it mapped until they are freed.
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        for shared in self.shared_memory.values():
+            try:
+                shared.close()
+            except BufferError:
+                pass
+            shared.unlink()
+        self.shared_memory = {}
+        self.specs = {}
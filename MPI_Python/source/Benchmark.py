@@ -0,0 +1,208 @@
+from mpi4py import MPI
+import numpy as np
+import contextlib
+import io
+import json
+from source.VectorAdditionAveraging import VectorAdditionAveraging
+from source.MonteCarlo import MonteCarlo
+
+
+class ScalingBenchmark:
+
+    def __init__(self, workload='vector_addition', sizes=(100000,), rank_counts=None, scaling='strong', n_trials=3,
+                 n_warmup=1, output_file='benchmark.json', method='collective_communication',
+                 workload_parameters=None, comm=None):
+        """
+        Strong and weak scaling benchmark of the MPI workloads within a single launch
+        For every rank count p the first p ranks of MPI.COMM_WORLD (or comm) form a sub-communicator running the
+        workload (VectorAdditionAveraging or MonteCarlo) after n_warmup untimed runs n_trials times.
+        For strong scaling the problem size is fixed, for weak scaling it is multiplied by p.
+        Wall time and the time per profiled phase (maximum over ranks) are written to a JSON file
+        together with the scaling efficiency and the serial fraction of an Amdahl fit.
+        """
+
+        self.world_comm = comm if comm is not None else MPI.COMM_WORLD
+        self.world_size = self.world_comm.Get_size()
+        self.rank = self.world_comm.Get_rank()
+
+        if workload not in ('vector_addition', 'monte_carlo'):
+            raise ValueError("Unknown workload: " + str(workload))
+        if scaling not in ('strong', 'weak'):
+            raise ValueError("Unknown scaling: " + str(scaling))
+
+        self.workload = workload
+        self.sizes = list(sizes)
+        if rank_counts is None:
+            rank_counts = [2 ** i for i in range(int(np.log2(self.world_size)) + 1)]
+        self.rank_counts = sorted(p for p in rank_counts if p <= self.world_size)
+        self.scaling = scaling
+        self.n_trials = n_trials
+        self.n_warmup = n_warmup
+        self.output_file = output_file
+        self.method = method
+        self.workload_parameters = workload_parameters if workload_parameters is not None else {}
+
+    def main(self):
+
+        if self.rank == 0:
+            print("")
+            print("Start " + self.scaling + " scaling benchmark of " + self.workload + " ...")
+            print("-----------------------------------------------------------")
+
+        results = []
+
+        for n_ranks in self.rank_counts:
+            comm = self.world_comm.Split(0 if self.rank < n_ranks else MPI.UNDEFINED, key=self.rank)
+
+            for size in self.sizes:
+                problem_size = size * n_ranks if self.scaling == 'weak' else size
+
+                if comm != MPI.COMM_NULL:
+                    result = self.run_case(comm, problem_size)
+                    if self.rank == 0:
+                        result['base_size'] = size
+                        results.append(result)
+                        print(str(n_ranks) + " ranks, size " + str(problem_size) + ": " + str(result['median']) + " s")
+
+                self.world_comm.Barrier()
+
+            if comm != MPI.COMM_NULL:
+                comm.Free()
+
+        if self.rank == 0:
+            report = {'workload': self.workload, 'method': self.method, 'scaling': self.scaling,
+                      'n_trials': self.n_trials, 'n_warmup': self.n_warmup, 'results': results,
+                      'analysis': self.analyze(results)}
+
+            for analysis in report['analysis']:
+                print("Size " + str(analysis['base_size']) + ": efficiency " + str(analysis['efficiency']) +
+                      ", serial fraction " + str(analysis['serial_fraction']))
+            print("-----------------------------------------------------------")
+
+            if self.output_file is not None:
+                with open(self.output_file, 'w') as output:
+                    json.dump(report, output, indent=2, sort_keys=True, default=float)
+
+            return report
+
+    def create_workload(self, comm, size):
+        """
+        Workload instance with the profiler enabled on the given communicator
+        """
+
+        if self.workload == 'vector_addition':
+            return VectorAdditionAveraging(N=size, comm=comm, profile=True, **self.workload_parameters)
+
+        parameters = dict(plot=False)
+        parameters.update(self.workload_parameters)
+        return MonteCarlo(use_mpi=True, num_particles=size, comm=comm, profile=True, **parameters)
+
+    def run_workload(self, workload):
+        """
+        Run the workload once
+        """
+
+        if self.workload == 'vector_addition':
+            getattr(workload, self.method)()
+        else:
+            workload.main()
+
+    def run_case(self, comm, size):
+        """
+        Warm up and time one rank count and problem size on the communicator (collective)
+        Returns the timings on rank 0
+        """
+
+        times = []
+        phases = []
+
+        for trial in range(self.n_warmup + self.n_trials):
+            workload = self.create_workload(comm, size)
+
+            # the workload output would dominate the benchmark log
+            with contextlib.redirect_stdout(io.StringIO()):
+                comm.Barrier()
+                start_time = MPI.Wtime()
+                self.run_workload(workload)
+                comm.Barrier()
+                elapsed_time = MPI.Wtime() - start_time
+
+            summary = workload.profiler.gather()
+
+            if trial >= self.n_warmup:
+                times.append(elapsed_time)
+                if summary is not None:
+                    phases.append({region['name']: region['max'] for region in summary['regions']})
+
+        if comm.Get_rank() != 0:
+            return None
+
+        phase_names = sorted(set(name for phase in phases for name in phase))
+        return {'ranks': comm.Get_size(), 'size': size, 'times': times, 'median': float(np.median(times)),
+                'min': float(np.min(times)),
+                'phases': {name: float(np.median([phase.get(name, 0.0) for phase in phases])) for name in phase_names}}
+
+    def analyze(self, results):
+        """
+        Scaling efficiency relative to the smallest rank count and the serial fraction of an Amdahl fit
+        (strong scaling) for every base problem size
+        """
+
+        analyses = []
+
+        for size in self.sizes:
+            cases = sorted((result for result in results if result['base_size'] == size), key=lambda r: r['ranks'])
+            if len(cases) == 0:
+                continue
+
+            ranks = np.array([case['ranks'] for case in cases], dtype=float)
+            times = np.array([case['median'] for case in cases])
+
+            if self.scaling == 'strong':
+                efficiency = times[0] * ranks[0] / (ranks * times)
+            else:
+                efficiency = times[0] / times
+
+            analyses.append({'base_size': size,
+                             'efficiency': {str(int(p)): float(e) for p, e in zip(ranks, efficiency)},
+                             'serial_fraction': self.fit_serial_fraction(ranks, times[0] / times)
+                             if self.scaling == 'strong' else None})
+
+        return analyses
+
+    def fit_serial_fraction(self, ranks, speedups):
+        """
+        Least squares fit of the serial fraction s of Amdahl's law to the speedups relative to the
+        smallest rank count p0, S(p) = (s + (1 - s) / p0) / (s + (1 - s) / p)
+        """
+
+        if len(ranks) < 2:
+            return None
+
+        serial_fractions = np.linspace(0.0, 1.0, 10001)[:, None]
+        model = (serial_fractions + (1.0 - serial_fractions) / ranks[0]) / \
+                (serial_fractions + (1.0 - serial_fractions) / ranks[None, :])
+        errors = np.sum((model - speedups[None, :]) ** 2, axis=1)
+
+        return float(serial_fractions[np.argmin(errors), 0])
+
+    def compare(self, previous_file, tolerance=0.1):
+        """
+        Compare the results written to output_file with a previous run (e.g. of an older commit)
+        Returns the cases whose median time increased by more than the relative tolerance
+        """
+
+        with open(previous_file) as previous:
+            previous_results = json.load(previous)['results']
+        with open(self.output_file) as current:
+            current_results = json.load(current)['results']
+
+        previous_times = {(result['ranks'], result['size']): result['median'] for result in previous_results}
+        regressions = []
+        for result in current_results:
+            key = (result['ranks'], result['size'])
+            if key in previous_times and result['median'] > (1.0 + tolerance) * previous_times[key]:
+                regressions.append({'ranks': key[0], 'size': key[1], 'previous': previous_times[key],
+                                    'current': result['median']})
+
+        return regressions
@@ -0,0 +1,167 @@
+from source.Backend import MPI
+import numpy as np
+from source.Profiler import Profiler
+
+
+class DomainDecomposition:
+
+    def __init__(self, comm, box_length, cutoff, profiler=None):
+        """
+        Slab decomposition of a periodic cubic box along the x axis
+        Every rank owns the particles within its slab and keeps the particles of the
+        neighboring slabs within the cutoff of its boundaries as halo.
+        Each slab is split into two halves (checkerboard), moves are only performed
+        within the active half, so that no two active regions interact with each other.
+        The slab boundaries can be shifted (by the same offset on all ranks), after which the
+        particles migrate to their new owners, so particles can cross the slab boundaries.
+        """
+
+        self.comm = comm
+        self.profiler = profiler if profiler is not None else Profiler(comm)
+        self.world_size = self.comm.Get_size()
+        self.rank = self.comm.Get_rank()
+
+        self.box_length = box_length
+        self.cutoff = cutoff
+        self.slab_width = box_length / self.world_size
+
+        if self.slab_width < 2.0 * cutoff:
+            raise ValueError("Slab width " + str(self.slab_width) + " must be at least twice the cutoff, "
+                             "use less ranks or a larger system")
+
+        self.offset = 0.0
+        self.lower = -0.5 * box_length + self.rank * self.slab_width
+        self.left = (self.rank - 1) % self.world_size
+        self.right = (self.rank + 1) % self.world_size
+
+    def wrap(self, positions):
+        """
+        Wrap positions into the periodic box [-box_length/2, box_length/2)
+        """
+
+        return positions - self.box_length * np.round(positions / self.box_length)
+
+    def relative_x(self, positions):
+        """
+        x coordinate relative to the lower boundary of the own slab, in [0, box_length)
+        """
+
+        return np.mod(positions[..., 0] - self.lower, self.box_length)
+
+    def owner(self, positions):
+        """
+        Rank owning each of the positions
+        """
+
+        fraction = np.mod((positions[:, 0] - self.offset) / self.box_length + 0.5, 1.0)
+        return np.minimum((fraction * self.world_size).astype(int), self.world_size - 1)
+
+    def shift(self, offset):
+        """
+        Shift the boundaries of all slabs by offset along the x axis (the same offset on every rank)
+        """
+
+        self.offset = np.mod(offset, self.box_length)
+        self.lower = -0.5 * self.box_length + self.offset + self.rank * self.slab_width
+
+    def migrate(self, local):
+        """
+        Send the own particles which left the slab to their owners (the neighboring ranks)
+        Returns the particles owned by this rank, after shifting the slabs by less than a slab width
+        or moves within the own slab every particle is owned by the rank itself or one of its neighbors.
+        """
+
+        if self.world_size == 1:
+            return local
+
+        owners = self.owner(local)
+        to_left = np.ascontiguousarray(local[owners == self.left])
+        to_right = np.ascontiguousarray(local[(owners == self.right) & (owners != self.left)])
+        kept = [local[owners == self.rank]]
+
+        for send_buffer, dest, source, tag in ((to_left, self.left, self.right, 2),
+                                               (to_right, self.right, self.left, 3)):
+            send_count = np.array([len(send_buffer)], 'i')
+            recv_count = np.empty(1, 'i')
+            self.comm.Sendrecv([send_count, MPI.INT], dest=dest, sendtag=tag,
+                               recvbuf=[recv_count, MPI.INT], source=source, recvtag=tag)
+
+            recv_buffer = np.empty([recv_count[0], 3])
+            self.comm.Sendrecv([send_buffer, MPI.DOUBLE], dest=dest, sendtag=tag,
+                               recvbuf=[recv_buffer, MPI.DOUBLE], source=source, recvtag=tag)
+            kept.append(recv_buffer)
+            self.profiler.count('Sendrecv', send_count.nbytes + send_buffer.nbytes)
+
+        return np.concatenate(kept)
+
+    def in_active_region(self, position, phase):
+        """
+        Whether a position lies within the active half (phase 0 or 1) of the own slab
+        """
+
+        half_width = 0.5 * self.slab_width
+        x = self.relative_x(position)
+        return phase * half_width <= x < (phase + 1) * half_width
+
+    def active_particles(self, local, phase):
+        """
+        Indices of the own particles within the active half (phase 0 or 1) of the slab
+        """
+
+        half_width = 0.5 * self.slab_width
+        x = self.relative_x(local)
+        return np.flatnonzero((x >= phase * half_width) & (x < (phase + 1) * half_width))
+
+    def distribute(self, coordinates, root=0):
+        """
+        Distribute the coordinates generated on the root rank to the owning ranks with a single Scatterv
+        """
+
+        counts = np.zeros(self.world_size, dtype='i')
+
+        if self.rank == root:
+            owners = self.owner(coordinates)
+            order = np.argsort(owners, kind='stable')
+            send_buffer = np.ascontiguousarray(coordinates[order])
+            counts[:] = 3 * np.bincount(owners, minlength=self.world_size)
+        else:
+            send_buffer = None
+
+        self.comm.Bcast([counts, MPI.INT], root=root)
+        displacements = np.insert(np.cumsum(counts), 0, 0)[0:-1]
+
+        local = np.empty([counts[self.rank] // 3, 3])
+        self.comm.Scatterv([send_buffer, counts, displacements, MPI.DOUBLE], [local, MPI.DOUBLE], root=root)
+        self.profiler.count('Bcast', counts.nbytes)
+        self.profiler.count('Scatterv', local.nbytes)
+
+        return local
+
+    def exchange_halo(self, local):
+        """
+        Exchange the particles within the cutoff of the slab boundaries with the neighboring ranks
+        Returns the halo particles received from the left and the right neighbor
+        """
+
+        if self.world_size == 1:
+            return np.empty([0, 3])
+
+        x = self.relative_x(local)
+        to_left = np.ascontiguousarray(local[x < self.cutoff])
+        to_right = np.ascontiguousarray(local[x >= self.slab_width - self.cutoff])
+
+        halo = []
+        for send_buffer, dest, source, tag in ((to_left, self.left, self.right, 0),
+                                               (to_right, self.right, self.left, 1)):
+            send_count = np.array([len(send_buffer)], 'i')
+            recv_count = np.empty(1, 'i')
+            self.comm.Sendrecv([send_count, MPI.INT], dest=dest, sendtag=tag,
+                               recvbuf=[recv_count, MPI.INT], source=source, recvtag=tag)
+
+            recv_buffer = np.empty([recv_count[0], 3])
+            self.comm.Sendrecv([send_buffer, MPI.DOUBLE], dest=dest, sendtag=tag,
+                               recvbuf=[recv_buffer, MPI.DOUBLE], source=source, recvtag=tag)
+            halo.append(recv_buffer)
+            self.profiler.count('Sendrecv', send_count.nbytes + send_buffer.nbytes)
+
+        return np.concatenate(halo)
@@ -0,0 +1,195 @@
+import contextlib
+import importlib
+import itertools
+import json
+import os
+from source.Backend import MPI, BACKENDS, load_mpi
+
+
+# workload name -> module, class and whether it needs the 'mpi' backend, the modules are imported on first use
+WORKLOADS = {
+    'vector_addition': ('source.VectorAdditionAveraging', 'VectorAdditionAveraging', False),
+    'monte_carlo': ('source.MonteCarlo', 'MonteCarlo', False),
+    'parallel_tempering': ('source.ParallelTempering', 'ParallelTempering', True),
+    'scaling_benchmark': ('source.Benchmark', 'ScalingBenchmark', True),
+    'point_to_point': ('source.PointToPoint', 'PointToPointBenchmark', True),
+}
+
+
+class RunDriver:
+
+    def __init__(self, runs, backend='mpi', thread_level=None, output_dir=None):
+        """
+        Run a list of workload configurations within a single launch
+        Every run is a dictionary with the workload name, its constructor parameters, the methods to
+        call (vector_addition only), an optional sweep {parameter: [values]}, ranks_per_job and a backend
+        overriding the one of the driver (a 'serial' or 'multiprocessing' run uses one rank per job). The
+        sweep expands into one job per combination of values. The ranks are split into groups of
+        ranks_per_job ranks (by default as many groups as jobs), every group runs its share of the jobs
+        on its sub-communicator, so a whole parameter sweep shares one MPI startup. With output_dir the
+        output of every job goes to its own log file instead of being interleaved on stdout.
+        Only the modules of the selected workloads are imported, and mpi4py only for the 'mpi' backend.
+        """
+
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(backend))
+        if backend == 'mpi':
+            load_mpi(thread_level=thread_level)
+
+        self.backend = backend
+        self.output_dir = output_dir
+        self.world_comm = MPI.COMM_WORLD
+        self.world_size = self.world_comm.Get_size()
+        self.rank = self.world_comm.Get_rank()
+
+        self.runs = [self.check_run(run) for run in runs]
+
+    @classmethod
+    def from_file(cls, config_file=None, runs=(), backend=None, output_dir=None):
+        """
+        Driver of a JSON configuration file {"backend": ..., "thread_level": ..., "output_dir": ..., "runs": [...]}
+        The runs are appended to those of the file (if any), backend and output_dir override the file.
+        """
+
+        config = {'runs': []}
+        if config_file is not None:
+            with open(config_file) as config_input:
+                config = json.load(config_input)
+
+        if backend is not None:
+            config['backend'] = backend
+        if output_dir is not None:
+            config['output_dir'] = output_dir
+
+        return cls(config['runs'] + list(runs), backend=config.get('backend', 'mpi'),
+                   thread_level=config.get('thread_level'), output_dir=config.get('output_dir'))
+
+    def check_run(self, run):
+        """
+        Validate a run configuration and fill in the defaults
+        """
+
+        run = dict(run)
+        workload = run.get('workload')
+        if workload not in WORKLOADS:
+            raise ValueError("Unknown workload: " + str(workload))
+
+        unknown = set(run) - {'workload', 'name', 'parameters', 'methods', 'sweep', 'ranks_per_job', 'backend'}
+        if unknown:
+            raise ValueError("Unknown run options: " + str(sorted(unknown)))
+
+        run.setdefault('backend', self.backend)
+        if run['backend'] not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(run['backend']))
+        if run['backend'] == 'mpi' and self.backend != 'mpi':
+            raise ValueError("Runs on the mpi backend require the mpi backend of the driver, got: " +
+                             str(self.backend))
+        if WORKLOADS[workload][2] and run['backend'] != 'mpi':
+            raise ValueError("Workload " + workload + " requires the mpi backend, got: " + str(run['backend']))
+        if run['backend'] != 'mpi' and run.get('ranks_per_job', 1) != 1:
+            raise ValueError("Runs on the " + run['backend'] + " backend use one rank per job, got: " +
+                             str(run['ranks_per_job']))
+
+        run.setdefault('name', workload)
+        run.setdefault('parameters', {})
+        run.setdefault('sweep', {})
+        if workload == 'vector_addition':
+            run.setdefault('methods', ['collective_communication'])
+        elif 'methods' in run:
+            raise ValueError("Methods can only be selected for vector_addition, got: " + str(workload))
+        return run
+
+    def get_jobs(self, run):
+        """
+        Parameters of every job of a run, one per combination of the sweep values
+        """
+
+        names = sorted(run['sweep'])
+        jobs = []
+        for values in itertools.product(*[run['sweep'][name] for name in names]):
+            parameters = dict(run['parameters'])
+            parameters.update(zip(names, values))
+            jobs.append(parameters)
+        return jobs
+
+    def get_ranks_per_job(self, run, n_jobs):
+        """
+        Size of the rank groups of a run, by default the ranks are shared equally among the jobs
+        """
+
+        ranks_per_job = run.get('ranks_per_job')
+        if ranks_per_job is None and run['backend'] != 'mpi':
+            ranks_per_job = 1
+        elif ranks_per_job is None:
+            ranks_per_job = max(1, self.world_size // n_jobs)
+        if ranks_per_job < 1 or ranks_per_job > self.world_size:
+            raise ValueError("Unknown ranks per job: " + str(ranks_per_job))
+        return ranks_per_job
+
+    def main(self):
+
+        for run in self.runs:
+            self.run(run)
+
+    def run(self, run):
+        """
+        Run all jobs of a run configuration on groups of ranks (collective)
+        """
+
+        jobs = self.get_jobs(run)
+        ranks_per_job = self.get_ranks_per_job(run, len(jobs))
+        n_groups = self.world_size // ranks_per_job
+
+        # contiguous groups of ranks_per_job ranks, the remaining ranks idle during this run
+        group = self.rank // ranks_per_job
+        comm = self.world_comm.Split(group if group < n_groups else MPI.UNDEFINED, key=self.rank)
+
+        if self.rank == 0:
+            print("")
+            print("Run " + run['name'] + ": " + str(len(jobs)) + " job(s) on " + str(n_groups) + " group(s) of " +
+                  str(ranks_per_job) + " rank(s)")
+            print("-----------------------------------------------------------")
+
+        if comm != MPI.COMM_NULL:
+            for i_job in range(group, len(jobs), n_groups):
+                self.run_job(run, i_job, jobs[i_job], comm)
+            comm.Free()
+
+        self.world_comm.Barrier()
+
+    def run_job(self, run, i_job, parameters, comm):
+        """
+        Create and run the workload of one job on the communicator of its group (collective on comm)
+        """
+
+        module_name, class_name, _ = WORKLOADS[run['workload']]
+        workload_class = getattr(importlib.import_module(module_name), class_name)
+
+        parameters = dict(parameters)
+        parameters['comm'] = comm
+        if run['workload'] in ('vector_addition', 'monte_carlo'):
+            parameters['backend'] = run['backend']
+
+        if comm.Get_rank() == 0 and (self.output_dir is not None or len(run['sweep']) > 0):
+            print("Job " + str(i_job) + " of " + run['name'] + ": " +
+                  str({name: parameters[name] for name in sorted(run['sweep'])}))
+
+        with self.open_log(run, i_job, comm) as log, \
+                (contextlib.redirect_stdout(log) if log is not None else contextlib.nullcontext()):
+            workload = workload_class(**parameters)
+            if run['workload'] == 'vector_addition':
+                for method in run['methods']:
+                    getattr(workload, method)()
+            else:
+                workload.main()
+
+    def open_log(self, run, i_job, comm):
+        """
+        Log file of a job (written by the first rank of its group), None without output_dir
+        """
+
+        if self.output_dir is None or comm.Get_rank() != 0:
+            return contextlib.nullcontext(None)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        return open(os.path.join(self.output_dir, run['name'] + '_' + str(i_job) + '.log'), 'w')
@@ -0,0 +1,123 @@
+import numpy as np
+import os
+
+
+class EnergyStatistics:
+
+    def __init__(self, block_size=1000, history_file=None, history_stride=100, chunk_size=4096):
+        """
+        Streaming statistics of an energy trace with constant memory
+        The running mean and variance are accumulated with Welford's algorithm, the statistical error
+        is estimated from the variance of the means of consecutive blocks of block_size samples.
+        Optionally every history_stride-th sample is kept in a buffer of chunk_size values, which is
+        appended to the (raw float64) history_file whenever it is full.
+        """
+
+        self.block_size = block_size
+        self.history_file = history_file
+        self.history_stride = history_stride
+        self.chunk_size = chunk_size
+
+        self.n_samples = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = np.nan
+
+        self.block_sum = 0.0
+        self.block_count = 0
+        self.n_blocks = 0
+        self.block_mean = 0.0
+        self.block_m2 = 0.0
+
+        self.history = np.empty(chunk_size)
+        self.n_history = 0
+        self.n_history_written = 0
+
+        if self.history_file is not None and os.path.exists(self.history_file):
+            os.remove(self.history_file)
+
+    def add(self, value):
+        """
+        Add a sample to the statistics
+        """
+
+        self.n_samples += 1
+        self.last = value
+        delta = value - self.mean
+        self.mean += delta / self.n_samples
+        self.m2 += delta * (value - self.mean)
+
+        self.block_sum += value
+        self.block_count += 1
+        if self.block_count == self.block_size:
+            self.add_block(self.block_sum / self.block_size)
+            self.block_sum = 0.0
+            self.block_count = 0
+
+        if self.history_file is not None and np.mod(self.n_samples - 1, self.history_stride) == 0:
+            self.history[self.n_history] = value
+            self.n_history += 1
+            if self.n_history == self.chunk_size:
+                self.flush()
+
+    def add_block(self, block_average):
+        """
+        Welford update of the statistics of the block averages
+        """
+
+        self.n_blocks += 1
+        delta = block_average - self.block_mean
+        self.block_mean += delta / self.n_blocks
+        self.block_m2 += delta * (block_average - self.block_mean)
+
+    @property
+    def variance(self):
+        """
+        Sample variance of all values
+        """
+
+        if self.n_samples < 2:
+            return np.nan
+        return self.m2 / (self.n_samples - 1)
+
+    @property
+    def error(self):
+        """
+        Statistical error of the mean from block averaging (requires at least two complete blocks)
+        """
+
+        if self.n_blocks < 2:
+            return np.nan
+        return np.sqrt(self.block_m2 / (self.n_blocks - 1) / self.n_blocks)
+
+    def flush(self):
+        """
+        Append the buffered history to the history file
+        """
+
+        if self.history_file is None or self.n_history == 0:
+            return
+
+        with open(self.history_file, 'ab') as history:
+            self.history[:self.n_history].tofile(history)
+        self.n_history_written += self.n_history
+        self.n_history = 0
+
+    def truncate_history(self):
+        """
+        Drop history written after this state was saved (used when restarting from a checkpoint)
+        """
+
+        if self.history_file is not None and os.path.exists(self.history_file):
+            os.truncate(self.history_file, self.n_history_written * self.history.itemsize)
+
+    def load_history(self):
+        """
+        Read the decimated history written so far (including the buffered values)
+        """
+
+        if self.history_file is None:
+            return np.empty(0)
+
+        written = np.fromfile(self.history_file) if os.path.exists(self.history_file) else np.empty(0)
+        return np.concatenate([written, self.history[:self.n_history]])
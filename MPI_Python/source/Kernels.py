@@ -0,0 +1,176 @@
+import numpy as np
+
+# Numba is optional, without it the kernels below fall back to NumPy array operations
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def particle_energy_numpy(coordinates, i_particle, position, box_length, cutoff2, start, stride):
+    """
+    LJ energy of particle i_particle placed at position with the particles j % stride == start
+    """
+
+    rij = coordinates[start::stride] - position
+    rij -= box_length * np.rint(rij / box_length)
+    rij2 = np.einsum('ij,ij->i', rij, rij)
+
+    # exclude the self interaction if the particle is part of the slice
+    if i_particle >= start and (i_particle - start) % stride == 0:
+        rij2[(i_particle - start) // stride] = np.inf
+
+    rij2 = rij2[rij2 < cutoff2]
+    sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+    return np.sum(4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6))
+
+
+def pair_energies_numpy(positions, position, box_length, cutoff2, out):
+    """
+    LJ pair energies of a particle at position with all positions (zero beyond the cutoff), stored in out
+    """
+
+    rij = positions - position
+    rij -= box_length * np.rint(rij / box_length)
+    rij2 = np.einsum('ij,ij->i', rij, rij)
+
+    sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+    out[:] = 4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6)
+    out[rij2 >= cutoff2] = 0.0
+
+
+def total_pair_energy_numpy(coordinates, box_length, cutoff2):
+    """
+    Total LJ pair energy, row by row
+    """
+
+    e_total = 0.0
+    for i_particle in range(1, len(coordinates)):
+        e_total += particle_energy_numpy(coordinates[:i_particle + 1], i_particle, coordinates[i_particle],
+                                         box_length, cutoff2, 0, 1)
+    return e_total
+
+
+def metropolis_chain_numpy(coordinates, particles, displacements, random_numbers, beta, box_length, cutoff2,
+                           delta_energies):
+    """
+    Metropolis single particle moves with pre-drawn particles, displacements and acceptance random numbers
+    The coordinates are updated in place and the pair energy change of every step is stored.
+    Returns the number of accepted moves
+    """
+
+    n_accept = 0
+    for step in range(len(particles)):
+        i_particle = particles[step]
+        proposed_position = coordinates[i_particle] + displacements[step]
+        proposed_position -= box_length * np.rint(proposed_position / box_length)
+
+        current_energy = particle_energy_numpy(coordinates, i_particle, coordinates[i_particle], box_length,
+                                               cutoff2, 0, 1)
+        proposed_energy = particle_energy_numpy(coordinates, i_particle, proposed_position, box_length, cutoff2,
+                                                0, 1)
+        delta_e = proposed_energy - current_energy
+
+        if delta_e < 0.0 or random_numbers[step] < np.exp(-beta * delta_e):
+            coordinates[i_particle] = proposed_position
+            n_accept += 1
+        else:
+            delta_e = 0.0
+        delta_energies[step] = delta_e
+
+    return n_accept
+
+
+if numba is not None:
+
+    # cache=True stores the machine code next to this file, later processes only load it,
+    # nogil=True lets threads of a rank run the kernels concurrently
+    @numba.njit(cache=True, nogil=True)
+    def particle_energy_compiled(coordinates, i_particle, position, box_length, cutoff2, start, stride):
+        e_total = 0.0
+        for j_particle in range(start, coordinates.shape[0], stride):
+            if j_particle == i_particle:
+                continue
+            rij2 = 0.0
+            for k in range(3):
+                rij = coordinates[j_particle, k] - position[k]
+                rij -= box_length * np.rint(rij / box_length)
+                rij2 += rij * rij
+            if rij2 < cutoff2:
+                sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+                e_total += 4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6)
+        return e_total
+
+    @numba.njit(cache=True, nogil=True)
+    def pair_energies_compiled(positions, position, box_length, cutoff2, out):
+        for j_particle in range(positions.shape[0]):
+            rij2 = 0.0
+            for k in range(3):
+                rij = positions[j_particle, k] - position[k]
+                rij -= box_length * np.rint(rij / box_length)
+                rij2 += rij * rij
+            if rij2 < cutoff2:
+                sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+                out[j_particle] = 4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6)
+            else:
+                out[j_particle] = 0.0
+
+    @numba.njit(cache=True, nogil=True)
+    def total_pair_energy_compiled(coordinates, box_length, cutoff2):
+        e_total = 0.0
+        for i_particle in range(1, coordinates.shape[0]):
+            e_total += particle_energy_compiled(coordinates[:i_particle + 1], i_particle, coordinates[i_particle],
+                                                box_length, cutoff2, 0, 1)
+        return e_total
+
+    @numba.njit(cache=True, nogil=True)
+    def metropolis_chain_compiled(coordinates, particles, displacements, random_numbers, beta, box_length, cutoff2,
+                                  delta_energies):
+        n_accept = 0
+        proposed_position = np.empty(3)
+        for step in range(particles.shape[0]):
+            i_particle = particles[step]
+            for k in range(3):
+                proposed_position[k] = coordinates[i_particle, k] + displacements[step, k]
+                proposed_position[k] -= box_length * np.rint(proposed_position[k] / box_length)
+
+            current_energy = particle_energy_compiled(coordinates, i_particle, coordinates[i_particle], box_length,
+                                                      cutoff2, 0, 1)
+            proposed_energy = particle_energy_compiled(coordinates, i_particle, proposed_position, box_length,
+                                                       cutoff2, 0, 1)
+            delta_e = proposed_energy - current_energy
+
+            if delta_e < 0.0 or random_numbers[step] < np.exp(-beta * delta_e):
+                coordinates[i_particle, :] = proposed_position
+                n_accept += 1
+            else:
+                delta_e = 0.0
+            delta_energies[step] = delta_e
+
+        return n_accept
+
+    particle_energy = particle_energy_compiled
+    pair_energies = pair_energies_compiled
+    total_pair_energy = total_pair_energy_compiled
+    metropolis_chain = metropolis_chain_compiled
+
+else:
+    particle_energy = particle_energy_numpy
+    pair_energies = pair_energies_numpy
+    total_pair_energy = total_pair_energy_numpy
+    metropolis_chain = metropolis_chain_numpy
+
+
+def warm_up():
+    """
+    Compile the kernels (or load them from the cache) on a tiny system, so the first timed call does not compile
+    Returns whether the compiled kernels are used
+    """
+
+    coordinates = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    particle_energy(coordinates, 0, coordinates[0], 4.0, 9.0, 0, 1)
+    pair_energies(coordinates[1:], coordinates[0], 4.0, 9.0, np.empty(1))
+    total_pair_energy(coordinates, 4.0, 9.0)
+    metropolis_chain(coordinates, np.zeros(1, dtype=np.int64), np.zeros([1, 3]), np.zeros(1), 1.0, 4.0, 9.0,
+                     np.zeros(1))
+    return numba is not None
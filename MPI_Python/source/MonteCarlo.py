@@ -1,19 +1,149 @@
-from mpi4py import MPI
 import numpy as np
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from source.NeighborList import CellList, VerletList
+from source.DomainDecomposition import DomainDecomposition
+from source.Trajectory import TrajectoryWriter
+from source.EnergyStatistics import EnergyStatistics
+from source.Observables import Observables
+from source.Profiler import Profiler
+from source.ProgressReporter import ProgressReporter
+from source.Backend import MPI, BACKENDS, SerialComm, SharedMemoryPool, load_mpi, worker_array, get_worker_context
+from source.RandomStream import RandomStream
+from source.Partition import Partition
+
+
+def load_kernels():
+    """
+    Import the compiled kernels (and thereby Numba) on first use, only needed by the compiled energy engine
+    """
+
+    from source import Kernels
+    return Kernels
 
 
 class MonteCarlo:
 
     def __init__(self, use_mpi=True, reduced_temperature=0.9, reduced_density=0.9, n_steps=10000, freq=1000,
                  num_particles=100, simulation_cutoff=3.0, max_displacement=0.1, tune_displacement=0.1,
-                 plot=True, build_method='random'):
-
-        self.use_mpi = use_mpi
-
-        self.world_comm = MPI.COMM_WORLD
+                 plot=True, build_method='random', energy_engine='vectorized', neighbor_method=None,
+                 verlet_skin=0.3, mpi_mode='replicated', domain_phase_steps=100,
+                 seed=1, report_collectives=False, incremental_energy=True, comm=None,
+                 exchange_callback=None, checkpoint_file=None, checkpoint_freq=0, restart_file=None,
+                 trajectory_file=None, trajectory_io='memmap', energy_storage='array', block_size=1000,
+                 history_file=None, history_stride=100, profile=False, profile_file=None, backend=None,
+                 n_workers=None, batch_size='auto', batch_overhead=0.1, initial_file=None, random_block_size=4096,
+                 n_threads=1, thread_level='funneled', thread_chunk_size=8192, progress_output=None,
+                 observables=False, rdf_bins=100, rdf_file=None):
+
+        # only the 'mpi' backend imports mpi4py, the serial and multiprocessing backends run without MPI
+        if backend is None:
+            backend = 'mpi' if use_mpi else 'serial'
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(backend))
+        if backend == 'multiprocessing' and neighbor_method is not None:
+            raise ValueError("Neighbor lists are not supported with the multiprocessing backend")
+        if backend == 'mpi':
+            # only the main thread of a rank calls MPI, the threads evaluate energies
+            load_mpi(thread_level=thread_level if n_threads != 1 else None)
+        self.backend = backend
+        self.n_workers = n_workers
+        self.pool = None
+        self.shared_coordinates = None
+
+        self.use_mpi = backend == 'mpi'
+
+        if energy_engine not in ('vectorized', 'loop', 'compiled'):
+            raise ValueError("Unknown energy engine: " + str(energy_engine))
+        self.energy_engine = energy_engine
+        self.kernels = None
+        if energy_engine == 'compiled':
+            self.kernels = load_kernels()
+            self.kernels.warm_up()
+
+        if neighbor_method not in (None, 'cell', 'verlet'):
+            raise ValueError("Unknown neighbor method: " + str(neighbor_method))
+        self.neighbor_method = neighbor_method
+        self.verlet_skin = verlet_skin
+        self.neighbor_list = None
+
+        if mpi_mode not in ('replicated', 'domain', 'shared_rng', 'batched'):
+            raise ValueError("Unknown MPI mode: " + str(mpi_mode))
+        self.mpi_mode = mpi_mode
+        if observables and mpi_mode == 'domain' and self.use_mpi:
+            raise ValueError("Observables are not supported in MPI mode: " + str(mpi_mode))
+
+        # pressure and g(r), updated with every accepted move and sampled every freq steps
+        self.compute_observables = observables
+        self.rdf_bins = rdf_bins
+        self.rdf_file = rdf_file
+        self.observables = None
+
+        # number of trial moves per communication round of the batched mode, 'auto' measures it
+        if batch_size != 'auto' and (not isinstance(batch_size, (int, np.integer)) or batch_size < 1):
+            raise ValueError("Unknown batch size: " + str(batch_size))
+        self.batch_size = batch_size
+        self.batch_overhead = batch_overhead
+        self.n_batches = 0
+        self.domain_phase_steps = domain_phase_steps
+        self.report_collectives = report_collectives
+        self.n_collectives = 0
+
+        # the compiled serial chain evaluates both energies of a move and does not use stored particle energies
+        self.compiled_chain = energy_engine == 'compiled' and backend == 'serial' and neighbor_method is None and \
+            not observables
+        self.incremental_energy = incremental_energy and not self.compiled_chain
+        self.particle_energies = None
+
+        self.exchange_callback = exchange_callback
+
+        # progress metrics go to a background reporter on rank 0 (file or localhost HTTP) instead of stdout
+        self.progress_output = progress_output
+        self.progress_reporter = None
+        self.progress_request = None
+        self.acceptance_rate = None
+        self.progress_max_displacement = None
+
+        if trajectory_io not in ('memmap', 'mpiio'):
+            raise ValueError("Unknown trajectory io: " + str(trajectory_io))
+        if mpi_mode == 'domain' and self.use_mpi and (checkpoint_file is not None or restart_file is not None or
+                                                 trajectory_file is not None):
+            raise ValueError("Checkpoints and trajectories are not supported with the domain decomposition")
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_freq = checkpoint_freq
+        self.restart_file = restart_file
+        self.trajectory_file = trajectory_file
+        self.trajectory_io = trajectory_io
+
+        # the full energy trace needs n_steps doubles, the streaming statistics constant memory
+        if energy_storage not in ('array', 'streaming'):
+            raise ValueError("Unknown energy storage: " + str(energy_storage))
+        self.energy_storage = energy_storage
+        self.block_size = block_size
+        self.history_file = history_file
+        self.history_stride = history_stride
+        self.energy_statistics = None
+        self.current_energy = 0.0
+
+        # a sub-communicator can be given to run several simulations side by side
+        self.world_comm = comm if comm is not None else MPI.COMM_WORLD
         self.world_size = self.world_comm.Get_size()
         self.rank = self.world_comm.Get_rank()
 
+        self.profiler = Profiler(self.world_comm, enabled=profile, output_file=profile_file)
+
+        # the pair sums of a particle are split cyclically over the ranks, which balances them for any ordering
+        self.partition = Partition(num_particles, self.world_size, 'cyclic')
+
+        # hybrid mode: a pool of threads per rank sharing the energy evaluation of the particles of the rank,
+        # which only exists while main runs
+        self.n_threads = self.get_thread_count(n_threads)
+        self.thread_chunk_size = thread_chunk_size
+        self.thread_pool = None
+        if self.n_threads > 1 and self.use_mpi and MPI.Query_thread() < MPI.THREAD_FUNNELED:
+            raise ValueError("MPI does not support threads, provided thread level: " + str(MPI.Query_thread()))
+
         #else:
          #   self.rank = None
 
@@ -26,54 +156,102 @@ class MonteCarlo:
         self.max_displacement = max_displacement
         self.tune_displacement = tune_displacement
         self.plot = plot
+
+        # initial configuration: random, simple cubic or fcc lattice, or read from an .xyz or .npy file
+        if build_method not in ('random', 'sc', 'fcc', 'file'):
+            raise ValueError("Unknown build method: " + str(build_method))
+        if build_method == 'file' and (initial_file is None or not initial_file.endswith(('.xyz', '.npy'))):
+            raise ValueError("Unknown initial file format: " + str(initial_file))
         self.build_method = build_method
+        self.initial_file = initial_file
 
         self.box_length = np.cbrt(self.num_particles / self.reduced_density)
+
+        # all random numbers derive from seed (an int or a SeedSequence): the initial configuration, the
+        # Markov chain, which is drawn identically on every rank so the moves do not depend on the number
+        # of ranks, one stream per rank for rank local moves and a common stream for the slab shifts
+        # (domain decomposition)
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.initial_seed, chain_seed, rank_seed, domain_seed = [
+            np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + (i,))
+            for i in range(4)]
+        self.random_stream = RandomStream(chain_seed, self.num_particles, block_size=random_block_size)
+        self.rank_random = np.random.default_rng(rank_seed.spawn(self.world_size)[self.rank])
+        self.domain_random = np.random.default_rng(domain_seed)
         self.beta = 1.0 / self.reduced_temperature
         self.simulation_cutoff2 = np.power(self.simulation_cutoff, 2)
         self.n_trials = 0
         self.n_accept = 0
-        self.energy_array = np.zeros(n_steps)
+        self.energy_array = np.zeros(n_steps) if energy_storage == 'array' else None
 
     def main(self):
+        """
+        Run the simulation, with the threads of the hybrid mode shut down at the end even if the run fails
+        """
+
+        self.thread_pool = ThreadPoolExecutor(self.n_threads) if self.n_threads > 1 else None
+        try:
+            self.run_simulation()
+        finally:
+            if self.thread_pool is not None:
+                self.thread_pool.shutdown()
+                self.thread_pool = None
+
+    def run_simulation(self):
+        """
+        Run the simulation in the selected mode
+        """
 
         if self.rank == 0:
             print("")
             if self.use_mpi:
                 print("Start Monte Carlo simulation using MPI ...")
+            elif self.backend == 'multiprocessing':
+                print("Start Monte Carlo simulation using a pool of worker processes ...")
             else:
                 print("Start Monte Carlo simulation ...")
             print("-----------------------------------------------------------")
 
+        self.start_progress()
+
+        if self.use_mpi and self.mpi_mode == 'domain':
+            self.run_domain_decomposition()
+            return
+        elif self.use_mpi and self.mpi_mode == 'shared_rng':
+            self.run_shared_rng()
+            return
+        elif self.mpi_mode == 'batched' and (self.use_mpi or self.backend == 'multiprocessing'):
+            # with the worker pool a batch saves map calls instead of collectives
+            self.run_batched()
+            return
+        elif self.compiled_chain:
+            self.run_compiled()
+            return
+
         start_simulation_time = MPI.Wtime()
         total_energy_time = 0.0
         total_decision_time = 0.0
 
-        if self.use_mpi:
-            if self.rank == 0:
-                coordinates = self.generate_initial_state(method=self.build_method)
-            else:
-                coordinates = np.empty([self.num_particles, 3])
-            self.world_comm.Bcast([coordinates, MPI.DOUBLE], root=0)
-        else:
-            coordinates = self.generate_initial_state(method=self.build_method)
-
-        total_pair_energy = self.calculate_total_pair_energy(coordinates)
+        coordinates, total_pair_energy, n_trials, start_step = self.setup_simulation()
         tail_correction = self.calculate_tail_correction()
-
-        n_trials = 0
+        trajectory = self.open_trajectory(start_step)
 
         if self.use_mpi:
-            for i_step in range(self.n_steps):
+            for i_step in range(start_step, self.n_steps):
+
+                checkpoint = self.checkpoint_due(i_step, start_step)
 
                 if self.rank == 0:
+                    if checkpoint:
+                        random_state = self.get_random_state()
+                        checkpoint_trials = n_trials
+
                     n_trials += 1
 
-                    #np.random.seed(11)
-                    i_particle = np.random.randint(self.num_particles)
+                    i_particle, unit_displacement, random_number = self.random_stream.next_move()
                     i_particle_buf = np.array([i_particle], 'i')
 
-                    random_displacement = (2.0 * np.random.rand(3) - 1.0) * self.max_displacement
+                    random_displacement = unit_displacement * self.max_displacement
                 else:
                     i_particle_buf = np.empty(1, 'i')
                     random_displacement = np.empty(3)
@@ -82,248 +260,1840 @@ class MonteCarlo:
                 i_particle = i_particle_buf[0]
                 self.world_comm.Bcast([random_displacement, MPI.DOUBLE], root=0)
                 self.world_comm.Bcast([coordinates, MPI.DOUBLE], root=0)
+                self.n_collectives += 3
+                self.profiler.count('Bcast', i_particle_buf.nbytes)
+                self.profiler.count('Bcast', random_displacement.nbytes)
+                self.profiler.count('Bcast', coordinates.nbytes)
 
-                start_energy_time = MPI.Wtime()
-                current_energy = self.get_particle_energy(coordinates, i_particle)
-                total_energy_time += MPI.Wtime() - start_energy_time
+                # the broadcast contains the move accepted by rank 0 in the previous step
+                if i_step > start_step:
+                    self.apply_broadcast_move(coordinates, previous_particle, previous_position, previous_energy)
+
+                # the other ranks apply an accepted move one step late, so the sample of a report step is
+                # taken at the beginning of the next step
+                if i_step > start_step and np.mod(i_step, self.freq) == 0:
+                    self.sample_observables()
+
+                # all ranks are in sync at this point
+                if checkpoint:
+                    if self.rank != 0:
+                        random_state, checkpoint_trials = None, None
+                    self.save_checkpoint(i_step, coordinates, total_pair_energy, checkpoint_trials, random_state)
 
-                proposed_coordinates = coordinates.copy()
-                proposed_coordinates[i_particle] += random_displacement
-                proposed_coordinates -= self.box_length * np.round(proposed_coordinates / self.box_length)
+                previous_particle = i_particle
+                previous_position = coordinates[i_particle].copy()
 
                 start_energy_time = MPI.Wtime()
-                proposed_energy = self.get_particle_energy(proposed_coordinates, i_particle)
+                current_energy, proposed_energy, proposed_position = self.evaluate_move(coordinates, i_particle,
+                                                                                        random_displacement)
                 total_energy_time += MPI.Wtime() - start_energy_time
 
+                previous_energy = proposed_energy
+
                 if self.rank == 0:
                     start_decision_time = MPI.Wtime()
 
                     delta_e = proposed_energy - current_energy
 
-                    accept = self.accept_or_reject(delta_e, self.beta)
+                    accept = self.accept_or_reject(delta_e, self.beta, random_number=random_number)
 
                     if accept:
                         total_pair_energy += delta_e
                         self.n_accept += 1
-                        coordinates[i_particle] += random_displacement
+                        self.apply_move(coordinates, i_particle, previous_position, proposed_position, proposed_energy)
 
                     total_energy = (total_pair_energy + tail_correction) / self.num_particles
 
-                    self.energy_array[i_step] = total_energy
+                    self.record_energy(i_step, total_energy)
 
                     # if True:
                     if np.mod(i_step + 1, self.freq) == 0:
                         if self.rank == 0:
-                            print(i_step + 1, self.energy_array[i_step])
+                            self.report_energy(i_step + 1, self.n_accept / float(n_trials))
 
                         if self.tune_displacement:
                             max_displacement, n_trials, self.n_accept = self.adjust_displacement(n_trials)
 
                     total_decision_time += MPI.Wtime() - start_decision_time
 
-        else:
-            for i_step in range(self.n_steps):
+                if np.mod(i_step + 1, self.freq) == 0:
+                    # only rank 0 holds the current coordinates, the trajectory is written from rank 0
+                    if trajectory is not None:
+                        trajectory.write((i_step + 1) // self.freq - 1, coordinates)
 
-                n_trials += 1
+                    self.update_progress(i_step + 1, total_energy_time)
+                    self.exchange_state(i_step + 1, self.current_energy)
 
-                #np.random.seed(11)
-                i_particle = np.random.randint(self.num_particles)
+            # the sample of the last report step needs the last move on all ranks, sent by a final broadcast
+            if self.observables is not None and self.n_steps > start_step and np.mod(self.n_steps, self.freq) == 0:
+                self.world_comm.Bcast([coordinates, MPI.DOUBLE], root=0)
+                self.n_collectives += 1
+                self.profiler.count('Bcast', coordinates.nbytes)
+                self.apply_broadcast_move(coordinates, previous_particle, previous_position, previous_energy)
+                self.sample_observables()
 
-                random_displacement = (2.0 * np.random.rand(3) - 1.0) * self.max_displacement
+        else:
+            for i_step in range(start_step, self.n_steps):
 
-                start_energy_time = MPI.Wtime()
-                current_energy = self.get_particle_energy(coordinates, i_particle)
-                total_energy_time += MPI.Wtime() - start_energy_time
+                if self.checkpoint_due(i_step, start_step):
+                    self.save_checkpoint(i_step, coordinates, total_pair_energy, n_trials, self.get_random_state())
 
-                proposed_coordinates = coordinates.copy()
-                proposed_coordinates[i_particle] += random_displacement
-                proposed_coordinates -= self.box_length * np.round(proposed_coordinates / self.box_length)
+                n_trials += 1
+
+                i_particle, unit_displacement, random_number = self.random_stream.next_move()
+
+                random_displacement = unit_displacement * self.max_displacement
 
                 start_energy_time = MPI.Wtime()
-                proposed_energy = self.get_particle_energy(proposed_coordinates, i_particle)
+                current_energy, proposed_energy, proposed_position = self.evaluate_move(coordinates, i_particle,
+                                                                                        random_displacement)
                 total_energy_time += MPI.Wtime() - start_energy_time
 
                 start_decision_time = MPI.Wtime()
 
                 delta_e = proposed_energy - current_energy
 
-                accept = self.accept_or_reject(delta_e, self.beta)
+                accept = self.accept_or_reject(delta_e, self.beta, random_number=random_number)
 
                 if accept:
                     total_pair_energy += delta_e
                     self.n_accept += 1
-                    coordinates[i_particle] += random_displacement
+                    self.apply_move(coordinates, i_particle, coordinates[i_particle].copy(), proposed_position,
+                                    proposed_energy)
 
                 total_energy = (total_pair_energy + tail_correction) / self.num_particles
 
-                self.energy_array[i_step] = total_energy
+                self.record_energy(i_step, total_energy)
 
                 # if True:
                 if np.mod(i_step + 1, self.freq) == 0:
                     if self.rank == 0:
-                        print(i_step + 1, self.energy_array[i_step])
+                        self.report_energy(i_step + 1, self.n_accept / float(n_trials))
 
                     if self.tune_displacement:
                         max_displacement, n_trials, self.n_accept = self.adjust_displacement(n_trials)
 
+                    if trajectory is not None:
+                        trajectory.write((i_step + 1) // self.freq - 1, coordinates)
+
+                    self.sample_observables()
+                    self.update_progress(i_step + 1, total_energy_time)
+                    self.exchange_state(i_step + 1, self.current_energy)
+
                 total_decision_time += MPI.Wtime() - start_decision_time
 
+        # the shared memory is released once no array points into it anymore
+        if self.pool is not None:
+            coordinates = coordinates.copy()
+            self.stop_pool()
+
+        if trajectory is not None:
+            trajectory.close()
+
         if self.rank == 0:
+            self.report_statistics()
             print("Total simulation time: " + str(MPI.Wtime() - start_simulation_time))
             print("    Energy time:       " + str(total_energy_time))
             print("    Decision time:     " + str(total_decision_time))
+            self.print_collectives()
             print("-----------------------------------------------------------")
 
+        self.report_profile(start_simulation_time, total_energy_time, total_decision_time)
 
-    def generate_initial_state(self, method='random'):
+    def apply_broadcast_move(self, coordinates, i_particle, old_position, new_energy):
         """
-        Function generates initial coordinates for a LJ fluid simulation
-        This function can generate from a random configuration
+        Apply the move of particle i_particle accepted by rank 0, as contained in the broadcast coordinates,
+        on the other ranks (the coordinates are already updated, the particle energies and observables not)
         """
 
-        if method is 'random':
+        if self.rank != 0 and not np.array_equal(coordinates[i_particle], old_position):
+            self.apply_move(coordinates, i_particle, old_position, coordinates[i_particle].copy(), new_energy)
 
-            np.random.seed(seed=1)
-            coordinates = (0.5 - np.random.rand(self.num_particles, 3)) * self.box_length
+    def create_energy_statistics(self):
+        """
+        Streaming energy statistics on rank 0 if energy_storage is 'streaming'
+        """
 
-        return coordinates
+        if self.energy_storage != 'streaming' or self.rank != 0:
+            return None
+        return EnergyStatistics(block_size=self.block_size, history_file=self.history_file,
+                                history_stride=self.history_stride)
+
+    def record_energy(self, i_step, total_energy):
+        """
+        Store the energy per particle of a step in the energy array or the streaming statistics
+        """
 
+        self.current_energy = total_energy
 
-    def lennard_jones_potential(self, rij2):
+        if self.energy_statistics is not None:
+            self.energy_statistics.add(total_energy)
+        else:
+            self.energy_array[i_step] = total_energy
+
+    def report_energy(self, step, acceptance_rate=None):
         """
-        Function evaluates the unitless LJ potential given a squared distance
-        Parameters
+        Print the current energy per particle, with the running mean and its error in the streaming case
+        With a progress reporter the energy is reported by update_progress instead, together with the
+        acceptance rate and the maximum displacement captured here, before the displacement is tuned.
         """
-        # This function computes the LJ energy between two particles
 
-        sig_by_r6 = np.power(1 / rij2, 3)
-        sig_by_r12 = np.power(sig_by_r6, 2)
-        return 4.0 * (sig_by_r12 - sig_by_r6)
+        self.acceptance_rate = acceptance_rate
+        self.progress_max_displacement = self.max_displacement
 
-    def calculate_tail_correction(self):
+        if self.progress_reporter is not None:
+            return
+
+        if self.energy_statistics is not None:
+            print(step, self.current_energy, "mean: " + str(self.energy_statistics.mean) +
+                  " +/- " + str(self.energy_statistics.error))
+        else:
+            print(step, self.current_energy)
+
+    def initialize_observables(self, coordinates):
         """
-        This function computes the standard tail energy correction for the LJ potential
-        Parameters
+        Create the observables and compute the share of the pairs of this rank from the initial configuration
         """
 
-        volume = np.power(self.box_length, 3)
-        sig_by_cutoff3 = np.power(1.0 / self.simulation_cutoff, 3)
-        sig_by_cutoff9 = np.power(sig_by_cutoff3, 3)
-        e_correction = sig_by_cutoff9 - 3.0 * sig_by_cutoff3
+        if not self.compute_observables:
+            return
 
-        e_correction *= 8.0 / 9.0 * np.pi * self.num_particles / volume * self.num_particles
+        self.observables = Observables(self.box_length, self.simulation_cutoff, self.num_particles,
+                                       n_bins=self.rdf_bins, comm=self.world_comm)
+        start, stride = self.get_stride()
+        self.observables.initialize(coordinates, start, stride)
 
-        return e_correction
+    def sample_observables(self):
+        """
+        Sample pressure and g(r), a single Reduce of the virial and the histogram shares (called by all ranks)
+        """
 
-    def minimum_image_distance(self, r_i, r_j):
-        # This function computes the minimum image distance between two particles
+        if self.observables is None:
+            return
 
-        rij = r_i - r_j
-        rij = rij - self.box_length * np.round(rij / self.box_length)
-        rij2 = np.dot(rij, rij)
-        return rij2
+        self.observables.sample()
+        self.profiler.count('Reduce', self.observables.local.nbytes)
+        if self.use_mpi:
+            self.n_collectives += 1
 
-    def get_particle_energy(self, coordinates, i_particle):
+    def report_observables(self):
         """
-        This function computes the minimum image distance between two particles
-        Parameters
+        Print the mean pressure and write g(r) to the rdf file (rank 0)
         """
 
-        e_total = 0.0
+        if self.observables is None or self.observables.n_samples == 0:
+            return
 
-        i_position = coordinates[i_particle]
+        print("Pressure:              " + str(self.observables.pressure(self.reduced_temperature)) + " (" +
+              str(self.observables.n_samples) + " samples)")
 
-        particle_count = len(coordinates)
+        if self.rdf_file is not None:
+            r, g_r = self.observables.radial_distribution()
+            np.savetxt(self.rdf_file, np.column_stack([r, g_r]), header="r g(r)")
+
+    def start_progress(self):
+        """
+        Start the progress reporter thread on rank 0 if a progress output is given
+        """
 
+        self.progress_start_time = MPI.Wtime()
+        self.progress_start_step = None
+
+        if self.progress_output is not None and self.rank == 0:
+            self.progress_reporter = ProgressReporter(self.progress_output)
+            if self.progress_reporter.address is not None:
+                print("Progress: " + self.progress_reporter.address)
+
+    def update_progress(self, step, energy_time):
+        """
+        Queue the progress metrics of a report step (called by all ranks)
+        The energy times of the ranks are collected with a nonblocking gather, which is completed at the
+        next report step, so the per rank times lag one report interval and the loop never waits for it.
+        """
+
+        if self.progress_output is None:
+            return
+
+        rank_energy_times = None
         if self.use_mpi:
-            for j_particle in range(self.rank, particle_count, self.world_size):
+            if self.progress_request is not None:
+                self.progress_request.Wait()
+                if self.rank == 0:
+                    rank_energy_times = self.progress_times.tolist()
+            self.progress_time = np.array([energy_time])
+            self.progress_times = np.empty(self.world_size) if self.rank == 0 else None
+            self.progress_request = self.world_comm.Igather([self.progress_time, MPI.DOUBLE],
+                                                            [self.progress_times, MPI.DOUBLE], root=0)
+            self.profiler.count('Igather', self.progress_time.nbytes)
+        else:
+            rank_energy_times = [energy_time]
+
+        if self.rank != 0:
+            return
+
+        current_time = MPI.Wtime()
+        steps_per_second = None
+        if self.progress_start_step is not None:
+            steps_per_second = (step - self.progress_start_step) / (current_time - self.progress_start_time)
+        self.progress_start_step = step
+        self.progress_start_time = current_time
+
+        self.progress_reporter.report({
+            'step': int(step), 'energy': float(self.current_energy),
+            'acceptance_rate': None if self.acceptance_rate is None else float(self.acceptance_rate),
+            'max_displacement': None if self.progress_max_displacement is None else
+            float(self.progress_max_displacement), 'steps_per_second': steps_per_second,
+            'rank_energy_time': rank_energy_times})
+
+    def stop_progress(self):
+        """
+        Complete an outstanding gather of the energy times and stop the progress reporter
+        """
 
-                if i_particle != j_particle:
+        if self.progress_request is not None:
+            self.progress_request.Wait()
+            self.progress_request = None
 
-                    j_position = coordinates[j_particle]
+        if self.progress_reporter is not None:
+            self.progress_reporter.close()
+            self.progress_reporter = None
 
-                    rij2 = self.minimum_image_distance(i_position, j_position)
+    def report_statistics(self):
+        """
+        Flush the energy history and print the final mean energy with its error (streaming case)
+        """
 
-                    if rij2 < self.simulation_cutoff2:
-                        e_pair = self.lennard_jones_potential(rij2)
-                        e_total += e_pair
+        self.report_observables()
 
-            # Sum the energy across all ranks
-            e_single = np.array([e_total])
-            e_summed = np.zeros(1)
-            self.world_comm.Allreduce([e_single, MPI.DOUBLE], [e_summed, MPI.DOUBLE], op=MPI.SUM)
+        if self.energy_statistics is None:
+            return
 
-            return e_summed[0]
+        self.energy_statistics.flush()
+        print("Mean energy:           " + str(self.energy_statistics.mean) + " +/- " +
+              str(self.energy_statistics.error))
+
+    def restart(self, checkpoint_file=None):
+        """
+        Resume the simulation from a checkpoint file (by default the checkpoint_file of this instance)
+        """
+
+        self.restart_file = checkpoint_file if checkpoint_file is not None else self.checkpoint_file
+        self.main()
+
+    def setup_simulation(self):
+        """
+        Generate the initial state replicated on all ranks or restore it from the restart file
+        Returns the coordinates, the total pair energy, the number of trials since the last tuning and the first step
+        """
 
+        if self.restart_file is not None:
+            coordinates, total_pair_energy, n_trials, step = self.load_checkpoint(self.restart_file)
+            coordinates = self.start_pool(coordinates)
+            self.initialize_observables(coordinates)
+            return coordinates, total_pair_energy, n_trials, step
+
+        self.energy_statistics = self.create_energy_statistics()
+
+        if self.use_mpi:
+            coordinates = self.generate_initial_state_parallel(method=self.build_method)
         else:
-            for j_particle in range(particle_count):
-                if i_particle != j_particle:
+            coordinates = self.start_pool(self.generate_initial_state(method=self.build_method))
 
-                    j_position = coordinates[j_particle]
+        self.neighbor_list = self.build_neighbor_list(coordinates)
+        self.initialize_particle_energies(coordinates)
+        self.initialize_observables(coordinates)
 
-                    rij2 = self.minimum_image_distance(i_position, j_position)
+        total_pair_energy = self.calculate_total_pair_energy(coordinates)
 
-                    if rij2 < self.simulation_cutoff2:
-                        e_pair = self.lennard_jones_potential(rij2)
-                        e_total += e_pair
+        return coordinates, total_pair_energy, 0, 0
 
-            return e_total
+    def start_pool(self, coordinates):
+        """
+        Move the coordinates and the stored particle energies into shared memory and start the pool of
+        n_workers processes (multiprocessing backend). Every worker handles every n_workers-th particle
+        like a rank in the MPI case, the parent process runs the Markov chain.
+        Returns the shared coordinates
+        """
 
-    def calculate_total_pair_energy(self, coordinates):
-        e_total = 0.0
-        particle_count = len(coordinates)
+        if self.backend != 'multiprocessing':
+            return coordinates
 
-        for i_particle in range(particle_count):
-            for j_particle in range(i_particle):
+        self.pool = SharedMemoryPool(self.n_workers)
+        self.shared_coordinates = self.pool.array('coordinates', coordinates.shape)
+        self.shared_coordinates[...] = coordinates
 
-                r_i = coordinates[i_particle]
-                r_j = coordinates[j_particle]
-                rij2 = self.minimum_image_distance(r_i, r_j)
-                if rij2 < self.simulation_cutoff2:
-                    e_pair = self.lennard_jones_potential(rij2)
-                    e_total += e_pair
+        particle_energies = self.pool.array('particle_energies', (len(coordinates),))
+        if self.incremental_energy:
+            if self.particle_energies is not None:
+                particle_energies[...] = self.particle_energies
+            self.particle_energies = particle_energies
+
+        parameters = dict(num_particles=self.num_particles, reduced_density=self.reduced_density,
+                          simulation_cutoff=self.simulation_cutoff, energy_engine=self.energy_engine)
+        self.pool.start(MonteCarlo.pool_initializer, (parameters,))
+
+        return self.shared_coordinates
+
+    def stop_pool(self):
+        """
+        Stop the worker pool and keep private copies of the shared arrays
+        """
+
+        if self.particle_energies is not None:
+            self.particle_energies = self.particle_energies.copy()
+        self.shared_coordinates = None
+        self.pool.close()
+        self.pool = None
+
+    @staticmethod
+    def pool_initializer(parameters):
+        """
+        Single process instance in every pool worker providing the energy kernels
+        """
+
+        return MonteCarlo(backend='serial', n_steps=0, plot=False, comm=SerialComm(), **parameters)
+
+    @staticmethod
+    def pool_pair_energies(task):
+        """
+        Partial energies of a particle placed at each of the positions with the particles of a pool worker
+        """
+
+        i_particle, positions, start, stride = task
+        monte_carlo = get_worker_context()
+        coordinates = worker_array('coordinates')
+
+        energies = np.zeros(len(positions))
+        for i_position, position in enumerate(positions):
+            _, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, position, start, stride)
+            energies[i_position] = np.sum(pair_energies)
+        return energies
 
+    @staticmethod
+    def pool_batch_energies(task):
+        """
+        Partial current and proposed energies of a batch of trial moves with the particles of a pool worker
+        The current energies are only evaluated if requested (without stored particle energies).
+        Returns the energies of every move (interleaved)
+        """
+
+        particles, proposed_positions, current, start, stride = task
+        monte_carlo = get_worker_context()
+        coordinates = worker_array('coordinates')
+
+        energies = np.zeros(2 * len(particles))
+        for i_move, i_particle in enumerate(particles):
+            if current:
+                _, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, coordinates[i_particle],
+                                                                 start, stride)
+                energies[2 * i_move] = np.sum(pair_energies)
+            _, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, proposed_positions[i_move],
+                                                             start, stride)
+            energies[2 * i_move + 1] = np.sum(pair_energies)
+        return energies
+
+    @staticmethod
+    def pool_move_particle_energies(task):
+        """
+        Update the stored energies of the particles of a pool worker for accepted moves
+        The moves (i_particle, old_position, new_position) must not interact with each other.
+        """
+
+        moves, start, stride = task
+        monte_carlo = get_worker_context()
+        coordinates = worker_array('coordinates')
+        particle_energies = worker_array('particle_energies')
+
+        for i_particle, old_position, new_position in moves:
+            neighbors, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, old_position, start,
+                                                                     stride)
+            particle_energies[neighbors] -= pair_energies
+            neighbors, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, new_position, start,
+                                                                     stride)
+            particle_energies[neighbors] += pair_energies
+
+    @staticmethod
+    def pool_initialize_particle_energies(task):
+        """
+        Store the energies of the particles of a pool worker with all other particles
+        """
+
+        start, stride = task
+        monte_carlo = get_worker_context()
+        coordinates = worker_array('coordinates')
+        particle_energies = worker_array('particle_energies')
+
+        for i_particle in range(start, len(coordinates), stride):
+            _, pair_energies = monte_carlo.get_pair_energies(coordinates, i_particle, coordinates[i_particle])
+            particle_energies[i_particle] = np.sum(pair_energies)
+
+    @staticmethod
+    def pool_total_pair_energy(task):
+        """
+        Pair energy of the particles of a pool worker with all particles of lower index
+        """
+
+        start, stride = task
+        monte_carlo = get_worker_context()
+        coordinates = worker_array('coordinates')
+
+        e_total = 0.0
+        for i_particle in range(start, len(coordinates), stride):
+            rij2 = monte_carlo.minimum_image_distances(coordinates[i_particle], coordinates[:i_particle])
+            e_total += monte_carlo.lennard_jones_sum(rij2)
         return e_total
 
-    def accept_or_reject(self, delta_e, beta):
+    def open_trajectory(self, start_step):
         """
-        Accept or reject a move based on the energy difference and system \
-        temperature.
-        This function uses a random numbers to adjust the acceptance criteria.
+        Open the trajectory writer with one frame every freq steps (if a trajectory file is given)
         """
-        # This function accepts or reject a move given the
-        # energy difference and system temperature
 
-        if delta_e < 0.0:
-            accept = True
+        if self.trajectory_file is None:
+            return None
 
-        else:
-            random_number = np.random.rand(1)
-            p_acc = np.exp(-beta * delta_e)
+        # collective writes need the current coordinates on all ranks
+        use_mpiio = self.trajectory_io == 'mpiio' and self.use_mpi and \
+            self.mpi_mode in ('shared_rng', 'batched')
 
-            if random_number < p_acc:
-                accept = True
-            else:
-                accept = False
+        return TrajectoryWriter(self.trajectory_file, self.n_steps // self.freq, self.num_particles,
+                                comm=self.world_comm, use_mpiio=use_mpiio, resume=start_step > 0)
 
-        return accept
+    def checkpoint_due(self, i_step, start_step):
+        """
+        Whether a checkpoint is written at the beginning of this step
+        """
 
-    def adjust_displacement(self, n_trials):
+        return self.checkpoint_file is not None and self.checkpoint_freq > 0 and i_step > start_step and \
+            np.mod(i_step, self.checkpoint_freq) == 0
+
+    def get_random_state(self):
         """
-        Change the acceptance criteria to get the desired rate.
-        When the acceptance rate is too high, the maximum displacement is adjusted \
-         to be higher.
-        When the acceptance rate is too low, the maximum displacement is \
-         adjusted lower.
+        State of the random stream driving the simulation
         """
-        acc_rate = float(self.n_accept) / float(n_trials)
-        if (acc_rate < 0.38):
-            self.max_displacement *= 0.8
 
-        elif (acc_rate > 0.42):
-            self.max_displacement *= 1.2
+        return self.random_stream.get_state()
 
-        n_trials = 0
-        n_accept = 0
+    def save_checkpoint(self, step, coordinates, total_pair_energy, n_trials, random_state):
+        """
+        Write the state at the beginning of step to the checkpoint file (collective in the MPI case)
+        Every rank contributes the energies of its particles, the file is written by rank 0.
+        The file is replaced atomically, so a crash while writing keeps the previous checkpoint.
+        """
 
-        return self.max_displacement, n_trials, n_accept
+        particle_energies = None
+        if self.incremental_energy:
+            particle_energies = self.particle_energies
+            if self.use_mpi:
+                # every rank only holds valid energies of its own particles, all others are masked out
+                start, stride = self.get_stride()
+                own = np.mod(np.arange(len(coordinates)), stride) == start
+                local_energies = np.where(own, self.particle_energies, 0.0)
+                particle_energies = np.zeros(len(coordinates))
+                self.world_comm.Reduce([local_energies, MPI.DOUBLE], [particle_energies, MPI.DOUBLE],
+                                       op=MPI.SUM, root=0)
+                self.profiler.count('Reduce', local_energies.nbytes)
+
+        if self.rank == 0:
+            state = {'step': step, 'coordinates': coordinates, 'neighbor_list': self.neighbor_list,
+                     'particle_energies': particle_energies, 'total_pair_energy': total_pair_energy,
+                     'n_trials': n_trials, 'n_accept': self.n_accept, 'max_displacement': self.max_displacement,
+                     'beta': self.beta, 'random_state': random_state, 'energy_statistics': self.energy_statistics,
+                     'energy_array': self.energy_array[:step] if self.energy_array is not None else None}
+
+            temporary_file = self.checkpoint_file + '.tmp'
+            with open(temporary_file, 'wb') as checkpoint:
+                pickle.dump(state, checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_file, self.checkpoint_file)
+
+    def load_checkpoint(self, checkpoint_file):
+        """
+        Restore the state written by save_checkpoint, read by rank 0 and broadcast to all ranks
+        Returns the coordinates, the total pair energy, the number of trials since the last tuning and the first step
+        """
+
+        state = None
+        if self.rank == 0:
+            with open(checkpoint_file, 'rb') as checkpoint:
+                state = pickle.load(checkpoint)
+        if self.use_mpi:
+            state = self.world_comm.bcast(state, root=0)
+
+        # the coordinates are a new array read from the file, the neighbor lists keep their own copy of the positions
+        coordinates = state['coordinates']
+        self.neighbor_list = state['neighbor_list']
+        if self.incremental_energy:
+            self.particle_energies = state['particle_energies']
+
+        step = state['step']
+        self.n_accept = state['n_accept']
+        self.max_displacement = state['max_displacement']
+        self.beta = state['beta']
+        self.reduced_temperature = 1.0 / self.beta
+        if self.energy_array is not None:
+            self.energy_array[:step] = state['energy_array']
+        self.energy_statistics = state['energy_statistics']
+        if self.energy_statistics is not None and self.rank == 0:
+            self.energy_statistics.truncate_history()
+
+        self.random_stream.set_state(state['random_state'])
+
+        return coordinates, state['total_pair_energy'], state['n_trials'], step
+
+    def report_profile(self, start_simulation_time, total_energy_time, total_decision_time):
+        """
+        Add the timings of the run to the profiler and report the statistics of all ranks (collective)
+        """
+
+        self.stop_progress()
+
+        self.profiler.add('simulation', MPI.Wtime() - start_simulation_time)
+        self.profiler.add('energy', total_energy_time)
+        self.profiler.add('decision', total_decision_time)
+        self.profiler.report("Monte Carlo profile")
+
+    def print_collectives(self):
+        """
+        Report the number of collective operations per step if requested
+        """
+
+        if self.report_collectives and self.use_mpi:
+            print("    Collectives/step:  " + str(self.n_collectives / float(max(self.n_steps, 1))))
+            if self.n_batches > 0:
+                print("    Moves/batch:       " + str(self.n_steps / float(self.n_batches)))
+
+    def exchange_state(self, step, total_energy):
+        """
+        Call the exchange callback (e.g. replica exchange) on rank 0 with the current step and energy
+        per particle. The callback may change the temperature, which is then shared with all ranks.
+        """
+
+        if self.exchange_callback is None:
+            return
+
+        if self.rank == 0:
+            self.exchange_callback(step, total_energy)
+
+        if self.use_mpi:
+            beta = np.array([self.beta])
+            self.world_comm.Bcast([beta, MPI.DOUBLE], root=0)
+            self.profiler.count('Bcast', beta.nbytes)
+            self.n_collectives += 1
+            self.beta = beta[0]
+            self.reduced_temperature = 1.0 / self.beta
+
+    def run_shared_rng(self):
+        """
+        Monte Carlo simulation without per step broadcasts
+        All ranks draw the particle index, the displacement and the acceptance random number from an
+        identically seeded random stream, so accepted moves are applied identically on every rank and
+        the coordinates never need to be broadcast. The only collective per step is a single
+        two element Allreduce combining the current and the proposed energy (see evaluate_move).
+        """
+
+        start_simulation_time = MPI.Wtime()
+        total_energy_time = 0.0
+        total_decision_time = 0.0
+
+        coordinates, total_pair_energy, n_trials, start_step = self.setup_simulation()
+        tail_correction = self.calculate_tail_correction()
+        trajectory = self.open_trajectory(start_step)
+
+        for i_step in range(start_step, self.n_steps):
+
+            if self.checkpoint_due(i_step, start_step):
+                self.save_checkpoint(i_step, coordinates, total_pair_energy, n_trials, self.get_random_state())
+
+            n_trials += 1
+
+            i_particle, unit_displacement, random_number = self.random_stream.next_move()
+            random_displacement = unit_displacement * self.max_displacement
+
+            start_energy_time = MPI.Wtime()
+            current_energy, proposed_energy, proposed_position = self.evaluate_move(coordinates, i_particle,
+                                                                                    random_displacement)
+            total_energy_time += MPI.Wtime() - start_energy_time
+
+            start_decision_time = MPI.Wtime()
+
+            delta_e = proposed_energy - current_energy
+
+            accept = self.accept_or_reject(delta_e, self.beta, random_number=random_number)
+
+            if accept:
+                total_pair_energy += delta_e
+                self.n_accept += 1
+                self.apply_move(coordinates, i_particle, coordinates[i_particle].copy(), proposed_position,
+                                proposed_energy)
+
+            total_energy = (total_pair_energy + tail_correction) / self.num_particles
+
+            if self.rank == 0:
+                self.record_energy(i_step, total_energy)
+
+            if np.mod(i_step + 1, self.freq) == 0:
+                if self.rank == 0:
+                    self.report_energy(i_step + 1, self.n_accept / float(n_trials))
+
+                # every rank tunes identically since all of them see the same acceptance history
+                if self.tune_displacement:
+                    max_displacement, n_trials, self.n_accept = self.adjust_displacement(n_trials)
+
+                if trajectory is not None:
+                    trajectory.write((i_step + 1) // self.freq - 1, coordinates)
+
+                self.sample_observables()
+                self.update_progress(i_step + 1, total_energy_time)
+                self.exchange_state(i_step + 1, self.current_energy)
+
+            total_decision_time += MPI.Wtime() - start_decision_time
+
+        if trajectory is not None:
+            trajectory.close()
+
+        if self.rank == 0:
+            self.report_statistics()
+            print("Total simulation time: " + str(MPI.Wtime() - start_simulation_time))
+            print("    Energy time:       " + str(total_energy_time))
+            print("    Decision time:     " + str(total_decision_time))
+            self.print_collectives()
+            print("-----------------------------------------------------------")
+
+        self.report_profile(start_simulation_time, total_energy_time, total_decision_time)
+
+    def run_compiled(self):
+        """
+        Serial Monte Carlo simulation with the Metropolis steps in a compiled kernel (see source.Kernels)
+        The particle indices, displacements and acceptance random numbers of all steps up to the next freq
+        or checkpoint step are drawn at once, then the kernel runs these steps without returning to Python.
+        Without Numba the same chain runs with NumPy kernels.
+        """
+
+        start_simulation_time = MPI.Wtime()
+        total_energy_time = 0.0
+        total_decision_time = 0.0
+
+        coordinates, total_pair_energy, n_trials, start_step = self.setup_simulation()
+        tail_correction = self.calculate_tail_correction()
+        trajectory = self.open_trajectory(start_step)
+        delta_energies = np.zeros(self.freq)
+
+        i_step = start_step
+        while i_step < self.n_steps:
+
+            if self.checkpoint_due(i_step, start_step):
+                self.save_checkpoint(i_step, coordinates, total_pair_energy, n_trials, self.get_random_state())
+
+            n_moves = min(self.n_steps - i_step, self.freq - np.mod(i_step, self.freq))
+            if self.checkpoint_file is not None and self.checkpoint_freq > 0:
+                n_moves = min(n_moves, self.checkpoint_freq - np.mod(i_step, self.checkpoint_freq))
+
+            particles, unit_displacements, random_numbers = self.random_stream.next_moves(n_moves)
+            random_displacements = unit_displacements * self.max_displacement
+
+            start_energy_time = MPI.Wtime()
+            n_accept = self.kernels.metropolis_chain(coordinates, particles, random_displacements, random_numbers,
+                                                     self.beta, self.box_length, self.simulation_cutoff2,
+                                                     delta_energies[:n_moves])
+            total_energy_time += MPI.Wtime() - start_energy_time
+
+            start_decision_time = MPI.Wtime()
+
+            n_trials += n_moves
+            self.n_accept += n_accept
+
+            pair_energies = total_pair_energy + np.cumsum(delta_energies[:n_moves])
+            total_pair_energy = pair_energies[-1]
+            total_energies = (pair_energies + tail_correction) / self.num_particles
+
+            if self.energy_statistics is not None:
+                for total_energy in total_energies:
+                    self.energy_statistics.add(total_energy)
+            else:
+                self.energy_array[i_step:i_step + n_moves] = total_energies
+            self.current_energy = total_energies[-1]
+
+            i_step += n_moves
+
+            if np.mod(i_step, self.freq) == 0:
+                if self.rank == 0:
+                    self.report_energy(i_step, self.n_accept / float(n_trials))
+
+                if self.tune_displacement:
+                    max_displacement, n_trials, self.n_accept = self.adjust_displacement(n_trials)
+
+                if trajectory is not None:
+                    trajectory.write(i_step // self.freq - 1, coordinates)
+
+                self.update_progress(i_step, total_energy_time)
+                self.exchange_state(i_step, self.current_energy)
+
+            total_decision_time += MPI.Wtime() - start_decision_time
+
+        if trajectory is not None:
+            trajectory.close()
+
+        if self.rank == 0:
+            self.report_statistics()
+            print("Total simulation time: " + str(MPI.Wtime() - start_simulation_time))
+            print("    Energy time:       " + str(total_energy_time))
+            print("    Decision time:     " + str(total_decision_time))
+            print("-----------------------------------------------------------")
+
+        self.report_profile(start_simulation_time, total_energy_time, total_decision_time)
+
+    def run_batched(self):
+        """
+        Monte Carlo simulation with batches of trial moves per communication round
+        As in run_shared_rng all ranks draw the moves from an identically seeded random stream. Up to
+        batch_size moves are proposed at once, a move is kept if its old and proposed positions are more
+        than the cutoff away from those of all moves kept before, so the kept moves do not interact and
+        their energy changes are independent. The partial energies of all kept moves are combined with a
+        single Allreduce, then every move is accepted or rejected in order. Batches end at freq and
+        checkpoint steps, each kept move counts as one step. For small boxes only a few particles are
+        mutually out of range, the batches are then limited by the geometry rather than by batch_size.
+        On the multiprocessing backend a batch is evaluated with a single map call of the worker pool,
+        and the accepted moves of a batch are applied with another one.
+        """
+
+        start_simulation_time = MPI.Wtime()
+        total_energy_time = 0.0
+        total_decision_time = 0.0
+
+        coordinates, total_pair_energy, n_trials, start_step = self.setup_simulation()
+        tail_correction = self.calculate_tail_correction()
+        trajectory = self.open_trajectory(start_step)
+
+        batch_size = self.get_batch_size(coordinates)
+        if self.rank == 0:
+            print("Batch size: " + str(batch_size))
+
+        i_step = start_step
+        while i_step < self.n_steps:
+
+            if self.checkpoint_due(i_step, start_step):
+                self.save_checkpoint(i_step, coordinates, total_pair_energy, n_trials, self.get_random_state())
+
+            # a batch never crosses a freq or checkpoint step
+            n_moves = min(batch_size, self.n_steps - i_step, self.freq - np.mod(i_step, self.freq))
+            if self.checkpoint_file is not None and self.checkpoint_freq > 0:
+                n_moves = min(n_moves, self.checkpoint_freq - np.mod(i_step, self.checkpoint_freq))
+
+            particles, proposed_positions, random_numbers = self.propose_batch(coordinates, n_moves)
+
+            start_energy_time = MPI.Wtime()
+            energies = self.evaluate_batch(coordinates, particles, proposed_positions)
+            total_energy_time += MPI.Wtime() - start_energy_time
+
+            start_decision_time = MPI.Wtime()
+
+            # the moves do not interact, so the accepted ones are applied together after the decisions
+            accepted_moves = []
+            for i_move, i_particle in enumerate(particles):
+                n_trials += 1
+
+                current_energy, proposed_energy = energies[2 * i_move], energies[2 * i_move + 1]
+                delta_e = proposed_energy - current_energy
+
+                accept = self.accept_or_reject(delta_e, self.beta, random_number=random_numbers[i_move])
+
+                if accept:
+                    total_pair_energy += delta_e
+                    self.n_accept += 1
+                    accepted_moves.append((i_particle, coordinates[i_particle].copy(), proposed_positions[i_move],
+                                           proposed_energy))
+
+                total_energy = (total_pair_energy + tail_correction) / self.num_particles
+
+                if self.rank == 0:
+                    self.record_energy(i_step, total_energy)
+
+                i_step += 1
+
+            self.apply_moves(coordinates, accepted_moves)
+
+            if np.mod(i_step, self.freq) == 0:
+                if self.rank == 0:
+                    self.report_energy(i_step, self.n_accept / float(n_trials))
+
+                # every rank tunes identically since all of them see the same acceptance history
+                if self.tune_displacement:
+                    max_displacement, n_trials, self.n_accept = self.adjust_displacement(n_trials)
+
+                if trajectory is not None:
+                    trajectory.write(i_step // self.freq - 1, coordinates)
+
+                self.sample_observables()
+                self.update_progress(i_step, total_energy_time)
+                self.exchange_state(i_step, self.current_energy)
+
+            total_decision_time += MPI.Wtime() - start_decision_time
+
+        if self.pool is not None:
+            coordinates = coordinates.copy()
+            self.stop_pool()
+
+        if trajectory is not None:
+            trajectory.close()
+
+        if self.rank == 0:
+            self.report_statistics()
+            print("Total simulation time: " + str(MPI.Wtime() - start_simulation_time))
+            print("    Energy time:       " + str(total_energy_time))
+            print("    Decision time:     " + str(total_decision_time))
+            self.print_collectives()
+            print("-----------------------------------------------------------")
+
+        self.report_profile(start_simulation_time, total_energy_time, total_decision_time)
+
+    def propose_batch(self, coordinates, n_moves):
+        """
+        Draw up to n_moves trial moves of mutually non-interacting particles
+        Moves of a particle already moved in the batch, or with an old or proposed position within the
+        cutoff of an old or proposed position of a kept move, are dropped (and do not count as trials).
+        Returns the particle indices, the proposed (wrapped) positions and the acceptance random numbers
+        of the kept moves
+        """
+
+        particles = []
+        random_numbers = []
+        positions = np.empty([2 * n_moves, 3])
+
+        for i_move in range(n_moves):
+            i_particle, unit_displacement, random_number = self.random_stream.next_move()
+            random_displacement = unit_displacement * self.max_displacement
+
+            proposed_position = coordinates[i_particle] + random_displacement
+            proposed_position -= self.box_length * np.round(proposed_position / self.box_length)
+
+            n_kept = len(particles)
+            if n_kept > 0:
+                if i_particle in particles:
+                    continue
+                kept_positions = positions[:2 * n_kept]
+                if np.min(self.minimum_image_distances(coordinates[i_particle], kept_positions)) < \
+                        self.simulation_cutoff2 or \
+                        np.min(self.minimum_image_distances(proposed_position, kept_positions)) < \
+                        self.simulation_cutoff2:
+                    continue
+
+            positions[2 * n_kept] = coordinates[i_particle]
+            positions[2 * n_kept + 1] = proposed_position
+            particles.append(i_particle)
+            random_numbers.append(random_number)
+
+        return particles, positions[1:2 * len(particles):2].copy(), random_numbers
+
+    def evaluate_batch(self, coordinates, particles, proposed_positions):
+        """
+        Current and proposed energies of a batch of non-interacting trial moves
+        The partial energies of all moves are combined with a single Allreduce, or with the worker pool
+        summed over the results of a single map call.
+        Returns the current and proposed energy of every move (interleaved)
+        """
+
+        energies = np.empty(2 * len(particles))
+
+        if self.pool is not None:
+            energies[:] = np.sum(self.pool.map(MonteCarlo.pool_batch_energies,
+                                               [(particles, proposed_positions, not self.incremental_energy,
+                                                 worker_start, worker_stride)
+                                                for worker_start, worker_stride in self.pool.partitions()]), axis=0)
+            if self.incremental_energy:
+                energies[0::2] = self.particle_energies[particles]
+            self.n_batches += 1
+            return energies
+
+        for i_move, i_particle in enumerate(particles):
+            energies[2 * i_move:2 * i_move + 2] = self.get_local_move_energies(coordinates, i_particle,
+                                                                               proposed_positions[i_move])
+
+        summed_energies = np.zeros_like(energies)
+        self.world_comm.Allreduce([energies, MPI.DOUBLE], [summed_energies, MPI.DOUBLE], op=MPI.SUM)
+        self.profiler.count('Allreduce', energies.nbytes)
+        self.n_collectives += 1
+        self.n_batches += 1
+
+        return summed_energies
+
+    def get_batch_size(self, coordinates, n_samples=50):
+        """
+        Number of trial moves per batch, measured if batch_size is 'auto'
+        The batch is made large enough that the latency of the Allreduce (or of a map call of the worker
+        pool) is at most batch_overhead of the time to evaluate the moves, but not larger than the number
+        of particles fitting into the box without interacting. The slowest rank determines the
+        measurements, so all ranks agree.
+        """
+
+        if self.batch_size != 'auto':
+            return self.batch_size
+
+        energies = np.zeros(2)
+        summed_energies = np.zeros(2)
+        self.world_comm.Barrier()
+        start_time = MPI.Wtime()
+        for i_sample in range(n_samples):
+            if self.pool is not None:
+                self.pool.map(MonteCarlo.pool_batch_energies,
+                              [([], [], False, worker_start, worker_stride)
+                               for worker_start, worker_stride in self.pool.partitions()])
+            else:
+                self.world_comm.Allreduce([energies, MPI.DOUBLE], [summed_energies, MPI.DOUBLE], op=MPI.SUM)
+        latency = (MPI.Wtime() - start_time) / n_samples
+
+        start_time = MPI.Wtime()
+        for i_sample in range(n_samples):
+            i_particle = i_sample % self.num_particles
+            self.get_local_move_energies(coordinates, i_particle, coordinates[i_particle])
+        evaluation_time = (MPI.Wtime() - start_time) / n_samples
+        if self.pool is not None:
+            # the workers share the evaluation of a move
+            evaluation_time /= self.pool.n_workers
+
+        times = np.array([latency, evaluation_time])
+        max_times = np.zeros(2)
+        self.world_comm.Allreduce([times, MPI.DOUBLE], [max_times, MPI.DOUBLE], op=MPI.MAX)
+        latency, evaluation_time = max_times
+
+        range_volume = 4.0 / 3.0 * np.pi * (self.simulation_cutoff + 2.0 * self.max_displacement) ** 3
+        max_batch_size = max(1, int(self.box_length ** 3 / range_volume))
+
+        return int(np.clip(np.ceil(latency / (self.batch_overhead * evaluation_time)), 1, max_batch_size))
+
+    def get_local_move_energies(self, coordinates, i_particle, proposed_position):
+        """
+        Partial current and proposed energy of a trial move of a single particle on this rank (no communication)
+        """
+
+        start, stride = self.get_stride()
+
+        if self.incremental_energy:
+            _, pair_energies = self.get_pair_energies(coordinates, i_particle, proposed_position, start, stride)
+            current_energy = self.particle_energies[i_particle] if i_particle % stride == start else 0.0
+            return np.array([current_energy, np.sum(pair_energies)])
+
+        # reference path evaluating the full (partial) particle energy twice with the selected engine
+        proposed_coordinates = coordinates.copy()
+        proposed_coordinates[i_particle] = proposed_position
+        return np.array([self.get_local_particle_energy(coordinates, i_particle),
+                         self.get_local_particle_energy(proposed_coordinates, i_particle)])
+
+    def evaluate_move(self, coordinates, i_particle, random_displacement):
+        """
+        Current and proposed energy of a trial move of a single particle
+        Only the displaced particle is wrapped back into the box and the coordinates are not copied.
+        With incremental_energy the current energy is taken from the stored particle energies, so only
+        the proposed position has to be evaluated. In the MPI case the partial energies of all ranks
+        are combined with a single two element Allreduce.
+        Returns the current energy, the proposed energy and the proposed (wrapped) position
+        """
+
+        proposed_position = coordinates[i_particle] + random_displacement
+        proposed_position -= self.box_length * np.round(proposed_position / self.box_length)
+
+        if self.pool is not None:
+            # the workers return the partial energies of their particles, summed like the Allreduce below
+            positions = [proposed_position] if self.incremental_energy else [coordinates[i_particle], proposed_position]
+            energies = np.sum(self.pool.map(MonteCarlo.pool_pair_energies,
+                                            [(i_particle, positions, worker_start, worker_stride)
+                                             for worker_start, worker_stride in self.pool.partitions()]), axis=0)
+            if self.incremental_energy:
+                energies = np.array([self.particle_energies[i_particle], energies[0]])
+        else:
+            energies = self.get_local_move_energies(coordinates, i_particle, proposed_position)
+
+        if self.use_mpi:
+            summed_energies = np.zeros(2)
+            self.world_comm.Allreduce([energies, MPI.DOUBLE], [summed_energies, MPI.DOUBLE], op=MPI.SUM)
+            self.profiler.count('Allreduce', energies.nbytes)
+            self.n_collectives += 1
+            energies = summed_energies
+
+        return energies[0], energies[1], proposed_position
+
+    def apply_moves(self, coordinates, moves):
+        """
+        Apply the accepted moves (i_particle, old_position, new_position, new_energy) of a batch of
+        non-interacting trial moves, with the worker pool the stored particle energies of all moves are
+        updated with a single map call
+        """
+
+        if self.pool is not None and self.incremental_energy and len(moves) > 0:
+            self.pool.map(MonteCarlo.pool_move_particle_energies,
+                          [([move[:3] for move in moves], worker_start, worker_stride)
+                           for worker_start, worker_stride in self.pool.partitions()])
+
+        for i_particle, old_position, new_position, new_energy in moves:
+            self.apply_move(coordinates, i_particle, old_position, new_position, new_energy, workers_updated=True)
+
+    def apply_move(self, coordinates, i_particle, old_position, new_position, new_energy, workers_updated=False):
+        """
+        Apply an accepted move to the coordinates, the stored particle energies and the neighbor search
+        With workers_updated the worker pool has already updated the stored particle energies.
+        """
+
+        start, stride = self.get_stride()
+        observables_moved = False
+
+        if self.incremental_energy:
+            if self.pool is not None:
+                if not workers_updated:
+                    self.pool.map(MonteCarlo.pool_move_particle_energies,
+                                  [([(i_particle, old_position, new_position)], worker_start, worker_stride)
+                                   for worker_start, worker_stride in self.pool.partitions()])
+            elif self.observables is not None and self.energy_engine == 'vectorized':
+                # the distances of the move update both the particle energies and the observables
+                old_neighbors, old_rij2 = self.get_pair_distances(coordinates, i_particle, old_position, start,
+                                                                  stride)
+                new_neighbors, new_rij2 = self.get_pair_distances(coordinates, i_particle, new_position, start,
+                                                                  stride)
+                self.particle_energies[old_neighbors] -= self.lennard_jones_pairs(old_rij2)
+                self.particle_energies[new_neighbors] += self.lennard_jones_pairs(new_rij2)
+                self.observables.move(old_rij2, new_rij2)
+                observables_moved = True
+            else:
+                neighbors, pair_energies = self.get_pair_energies(coordinates, i_particle, old_position, start,
+                                                                  stride)
+                self.particle_energies[neighbors] -= pair_energies
+                neighbors, pair_energies = self.get_pair_energies(coordinates, i_particle, new_position, start,
+                                                                  stride)
+                self.particle_energies[neighbors] += pair_energies
+            self.particle_energies[i_particle] = new_energy
+
+        if self.observables is not None and not observables_moved:
+            self.observables.move(self.get_pair_distances(coordinates, i_particle, old_position, start, stride)[1],
+                                  self.get_pair_distances(coordinates, i_particle, new_position, start, stride)[1])
+
+        coordinates[i_particle] = new_position
+
+        if self.neighbor_list is not None:
+            self.neighbor_list.update(i_particle, new_position)
+
+    def initialize_particle_energies(self, coordinates):
+        """
+        Store the energy of every particle with all other particles
+        In the MPI case every rank only stores the energies of the particles it handles (every world_size-th)
+        """
+
+        if not self.incremental_energy:
+            return
+
+        if self.pool is not None:
+            self.pool.map(MonteCarlo.pool_initialize_particle_energies, self.pool.partitions())
+            return
+
+        start, stride = self.get_stride()
+        self.particle_energies = np.zeros(len(coordinates))
+
+        for i_particle in range(start, len(coordinates), stride):
+            _, pair_energies = self.get_pair_energies(coordinates, i_particle, coordinates[i_particle])
+            self.particle_energies[i_particle] = np.sum(pair_energies)
+
+    def run_domain_decomposition(self):
+        """
+        Monte Carlo simulation on a spatial (slab) domain decomposition
+        Every rank only stores its own particles plus the halo and performs trial moves on its own
+        particles within the active half of its slab, moves leaving the active half are rejected.
+        The halves are swept alternately every domain_phase_steps steps. After every sweep of both halves
+        the slab boundaries are shifted by a random offset (drawn identically on all ranks) and the
+        particles migrate to their new owners, so that the particles are not confined to their initial
+        slab and the chain stays ergodic. Every phase switch is followed by a halo exchange.
+        Energies and acceptance statistics are only reduced across ranks every freq steps.
+        """
+
+        start_simulation_time = MPI.Wtime()
+        total_energy_time = 0.0
+        total_decision_time = 0.0
+        total_halo_time = 0.0
+
+        decomposition = DomainDecomposition(self.world_comm, self.box_length, self.simulation_cutoff,
+                                            profiler=self.profiler)
+        self.energy_statistics = self.create_energy_statistics()
+
+        if self.rank == 0:
+            coordinates = decomposition.wrap(self.generate_initial_state(method=self.build_method))
+        else:
+            coordinates = None
+        local = decomposition.distribute(coordinates)
+        n_local = len(local)
+
+        halo = decomposition.exchange_halo(local)
+
+        # own pairs are counted once, pairs with halo particles are shared between two ranks
+        local_pair_energy = 0.0
+        for i_particle in range(n_local):
+            local_pair_energy += self.lennard_jones_sum(
+                self.minimum_image_distances(local[i_particle], local[i_particle + 1:]))
+            local_pair_energy += 0.5 * self.lennard_jones_sum(
+                self.minimum_image_distances(local[i_particle], halo))
+
+        pair_energy = np.array([local_pair_energy])
+        total_pair_energy = np.zeros(1)
+        self.world_comm.Allreduce([pair_energy, MPI.DOUBLE], [total_pair_energy, MPI.DOUBLE], op=MPI.SUM)
+        self.profiler.count('Allreduce', pair_energy.nbytes)
+        total_pair_energy = total_pair_energy[0]
+        tail_correction = self.calculate_tail_correction()
+
+        # the local particles are a view into the environment, so accepted moves are seen by the energy evaluation
+        environment = np.concatenate([local, halo])
+        local = environment[:n_local]
+
+        phase = 0
+        active = decomposition.active_particles(local, phase)
+        local_delta_energy = 0.0
+        n_trials = 0
+
+        for i_step in range(self.n_steps):
+
+            if i_step > 0 and np.mod(i_step, self.domain_phase_steps) == 0:
+                start_halo_time = MPI.Wtime()
+                phase = 1 - phase
+                if phase == 0:
+                    decomposition.shift(decomposition.offset + self.domain_random.random() * decomposition.slab_width)
+                    local = decomposition.migrate(local)
+                    n_local = len(local)
+                halo = decomposition.exchange_halo(local)
+                environment = np.concatenate([local, halo])
+                local = environment[:n_local]
+                active = decomposition.active_particles(local, phase)
+                total_halo_time += MPI.Wtime() - start_halo_time
+
+            if len(active) > 0:
+                n_trials += 1
+
+                i_particle = active[self.rank_random.integers(len(active))]
+                random_displacement = (2.0 * self.rank_random.random(3) - 1.0) * self.max_displacement
+                proposed_position = decomposition.wrap(local[i_particle] + random_displacement)
+
+                if decomposition.in_active_region(proposed_position, phase):
+                    start_energy_time = MPI.Wtime()
+                    current_energy = self.get_environment_energy(environment, i_particle, local[i_particle])
+                    proposed_energy = self.get_environment_energy(environment, i_particle, proposed_position)
+                    total_energy_time += MPI.Wtime() - start_energy_time
+
+                    start_decision_time = MPI.Wtime()
+
+                    delta_e = proposed_energy - current_energy
+
+                    accept = self.accept_or_reject(delta_e, self.beta, random_state=self.rank_random)
+
+                    if accept:
+                        local_delta_energy += delta_e
+                        self.n_accept += 1
+                        local[i_particle] = proposed_position
+
+                    total_decision_time += MPI.Wtime() - start_decision_time
+
+            if np.mod(i_step + 1, self.freq) == 0:
+                statistics = np.array([local_delta_energy, n_trials, self.n_accept], dtype=float)
+                summed_statistics = np.zeros(3)
+                self.world_comm.Allreduce([statistics, MPI.DOUBLE], [summed_statistics, MPI.DOUBLE], op=MPI.SUM)
+                self.profiler.count('Allreduce', statistics.nbytes)
+                self.n_collectives += 1
+
+                total_pair_energy += summed_statistics[0]
+                local_delta_energy = 0.0
+
+                total_energy = (total_pair_energy + tail_correction) / self.num_particles
+
+                if self.rank == 0:
+                    self.record_energy(i_step, total_energy)
+                    self.report_energy(i_step + 1, summed_statistics[2] / max(summed_statistics[1], 1.0))
+
+                # all ranks tune with the global acceptance rate and therefore stay consistent
+                if self.tune_displacement and summed_statistics[1] > 0:
+                    self.n_accept = int(summed_statistics[2])
+                    max_displacement, n_trials, self.n_accept = self.adjust_displacement(int(summed_statistics[1]))
+
+                self.update_progress(i_step + 1, total_energy_time)
+                self.exchange_state(i_step + 1, self.current_energy)
+
+        if self.rank == 0:
+            self.report_statistics()
+            print("Total simulation time: " + str(MPI.Wtime() - start_simulation_time))
+            print("    Energy time:       " + str(total_energy_time))
+            print("    Decision time:     " + str(total_decision_time))
+            print("    Halo time:         " + str(total_halo_time))
+            self.print_collectives()
+            print("-----------------------------------------------------------")
+
+        self.profiler.add('halo', total_halo_time)
+        self.report_profile(start_simulation_time, total_energy_time, total_decision_time)
+
+    def get_environment_energy(self, environment, i_particle, position):
+        """
+        Energy of a particle at the given position with all other particles of the environment
+        """
+
+        rij2 = self.minimum_image_distances(position, environment)
+        rij2[i_particle] = np.inf
+        return self.lennard_jones_sum(rij2)
+
+    def generate_initial_state(self, method='random', start=0, end=None):
+        """
+        Function generates initial coordinates for a LJ fluid simulation
+        This function can generate from a random configuration, a simple cubic ('sc') or fcc lattice
+        or read them from the initial file ('file'), for the particles start <= i < end only.
+        The random configuration is drawn from the initial seed, skipping the 3 * start numbers of
+        the particles before start, so every slice is the same for any number of ranks.
+        """
+
+        if end is None:
+            end = self.num_particles
+
+        if method == 'random':
+
+            bit_generator = np.random.PCG64(self.initial_seed)
+            bit_generator.advance(3 * start)
+            coordinates = (0.5 - np.random.Generator(bit_generator).random((end - start, 3))) * self.box_length
+
+        elif method in ('sc', 'fcc'):
+            coordinates = self.build_lattice(method, start, end)
+
+        elif method == 'file':
+            coordinates = self.load_initial_state(start, end)
+            coordinates -= self.box_length * np.round(coordinates / self.box_length)
+
+        else:
+            raise ValueError("Unknown build method: " + str(method))
+
+        return coordinates
+
+    def build_lattice(self, lattice, start=0, end=None):
+        """
+        Sites start <= i < end of a simple cubic or fcc lattice filling the box
+        The smallest lattice with at least num_particles sites is used, if it has more sites than
+        particles the occupied sites are spread evenly over the lattice. Each site only depends on
+        its index, so every rank can build its own slice.
+        """
+
+        if end is None:
+            end = self.num_particles
+
+        if lattice == 'fcc':
+            basis = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]])
+        else:
+            basis = np.zeros([1, 3])
+
+        n_cells = int(np.ceil(np.cbrt(self.num_particles / len(basis)) - 1e-9))
+        n_sites = len(basis) * n_cells ** 3
+        cell_length = self.box_length / n_cells
+
+        sites = np.arange(start, end) * n_sites // self.num_particles
+        cells = sites // len(basis)
+        cell_indices = np.column_stack([cells // n_cells ** 2, (cells // n_cells) % n_cells, cells % n_cells])
+
+        # the lattice is shifted by a quarter cell so that no particle sits on the box boundary
+        return (cell_indices + basis[sites % len(basis)] + 0.25) * cell_length - 0.5 * self.box_length
+
+    def load_initial_state(self, start=0, end=None):
+        """
+        Read the coordinates of the particles start <= i < end from the initial file
+        XYZ files (number of particles, comment line, one 'element x y z' line per particle) are read
+        line by line, .npy files are memory mapped, so only the requested slice is read.
+        """
+
+        if end is None:
+            end = self.num_particles
+
+        if self.initial_file.endswith('.npy'):
+            positions = np.load(self.initial_file, mmap_mode='r')
+            n_particles = len(positions)
+        else:
+            with open(self.initial_file) as initial_file:
+                n_particles = int(initial_file.readline().split()[0])
+
+        if n_particles != self.num_particles:
+            raise ValueError("Initial file " + str(self.initial_file) + " contains " + str(n_particles) +
+                             " particles, expected " + str(self.num_particles))
+
+        if self.initial_file.endswith('.npy'):
+            return np.array(positions[start:end], dtype=np.float64)
+
+        return np.loadtxt(self.initial_file, skiprows=2 + start, max_rows=end - start, usecols=(1, 2, 3),
+                          ndmin=2)
+
+    def generate_initial_state_parallel(self, method):
+        """
+        Every rank builds the coordinates of a contiguous block of particles, the blocks are assembled
+        on all ranks with a single Allgatherv (collective)
+        """
+
+        # determine the workload of each rank
+        partition = Partition(self.num_particles, self.world_size)
+        my_start, my_end = partition.block(self.rank)
+
+        local = np.ascontiguousarray(self.generate_initial_state(method=method, start=my_start, end=my_end))
+
+        counts, displacements = partition.buffer_counts(3)
+        coordinates = np.empty([self.num_particles, 3])
+        self.world_comm.Allgatherv([local, MPI.DOUBLE], [coordinates, counts, displacements, MPI.DOUBLE])
+        self.profiler.count('Allgatherv', local.nbytes)
+        self.n_collectives += 1
+
+        return coordinates
+
+
+    def lennard_jones_potential(self, rij2):
+        """
+        Function evaluates the unitless LJ potential given a squared distance
+        Parameters
+        """
+        # This function computes the LJ energy between two particles
+
+        sig_by_r6 = np.power(1 / rij2, 3)
+        sig_by_r12 = np.power(sig_by_r6, 2)
+        return 4.0 * (sig_by_r12 - sig_by_r6)
+
+    def calculate_tail_correction(self):
+        """
+        This function computes the standard tail energy correction for the LJ potential
+        Parameters
+        """
+
+        volume = np.power(self.box_length, 3)
+        sig_by_cutoff3 = np.power(1.0 / self.simulation_cutoff, 3)
+        sig_by_cutoff9 = np.power(sig_by_cutoff3, 3)
+        e_correction = sig_by_cutoff9 - 3.0 * sig_by_cutoff3
+
+        e_correction *= 8.0 / 9.0 * np.pi * self.num_particles / volume * self.num_particles
+
+        return e_correction
+
+    def minimum_image_distance(self, r_i, r_j):
+        # This function computes the minimum image distance between two particles
+
+        rij = r_i - r_j
+        rij = rij - self.box_length * np.round(rij / self.box_length)
+        rij2 = np.dot(rij, rij)
+        return rij2
+
+    def build_neighbor_list(self, coordinates):
+        """
+        Build the neighbor search structure selected by neighbor_method (if any)
+        """
+
+        if self.neighbor_method == 'cell':
+            return CellList(self.box_length, self.simulation_cutoff, coordinates)
+        elif self.neighbor_method == 'verlet':
+            return VerletList(self.box_length, self.simulation_cutoff, coordinates, skin=self.verlet_skin)
+        return None
+
+    def get_thread_count(self, n_threads):
+        """
+        Number of threads per rank, 'auto' shares the cores of a node among the ranks running on it
+        """
+
+        if n_threads != 'auto':
+            if n_threads < 1:
+                raise ValueError("Unknown number of threads: " + str(n_threads))
+            return n_threads
+
+        ranks_per_node = 1
+        if self.use_mpi:
+            node_comm = self.world_comm.Split_type(MPI.COMM_TYPE_SHARED)
+            ranks_per_node = node_comm.Get_size()
+            node_comm.Free()
+
+        return max(1, os.cpu_count() // ranks_per_node)
+
+    def get_thread_chunks(self, n):
+        """
+        Contiguous chunks [start, end) of n elements for the threads, at least thread_chunk_size
+        elements each, so small arrays are not split
+        """
+
+        n_chunks = max(1, min(self.n_threads, n // self.thread_chunk_size))
+        bounds = np.linspace(0, n, n_chunks + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def get_stride(self):
+        """
+        First particle and stride of the particles handled by this rank
+        """
+
+        if self.use_mpi:
+            return self.partition.start_stride(self.rank)
+        return 0, 1
+
+    def minimum_image_distances(self, r_i, positions):
+        """
+        Vectorized minimum image distance between one particle and an array of particles
+        Returns the squared distances
+        """
+
+        rij = positions - r_i
+        rij -= self.box_length * np.round(rij / self.box_length)
+        return np.einsum('ij,ij->i', rij, rij)
+
+    def lennard_jones_sum(self, rij2):
+        """
+        Vectorized LJ energy summed over all squared distances within the cutoff
+        """
+
+        rij2 = rij2[rij2 < self.simulation_cutoff2]
+        sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+        return np.sum(4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6))
+
+    def lennard_jones_pairs(self, rij2):
+        """
+        Vectorized LJ energies of all squared distances, zero beyond the cutoff
+        """
+
+        sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+        pair_energies = 4.0 * (sig_by_r6 * sig_by_r6 - sig_by_r6)
+        pair_energies[rij2 >= self.simulation_cutoff2] = 0.0
+        return pair_energies
+
+    def get_partners(self, coordinates, i_particle, position, start=0, stride=1):
+        """
+        Indices j of the particles interacting with particle i_particle placed at position,
+        restricted to the particles j handled by this rank (j % stride == start)
+        """
+
+        if self.neighbor_list is not None:
+            neighbors = self.neighbor_list.neighbors(i_particle, position)
+            neighbors = neighbors[neighbors != i_particle]
+            if stride > 1:
+                neighbors = neighbors[neighbors % stride == start]
+        else:
+            neighbors = np.arange(start, len(coordinates), stride)
+            neighbors = neighbors[neighbors != i_particle]
+
+        return neighbors
+
+    def get_pair_distances(self, coordinates, i_particle, position, start=0, stride=1):
+        """
+        Squared distances of particle i_particle placed at position to the particles j of this rank
+        Returns the indices j and the corresponding squared distances
+        """
+
+        neighbors = self.get_partners(coordinates, i_particle, position, start, stride)
+        return neighbors, self.minimum_image_distances(position, coordinates[neighbors])
+
+    def get_pair_energies(self, coordinates, i_particle, position, start=0, stride=1):
+        """
+        Pair energies of particle i_particle placed at position with every other particle j,
+        restricted to the particles j handled by this rank (j % stride == start)
+        The pair energies are evaluated with the selected energy engine, as the particle energies.
+        Returns the indices j and the corresponding pair energies
+        """
+
+        neighbors = self.get_partners(coordinates, i_particle, position, start, stride)
+
+        if self.energy_engine == 'loop':
+            return neighbors, self.get_pair_energies_loop(coordinates, neighbors, position)
+
+        if self.thread_pool is not None and len(neighbors) >= 2 * self.thread_chunk_size:
+            return neighbors, self.get_pair_energies_threaded(position, coordinates[neighbors])
+
+        if self.energy_engine == 'compiled':
+            energies = np.empty(len(neighbors))
+            self.kernels.pair_energies(coordinates[neighbors], position, self.box_length, self.simulation_cutoff2,
+                                       energies)
+            return neighbors, energies
+
+        rij2 = self.minimum_image_distances(position, coordinates[neighbors])
+        return neighbors, self.lennard_jones_pairs(rij2)
+
+    def get_pair_energies_loop(self, coordinates, neighbors, position):
+        """
+        Reference implementation of the pair energies looping over every partner
+        """
+
+        energies = np.zeros(len(neighbors))
+
+        for i_neighbor, j_particle in enumerate(neighbors):
+
+            rij2 = self.minimum_image_distance(position, coordinates[j_particle])
+
+            if rij2 < self.simulation_cutoff2:
+                energies[i_neighbor] = self.lennard_jones_potential(rij2)
+
+        return energies
+
+    def get_pair_energies_threaded(self, position, positions):
+        """
+        Pair energies of a particle at position with all positions, computed in chunks by the threads
+        of this rank (the NumPy and the compiled kernels release the GIL on large arrays)
+        """
+
+        energies = np.empty(len(positions))
+
+        def evaluate_chunk(chunk):
+            start, end = chunk
+            if self.energy_engine == 'compiled':
+                self.kernels.pair_energies(positions[start:end], position, self.box_length,
+                                           self.simulation_cutoff2, energies[start:end])
+            else:
+                rij2 = self.minimum_image_distances(position, positions[start:end])
+                energies[start:end] = self.lennard_jones_pairs(rij2)
+
+        list(self.thread_pool.map(evaluate_chunk, self.get_thread_chunks(len(positions))))
+        return energies
+
+    def get_particle_energy(self, coordinates, i_particle):
+        """
+        This function computes the energy of a particle with all other particles
+        using the selected energy engine. In the MPI case each rank handles every
+        world_size-th particle and the partial energies are summed across all ranks.
+        """
+
+        e_total = self.get_local_particle_energy(coordinates, i_particle)
+
+        if self.use_mpi:
+            # Sum the energy across all ranks
+            e_single = np.array([e_total])
+            e_summed = np.zeros(1)
+            self.world_comm.Allreduce([e_single, MPI.DOUBLE], [e_summed, MPI.DOUBLE], op=MPI.SUM)
+            self.profiler.count('Allreduce', e_single.nbytes)
+            self.n_collectives += 1
+
+            return e_summed[0]
+
+        return e_total
+
+    def get_local_particle_energy(self, coordinates, i_particle):
+        """
+        Partial energy of a particle with the particles handled by this rank (no communication)
+        """
+
+        start, stride = self.get_stride()
+
+        if self.thread_pool is not None and self.neighbor_list is None and self.energy_engine != 'loop' and \
+                len(coordinates) >= 2 * self.thread_chunk_size * stride:
+            return self.get_local_particle_energy_threaded(coordinates, i_particle, start, stride)
+
+        if self.neighbor_list is not None:
+            e_total = self.get_particle_energy_neighbors(coordinates, i_particle, start, stride)
+        elif self.energy_engine == 'compiled':
+            e_total = self.kernels.particle_energy(coordinates, i_particle, coordinates[i_particle],
+                                                   self.box_length, self.simulation_cutoff2, start, stride)
+        elif self.energy_engine == 'vectorized':
+            e_total = self.get_particle_energy_vectorized(coordinates, i_particle, start, stride)
+        else:
+            e_total = self.get_particle_energy_loop(coordinates, i_particle, start, stride)
+
+        return e_total
+
+    def get_local_particle_energy_threaded(self, coordinates, i_particle, start, stride):
+        """
+        Partial energy of a particle with the particles of this rank, which are split once more among
+        the threads of the rank: thread t handles the particles start + t * stride, every stride * n_threads
+        """
+
+        n_threads = len(self.get_thread_chunks(len(range(start, len(coordinates), stride))))
+
+        def evaluate_partition(thread):
+            if self.energy_engine == 'compiled':
+                return self.kernels.particle_energy(coordinates, i_particle, coordinates[i_particle],
+                                                    self.box_length, self.simulation_cutoff2,
+                                                    start + thread * stride, stride * n_threads)
+            return self.get_particle_energy_vectorized(coordinates, i_particle, start + thread * stride,
+                                                       stride * n_threads)
+
+        e_total = 0.0
+        for e_partition in self.thread_pool.map(evaluate_partition, range(n_threads)):
+            e_total += e_partition
+        return e_total
+
+    def get_particle_energy_loop(self, coordinates, i_particle, start=0, stride=1):
+        """
+        Reference implementation of the particle energy looping over every particle
+        """
+
+        e_total = 0.0
+
+        i_position = coordinates[i_particle]
+
+        particle_count = len(coordinates)
+
+        for j_particle in range(start, particle_count, stride):
+
+            if i_particle != j_particle:
+
+                j_position = coordinates[j_particle]
+
+                rij2 = self.minimum_image_distance(i_position, j_position)
+
+                if rij2 < self.simulation_cutoff2:
+                    e_pair = self.lennard_jones_potential(rij2)
+                    e_total += e_pair
+
+        return e_total
+
+    def get_particle_energy_vectorized(self, coordinates, i_particle, start=0, stride=1):
+        """
+        Particle energy computed with array operations over all (strided) particles
+        """
+
+        positions = coordinates[start::stride]
+        rij2 = self.minimum_image_distances(coordinates[i_particle], positions)
+
+        # exclude the self interaction if the particle is part of the slice
+        if i_particle >= start and (i_particle - start) % stride == 0:
+            rij2 = np.delete(rij2, (i_particle - start) // stride)
+
+        return self.lennard_jones_sum(rij2)
+
+    def get_particle_energy_neighbors(self, coordinates, i_particle, start=0, stride=1):
+        """
+        Particle energy restricted to the candidates of the neighbor search structure
+        """
+
+        position = coordinates[i_particle]
+        neighbors = self.neighbor_list.neighbors(i_particle, position)
+        # the particles are split by index like in get_partners, independent of the order of the neighbors
+        neighbors = neighbors[(neighbors != i_particle) & (neighbors % stride == start)]
+
+        rij2 = self.minimum_image_distances(position, coordinates[neighbors])
+        return self.lennard_jones_sum(rij2)
+
+    def calculate_total_pair_energy(self, coordinates):
+        """
+        Total pair energy of the system using the selected energy engine
+        """
+
+        if self.pool is not None and coordinates is self.shared_coordinates:
+            return float(np.sum(self.pool.map(MonteCarlo.pool_total_pair_energy, self.pool.partitions())))
+
+        if self.neighbor_list is not None:
+            e_total = 0.0
+            for i_particle in range(len(coordinates)):
+                e_total += self.get_particle_energy_neighbors(coordinates, i_particle)
+            return 0.5 * e_total
+
+        if self.energy_engine == 'compiled':
+            return self.kernels.total_pair_energy(coordinates, self.box_length, self.simulation_cutoff2)
+        if self.energy_engine == 'vectorized':
+            return self.calculate_total_pair_energy_vectorized(coordinates)
+        return self.calculate_total_pair_energy_loop(coordinates)
+
+    def calculate_total_pair_energy_loop(self, coordinates):
+        """
+        Reference implementation of the total pair energy as double loop
+        """
+
+        e_total = 0.0
+        particle_count = len(coordinates)
+
+        for i_particle in range(particle_count):
+            for j_particle in range(i_particle):
+
+                r_i = coordinates[i_particle]
+                r_j = coordinates[j_particle]
+                rij2 = self.minimum_image_distance(r_i, r_j)
+                if rij2 < self.simulation_cutoff2:
+                    e_pair = self.lennard_jones_potential(rij2)
+                    e_total += e_pair
+
+        return e_total
+
+    def calculate_total_pair_energy_vectorized(self, coordinates):
+        """
+        Total pair energy computed row by row with array operations,
+        keeping the memory usage linear in the number of particles
+        """
+
+        e_total = 0.0
+        particle_count = len(coordinates)
+
+        for i_particle in range(1, particle_count):
+            rij2 = self.minimum_image_distances(coordinates[i_particle], coordinates[:i_particle])
+            e_total += self.lennard_jones_sum(rij2)
+
+        return e_total
+
+    def compare_energy_engines(self, coordinates, i_particle=0):
+        """
+        Compare the vectorized energy engine against the loop reference implementation
+        Returns the absolute deviations of the particle energy and the total pair energy
+        """
+
+        particle_deviation = abs(self.get_particle_energy_vectorized(coordinates, i_particle) -
+                                 self.get_particle_energy_loop(coordinates, i_particle))
+        total_deviation = abs(self.calculate_total_pair_energy_vectorized(coordinates) -
+                              self.calculate_total_pair_energy_loop(coordinates))
+
+        return particle_deviation, total_deviation
+
+    def compare_neighbor_energies(self, coordinates):
+        """
+        Compare the particle energies from the neighbor search structure against the brute force path
+        Returns the maximum absolute deviation over all particles
+        """
+
+        if self.neighbor_method is None:
+            raise ValueError("No neighbor method selected")
+        if self.neighbor_list is None:
+            self.neighbor_list = self.build_neighbor_list(coordinates)
+
+        max_deviation = 0.0
+        for i_particle in range(len(coordinates)):
+            deviation = abs(self.get_particle_energy_neighbors(coordinates, i_particle) -
+                            self.get_particle_energy_vectorized(coordinates, i_particle))
+            max_deviation = max(max_deviation, deviation)
+
+        return max_deviation
+
+    def accept_or_reject(self, delta_e, beta, random_state=None, random_number=None):
+        """
+        Accept or reject a move based on the energy difference and system \
+        temperature.
+        This function uses a random numbers to adjust the acceptance criteria.
+        The random number can be given (pre-drawn), otherwise it is drawn from random_state (numpy
+        Generator) or, if neither is given, from the global random state.
+        """
+        # This function accepts or reject a move given the
+        # energy difference and system temperature
+
+        if delta_e < 0.0:
+            accept = True
+
+        else:
+            if random_number is None and random_state is None:
+                random_number = np.random.rand(1)
+            elif random_number is None:
+                random_number = random_state.random()
+            p_acc = np.exp(-beta * delta_e)
+
+            if random_number < p_acc:
+                accept = True
+            else:
+                accept = False
+
+        return accept
+
+    def adjust_displacement(self, n_trials):
+        """
+        Change the acceptance criteria to get the desired rate.
+        When the acceptance rate is too high, the maximum displacement is adjusted \
+         to be higher.
+        When the acceptance rate is too low, the maximum displacement is \
+         adjusted lower.
+        """
+        acc_rate = float(self.n_accept) / float(n_trials)
+        if (acc_rate < 0.38):
+            self.max_displacement *= 0.8
+
+        elif (acc_rate > 0.42):
+            self.max_displacement *= 1.2
+
+        n_trials = 0
+        n_accept = 0
+
+        return self.max_displacement, n_trials, n_accept
+
+    def compare_compiled_kernels(self, coordinates, i_particle=0):
+        """
+        Compare the compiled (or NumPy fallback) kernels against the vectorized energy engine
+        Returns the absolute deviations of the particle energy and the total pair energy
+        """
+
+        kernels = load_kernels()
+        particle_deviation = abs(kernels.particle_energy(coordinates, i_particle, coordinates[i_particle],
+                                                         self.box_length, self.simulation_cutoff2, 0, 1) -
+                                 self.get_particle_energy_vectorized(coordinates, i_particle))
+        total_deviation = abs(kernels.total_pair_energy(coordinates, self.box_length, self.simulation_cutoff2) -
+                              self.calculate_total_pair_energy_vectorized(coordinates))
+
+        return particle_deviation, total_deviation
@@ -0,0 +1,182 @@
+import numpy as np
+
+
+class CellList:
+
+    def __init__(self, box_length, cutoff, coordinates):
+        """
+        Linked cell structure for a periodic cubic box
+        The box is divided into cells with an edge length of at least the cutoff,
+        so that all particles within the cutoff are found in the 27 surrounding cells
+        """
+
+        self.box_length = box_length
+        self.cutoff = cutoff
+        self.n_cells = max(1, int(np.floor(box_length / cutoff)))
+
+        # precompute the (unique) neighboring cells of every cell
+        offsets = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+        self.cell_neighbors = []
+        for cell in range(self.n_cells ** 3):
+            neighbor_cells = (self.cell_to_index(cell) + offsets) % self.n_cells
+            neighbor_cells = np.unique(self.index_to_cell(neighbor_cells))
+            self.cell_neighbors.append(neighbor_cells)
+
+        self.build(coordinates)
+
+    def cell_to_index(self, cell):
+        """
+        Convert a flat cell number into a three dimensional cell index
+        """
+
+        return np.array([cell // (self.n_cells * self.n_cells), (cell // self.n_cells) % self.n_cells,
+                         cell % self.n_cells])
+
+    def index_to_cell(self, index):
+        """
+        Convert (an array of) three dimensional cell indices into flat cell numbers
+        """
+
+        index = np.atleast_2d(index)
+        return (index[:, 0] * self.n_cells + index[:, 1]) * self.n_cells + index[:, 2]
+
+    def get_cell(self, position):
+        """
+        Flat cell number of a position, wrapped into the periodic box
+        """
+
+        fraction = np.mod(position / self.box_length + 0.5, 1.0)
+        index = np.minimum((fraction * self.n_cells).astype(int), self.n_cells - 1)
+        return int(self.index_to_cell(index)[0])
+
+    def build(self, coordinates):
+        """
+        Assign all particles to their cells
+        """
+
+        self.members = [[] for _ in range(self.n_cells ** 3)]
+        self.particle_cells = np.empty(len(coordinates), dtype=int)
+
+        for i_particle, position in enumerate(coordinates):
+            cell = self.get_cell(position)
+            self.particle_cells[i_particle] = cell
+            self.members[cell].append(i_particle)
+
+    def update(self, i_particle, position):
+        """
+        Move a single particle to its new cell after an accepted move
+        """
+
+        cell = self.get_cell(position)
+        old_cell = self.particle_cells[i_particle]
+
+        if cell != old_cell:
+            self.members[old_cell].remove(i_particle)
+            self.members[cell].append(i_particle)
+            self.particle_cells[i_particle] = cell
+
+    def neighbors(self, i_particle, position):
+        """
+        Indices of all particles in the cells surrounding the position (including i_particle itself)
+        """
+
+        neighbor_cells = self.cell_neighbors[self.get_cell(position)]
+        candidates = []
+        for cell in neighbor_cells:
+            candidates.extend(self.members[cell])
+
+        return np.array(candidates, dtype=int)
+
+
+class VerletList:
+
+    def __init__(self, box_length, cutoff, coordinates, skin=0.3):
+        """
+        Verlet neighbor list with a skin distance on top of a cell list
+        The pairs within cutoff + skin of each other at their reference positions are listed. As soon as
+        an accepted move displaces a particle by more than half the skin from its reference position,
+        only the list of this particle is rebuilt at its new position and the particle is inserted into
+        or removed from the lists of its old and new neighbors.
+        """
+
+        self.box_length = box_length
+        self.cutoff = cutoff
+        self.skin = skin
+        self.list_cutoff2 = np.power(cutoff + skin, 2)
+        self.half_skin2 = np.power(0.5 * skin, 2)
+        self.n_builds = 0
+        self.n_updates = 0
+
+        self.cell_list = CellList(box_length, cutoff + skin, coordinates)
+        self.build(coordinates)
+
+    def displacement2(self, position, reference):
+        """
+        Squared minimum image displacement of a particle relative to its reference position
+        """
+
+        delta = position - reference
+        delta -= self.box_length * np.round(delta / self.box_length)
+        return np.dot(delta, delta)
+
+    def build(self, coordinates):
+        """
+        Build the neighbor lists of all particles
+        """
+
+        self.cell_list.build(coordinates)
+        self.reference_positions = coordinates.copy()
+        self.lists = []
+
+        for i_particle, position in enumerate(coordinates):
+            candidates = self.cell_list.neighbors(i_particle, position)
+            rij = coordinates[candidates] - position
+            rij -= self.box_length * np.round(rij / self.box_length)
+            rij2 = np.einsum('ij,ij->i', rij, rij)
+            self.lists.append(candidates[(rij2 < self.list_cutoff2) & (candidates != i_particle)])
+
+        self.n_builds += 1
+
+    def update(self, i_particle, position):
+        """
+        Register an accepted move and rebuild the lists if the particle left its skin
+        """
+
+        self.cell_list.update(i_particle, position)
+
+        if self.displacement2(position, self.reference_positions[i_particle]) > self.half_skin2:
+            self.update_particle(i_particle, position)
+
+    def update_particle(self, i_particle, position):
+        """
+        Rebuild the list of a single particle at its new reference position
+        The distances are taken to the reference positions of the other particles, so the lists stay
+        symmetric and complete as long as every particle is within half the skin of its reference.
+        """
+
+        rij = self.reference_positions - position
+        rij -= self.box_length * np.round(rij / self.box_length)
+        rij2 = np.einsum('ij,ij->i', rij, rij)
+        rij2[i_particle] = np.inf
+        new_list = np.flatnonzero(rij2 < self.list_cutoff2)
+        old_list = self.lists[i_particle]
+
+        for j_particle in np.setdiff1d(old_list, new_list, assume_unique=True):
+            self.lists[j_particle] = self.lists[j_particle][self.lists[j_particle] != i_particle]
+        for j_particle in np.setdiff1d(new_list, old_list, assume_unique=True):
+            self.lists[j_particle] = np.append(self.lists[j_particle], i_particle)
+
+        self.lists[i_particle] = new_list
+        self.reference_positions[i_particle] = position
+        self.n_updates += 1
+
+    def neighbors(self, i_particle, position):
+        """
+        Neighbor candidates of a particle at the given (possibly proposed) position
+        Falls back to the cell list if the position is outside of the skin
+        """
+
+        if self.displacement2(position, self.reference_positions[i_particle]) > self.half_skin2:
+            return self.cell_list.neighbors(i_particle, position)
+
+        return self.lists[i_particle]
@@ -0,0 +1,130 @@
+from source.Backend import MPI
+import numpy as np
+
+
+class Observables:
+
+    def __init__(self, box_length, cutoff, num_particles, n_bins=100, r_max=None, comm=None):
+        """
+        Virial pressure and radial distribution function of a LJ system, updated incrementally
+        Every rank holds the virial sum and the pair distance histogram of a share of the pairs. An accepted
+        move of particle i changes only the pairs (i, j): the contributions of the old distances are removed
+        and those of the new distances added, using the distances the rank computes for the move anyway.
+        The shares of all ranks are combined with a single Reduce at sampling time and accumulated on rank 0.
+        """
+
+        self.comm = comm if comm is not None else MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.box_length = box_length
+        self.cutoff2 = cutoff * cutoff
+        self.num_particles = num_particles
+        self.volume = box_length ** 3
+        self.density = num_particles / self.volume
+
+        self.r_max = r_max if r_max is not None else min(cutoff, box_length / 2.0)
+        self.r_max2 = self.r_max * self.r_max
+        self.n_bins = n_bins
+        self.bin_width = self.r_max / n_bins
+
+        # local share: virial sum followed by the histogram, so a sample is a single reduction
+        self.local = np.zeros(n_bins + 1)
+
+        # accumulated samples on rank 0
+        self.n_samples = 0
+        self.virial_sum = 0.0
+        self.histogram_sum = np.zeros(n_bins)
+        self.last_virial = 0.0
+
+    def initialize(self, coordinates, start=0, stride=1):
+        """
+        Local share of the pairs (i, j < i) of the particles i % stride == start of a configuration
+        """
+
+        self.local[:] = 0.0
+        for i_particle in range(start, len(coordinates), stride):
+            rij = coordinates[:i_particle] - coordinates[i_particle]
+            rij -= self.box_length * np.round(rij / self.box_length)
+            self.add_pairs(np.einsum('ij,ij->i', rij, rij))
+
+    def pair_virial(self, rij2):
+        """
+        Sum of r * F(r) over the squared distances within the cutoff
+        """
+
+        rij2 = rij2[rij2 < self.cutoff2]
+        sig_by_r6 = 1.0 / (rij2 * rij2 * rij2)
+        return np.sum(24.0 * (2.0 * sig_by_r6 * sig_by_r6 - sig_by_r6))
+
+    def pair_histogram(self, rij2):
+        """
+        Number of squared distances in every bin up to r_max
+        """
+
+        rij = np.sqrt(rij2[rij2 < self.r_max2])
+        return np.bincount((rij / self.bin_width).astype(int), minlength=self.n_bins)[:self.n_bins]
+
+    def add_pairs(self, rij2):
+        """
+        Add the pairs with the given squared distances to the local share
+        """
+
+        self.local[0] += self.pair_virial(rij2)
+        self.local[1:] += self.pair_histogram(rij2)
+
+    def remove_pairs(self, rij2):
+        """
+        Remove the pairs with the given squared distances from the local share
+        """
+
+        self.local[0] -= self.pair_virial(rij2)
+        self.local[1:] -= self.pair_histogram(rij2)
+
+    def move(self, old_rij2, new_rij2):
+        """
+        Update the local share for an accepted move from the distances before and after the move
+        """
+
+        self.remove_pairs(old_rij2)
+        self.add_pairs(new_rij2)
+
+    def sample(self):
+        """
+        Combine the shares of all ranks (single Reduce) and accumulate the sample on rank 0 (collective)
+        """
+
+        total = np.zeros_like(self.local)
+        self.comm.Reduce([self.local, MPI.DOUBLE], [total, MPI.DOUBLE], op=MPI.SUM, root=0)
+
+        if self.rank == 0:
+            self.n_samples += 1
+            self.last_virial = total[0]
+            self.virial_sum += total[0]
+            self.histogram_sum += total[1:]
+
+    def pressure_tail_correction(self):
+        """
+        Standard tail correction of the LJ pressure beyond the cutoff
+        """
+
+        sig_by_cutoff3 = 1.0 / self.cutoff2 ** 1.5
+        return 16.0 / 3.0 * np.pi * self.density ** 2 * (2.0 / 3.0 * sig_by_cutoff3 ** 3 - sig_by_cutoff3)
+
+    def pressure(self, temperature, virial=None):
+        """
+        Virial pressure with tail correction, of the given virial sum or of the mean over all samples
+        """
+
+        if virial is None:
+            virial = self.virial_sum / max(self.n_samples, 1)
+        return self.density * temperature + virial / (3.0 * self.volume) + self.pressure_tail_correction()
+
+    def radial_distribution(self):
+        """
+        Bin centers and g(r) averaged over all samples (rank 0)
+        """
+
+        edges = np.arange(self.n_bins + 1) * self.bin_width
+        shell_volumes = 4.0 / 3.0 * np.pi * (edges[1:] ** 3 - edges[:-1] ** 3)
+        ideal_pairs = 0.5 * self.num_particles * self.density * shell_volumes
+        g_r = self.histogram_sum / max(self.n_samples, 1) / ideal_pairs
+        return 0.5 * (edges[1:] + edges[:-1]), g_r
@@ -0,0 +1,121 @@
+from mpi4py import MPI
+import numpy as np
+from source.MonteCarlo import MonteCarlo
+
+
+class ParallelTempering:
+
+    def __init__(self, temperatures=(0.9, 1.0, 1.1, 1.2), exchange_seed=7, seed=1, comm=None,
+                 **monte_carlo_parameters):
+        """
+        Replica exchange (parallel tempering) of LJ Monte Carlo simulations
+        MPI.COMM_WORLD (or comm) is split into one group per temperature, every group runs one MonteCarlo replica
+        on its sub-communicator. Every freq steps the group leaders attempt to swap the temperatures of
+        neighboring replicas, only temperature indices and energies are exchanged, never coordinates.
+        Every replica runs with its own random streams spawned from seed.
+        """
+
+        self.world_comm = comm if comm is not None else MPI.COMM_WORLD
+        self.world_size = self.world_comm.Get_size()
+        self.rank = self.world_comm.Get_rank()
+
+        self.temperatures = np.array(temperatures, dtype=float)
+        self.n_replicas = len(self.temperatures)
+
+        if self.world_size % self.n_replicas != 0:
+            raise ValueError("Number of ranks " + str(self.world_size) + " must be a multiple of the number of "
+                             "replicas " + str(self.n_replicas))
+
+        # contiguous groups of ranks, one group per replica
+        self.group_size = self.world_size // self.n_replicas
+        self.replica = self.rank // self.group_size
+        self.group_comm = self.world_comm.Split(self.replica, key=self.rank)
+        self.group_rank = self.group_comm.Get_rank()
+
+        # only the group leaders take part in the exchanges
+        self.leader_comm = self.world_comm.Split(0 if self.group_rank == 0 else MPI.UNDEFINED, key=self.rank)
+
+        # the identically seeded random stream makes all leaders take the same swap decisions,
+        # since all of them see the same energies the streams stay in sync
+        self.exchange_random = np.random.default_rng(exchange_seed)
+        self.temperature_index = self.replica
+        self.n_exchanges = 0
+        self.swap_attempts = np.zeros(self.n_replicas - 1)
+        self.swap_accepts = np.zeros(self.n_replicas - 1)
+
+        monte_carlo_parameters['use_mpi'] = self.group_size > 1
+        monte_carlo_parameters['seed'] = np.random.SeedSequence(seed).spawn(self.n_replicas)[self.replica]
+        monte_carlo_parameters['reduced_temperature'] = self.temperatures[self.temperature_index]
+        self.monte_carlo = MonteCarlo(comm=self.group_comm, exchange_callback=self.attempt_exchange,
+                                      **monte_carlo_parameters)
+
+    def main(self):
+
+        if self.rank == 0:
+            print("")
+            print("Start parallel tempering with " + str(self.n_replicas) + " replicas of " +
+                  str(self.group_size) + " rank(s) ...")
+            print("-----------------------------------------------------------")
+
+        start_time = MPI.Wtime()
+        self.monte_carlo.main()
+        elapsed_time = MPI.Wtime() - start_time
+
+        self.report(elapsed_time)
+
+    def attempt_exchange(self, step, total_energy):
+        """
+        Attempt temperature swaps between neighboring temperatures (called on the group leaders)
+        Even and odd pairs of the temperature ladder are attempted alternately.
+        The leaders gather the temperature index and the total energy of all replicas with one Allgather.
+        """
+
+        local_state = np.array([self.temperature_index, total_energy * self.monte_carlo.num_particles])
+        states = np.empty([self.n_replicas, 2])
+        self.leader_comm.Allgather([local_state, MPI.DOUBLE], [states, MPI.DOUBLE])
+
+        # replica currently holding each temperature
+        holders = np.empty(self.n_replicas, dtype=int)
+        holders[states[:, 0].astype(int)] = np.arange(self.n_replicas)
+        energies = states[:, 1]
+        betas = 1.0 / self.temperatures
+
+        for i_temperature in range(self.n_exchanges % 2, self.n_replicas - 1, 2):
+            i_replica = holders[i_temperature]
+            j_replica = holders[i_temperature + 1]
+
+            delta = (betas[i_temperature] - betas[i_temperature + 1]) * (energies[i_replica] - energies[j_replica])
+            self.swap_attempts[i_temperature] += 1
+
+            if delta >= 0.0 or self.exchange_random.random() < np.exp(delta):
+                self.swap_accepts[i_temperature] += 1
+                holders[i_temperature], holders[i_temperature + 1] = j_replica, i_replica
+
+        self.n_exchanges += 1
+        self.temperature_index = int(np.flatnonzero(holders == self.replica)[0])
+
+        self.monte_carlo.reduced_temperature = self.temperatures[self.temperature_index]
+        self.monte_carlo.beta = 1.0 / self.monte_carlo.reduced_temperature
+
+    def report(self, elapsed_time):
+        """
+        Report the swap acceptance rate of every pair of neighboring temperatures and the throughput of every replica
+        """
+
+        throughput = np.array([self.monte_carlo.n_steps / elapsed_time])
+        throughputs = np.empty(self.n_replicas) if self.rank == 0 else None
+
+        if self.group_rank == 0:
+            self.leader_comm.Gather([throughput, MPI.DOUBLE], [throughputs, MPI.DOUBLE], root=0)
+
+        if self.rank == 0:
+            print("")
+            print("Parallel tempering summary")
+            print("-----------------------------------------------------------")
+            for i_temperature in range(self.n_replicas - 1):
+                rate = self.swap_accepts[i_temperature] / max(self.swap_attempts[i_temperature], 1.0)
+                print("Swap " + str(self.temperatures[i_temperature]) + " <-> " +
+                      str(self.temperatures[i_temperature + 1]) + ": acceptance rate " + str(rate))
+            for replica in range(self.n_replicas):
+                print("Replica " + str(replica) + ": " + str(throughputs[replica]) + " steps/s")
+            print("-----------------------------------------------------------")
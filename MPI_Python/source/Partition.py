@@ -0,0 +1,121 @@
+import numpy as np
+
+
+PARTITION_METHODS = ('block', 'cyclic', 'weighted')
+
+
+class Partition:
+
+    def __init__(self, n, n_parts, method='block', weights=None):
+        """
+        Distribution of n items over n_parts ranks (or workers)
+        'block' gives every part a contiguous block, the first n % n_parts parts one item more,
+        'cyclic' gives part p the items p, p + n_parts, p + 2 * n_parts, ... and 'weighted' gives every
+        part a contiguous block with a size proportional to its weight (e.g. the measured throughput).
+        The counts and displacements for Scatterv/Gatherv/Allgatherv are provided by buffer_counts.
+        """
+
+        if method not in PARTITION_METHODS:
+            raise ValueError("Unknown partition method: " + str(method))
+        if method == 'weighted' and (weights is None or len(weights) != n_parts):
+            raise ValueError("Weighted partition requires one weight per part, got: " + str(weights))
+
+        self.n = n
+        self.n_parts = n_parts
+        self.method = method
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+        if method == 'weighted':
+            self.counts = self.weighted_counts(self.weights)
+        else:
+            self.counts = np.full(n_parts, n // n_parts, dtype=np.int64)
+            self.counts[:n % n_parts] += 1
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+
+    def weighted_counts(self, weights):
+        """
+        Counts proportional to the weights, rounded down and the remaining items given to the parts
+        with the largest remainders
+        """
+
+        if np.any(weights < 0.0) or np.sum(weights) <= 0.0:
+            raise ValueError("Unknown partition weights: " + str(weights))
+
+        exact = self.n * weights / np.sum(weights)
+        counts = np.floor(exact).astype(np.int64)
+        remainders = np.argsort(counts - exact, kind='stable')
+        counts[remainders[:self.n - np.sum(counts)]] += 1
+        return counts
+
+    def count(self, part):
+        """
+        Number of items of a part
+        """
+
+        return int(self.counts[part])
+
+    def block(self, part):
+        """
+        First and one past the last item [start, end) of the contiguous block of a part
+        """
+
+        if self.method == 'cyclic':
+            raise ValueError("Cyclic partitions have no contiguous blocks")
+        return int(self.starts[part]), int(self.starts[part] + self.counts[part])
+
+    def blocks(self):
+        """
+        Blocks [start, end) of all parts
+        """
+
+        return [self.block(part) for part in range(self.n_parts)]
+
+    def start_stride(self, part):
+        """
+        First item and stride of a part of a cyclic partition
+        """
+
+        if self.method != 'cyclic':
+            raise ValueError("Only cyclic partitions have a stride, got: " + str(self.method))
+        return part, self.n_parts
+
+    def indices(self, part):
+        """
+        Indices of the items of a part
+        """
+
+        if self.method == 'cyclic':
+            return np.arange(part, self.n, self.n_parts)
+        start, end = self.block(part)
+        return np.arange(start, end)
+
+    def order(self):
+        """
+        Item indices ordered by part, data[order()] is the send buffer of a Scatterv of a cyclic partition
+        """
+
+        if self.method == 'cyclic':
+            return np.concatenate([self.indices(part) for part in range(self.n_parts)])
+        return np.arange(self.n)
+
+    def buffer_counts(self, item_size=1):
+        """
+        Counts and displacements (in elements) for Scatterv/Gatherv of items of item_size elements each
+        """
+
+        counts = item_size * self.counts
+        displacements = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        return counts.astype(np.int64), displacements.astype(np.int64)
+
+    def rebalance(self, times, damping=0.5):
+        """
+        Weighted partition for the next iteration from the time every part needed in the last one
+        The new weights are the measured throughputs (items per second), mixed with the current
+        shares by damping (0 keeps the current partition, 1 uses the throughputs only) against noise.
+        """
+
+        times = np.maximum(np.asarray(times, dtype=np.float64), 1e-12)
+        throughput = np.maximum(self.counts, 1) / times
+        shares = self.counts / float(max(self.n, 1))
+        weights = (1.0 - damping) * shares + damping * throughput / np.sum(throughput)
+        return Partition(self.n, self.n_parts, 'weighted', weights)
@@ -0,0 +1,224 @@
+from mpi4py import MPI
+import numpy as np
+import json
+
+
+class PointToPointBenchmark:
+
+    def __init__(self, min_bytes=8, max_bytes=268435456, n_repetitions=100, n_warmup=10, max_total_bytes=1073741824,
+                 modes=('blocking', 'nonblocking'), apis=('buffer', 'pickle'), window=16, output_file=None,
+                 comm=None):
+        """
+        Ping-pong and streaming point-to-point microbenchmark between rank 0 and rank 1
+        Message sizes are powers of two from min_bytes to max_bytes, the number of repetitions, warmup
+        repetitions and the window of large messages are reduced so that at most max_total_bytes (but at
+        least one message, and for streaming at least one warmup window) are sent per size and benchmark.
+        Every message size is run with blocking Send/Recv and Isend/Irecv and with the buffer based
+        (uppercase) and the pickle based (lowercase) API. The streaming benchmark sends window messages
+        back to back before waiting for a single acknowledgement. From the ping-pong times the latency
+        alpha and the time per byte beta of the model t(n) = alpha + beta * n are fitted by least squares.
+        """
+
+        self.comm = comm if comm is not None else MPI.COMM_WORLD
+        self.world_size = self.comm.Get_size()
+        self.rank = self.comm.Get_rank()
+
+        if self.world_size < 2:
+            raise ValueError("Point-to-point benchmark requires at least 2 ranks, got " + str(self.world_size))
+        for mode in modes:
+            if mode not in ('blocking', 'nonblocking'):
+                raise ValueError("Unknown mode: " + str(mode))
+        for api in apis:
+            if api not in ('buffer', 'pickle'):
+                raise ValueError("Unknown api: " + str(api))
+
+        self.message_sizes = [2 ** i for i in range(int(np.log2(min_bytes)), int(np.log2(max_bytes)) + 1)]
+        self.n_repetitions = n_repetitions
+        self.n_warmup = n_warmup
+        self.max_total_bytes = max_total_bytes
+        self.modes = modes
+        self.apis = apis
+        self.window = window
+        self.output_file = output_file
+        self.tag = 77
+
+    def get_repetitions(self, n_bytes):
+        """
+        Number of repetitions for a message size, at least one
+        """
+
+        return max(1, min(self.n_repetitions, self.max_total_bytes // n_bytes))
+
+    def get_warmup(self, n_bytes, n_measured):
+        """
+        Number of warmup messages for a message size, limited to the budget left by the n_measured messages
+        """
+
+        return min(self.n_warmup, max(0, self.max_total_bytes // n_bytes - n_measured))
+
+    def get_warmup_windows(self, n_bytes, window, n_windows):
+        """
+        Number of warmup windows of the streaming benchmark, limited to the budget left by the n_windows
+        measured windows but at least one if n_warmup > 0
+        """
+
+        budget_windows = max(0, self.max_total_bytes // n_bytes - n_windows * window) // window
+        return min(self.n_warmup, max(1, budget_windows))
+
+    def send(self, message, destination, mode, api):
+        """
+        Send a message in the given mode with the given API
+        """
+
+        if api == 'buffer':
+            if mode == 'blocking':
+                self.comm.Send([message, MPI.BYTE], dest=destination, tag=self.tag)
+            else:
+                self.comm.Isend([message, MPI.BYTE], dest=destination, tag=self.tag).Wait()
+        else:
+            if mode == 'blocking':
+                self.comm.send(message, dest=destination, tag=self.tag)
+            else:
+                self.comm.isend(message, dest=destination, tag=self.tag).wait()
+
+    def receive(self, message, source, mode, api):
+        """
+        Receive a message in the given mode with the given API (into message for the buffer API)
+        """
+
+        if api == 'buffer':
+            if mode == 'blocking':
+                self.comm.Recv([message, MPI.BYTE], source=source, tag=self.tag)
+            else:
+                self.comm.Irecv([message, MPI.BYTE], source=source, tag=self.tag).Wait()
+            return message
+        else:
+            if mode == 'blocking':
+                return self.comm.recv(source=source, tag=self.tag)
+            # without a buffer size the request is limited to small messages
+            return self.comm.irecv(bytearray(message.nbytes + 4096), source=source, tag=self.tag).wait()
+
+    def ping_pong(self, n_bytes, mode, api):
+        """
+        Average one way time of a message of n_bytes bouncing between rank 0 and rank 1
+        Returns the time on rank 0 and None on all other ranks
+        """
+
+        message = np.zeros(n_bytes, dtype=np.uint8)
+        n_repetitions = self.get_repetitions(n_bytes)
+        n_warmup = self.get_warmup(n_bytes, n_repetitions)
+        start_time = 0.0
+
+        for repetition in range(n_warmup + n_repetitions):
+            if repetition == n_warmup:
+                start_time = MPI.Wtime()
+            if self.rank == 0:
+                self.send(message, 1, mode, api)
+                message = self.receive(message, 1, mode, api)
+            elif self.rank == 1:
+                message = self.receive(message, 0, mode, api)
+                self.send(message, 0, mode, api)
+
+        if self.rank == 0:
+            return (MPI.Wtime() - start_time) / (2 * n_repetitions)
+
+    def streaming(self, n_bytes, mode, api):
+        """
+        Bandwidth of window messages of n_bytes sent back to back from rank 0 to rank 1
+        In nonblocking mode all messages of a window are in flight at the same time. The window is
+        limited to the repetitions of the message size and rank 1 receives all messages into the same
+        buffer, as only the transfer is measured.
+        Returns the bandwidth in bytes/s on rank 0 and None on all other ranks
+        """
+
+        message = np.zeros(n_bytes, dtype=np.uint8)
+        acknowledgement = np.zeros(1, dtype=np.uint8)
+        n_repetitions = self.get_repetitions(n_bytes)
+        window = min(self.window, n_repetitions)
+        n_windows = n_repetitions // window
+        n_warmup = self.get_warmup_windows(n_bytes, window, n_windows)
+        start_time = 0.0
+
+        for repetition in range(n_warmup + n_windows):
+            if repetition == n_warmup:
+                start_time = MPI.Wtime()
+            if self.rank == 0:
+                if mode == 'nonblocking' and api == 'buffer':
+                    MPI.Request.Waitall([self.comm.Isend([message, MPI.BYTE], dest=1, tag=self.tag)
+                                         for i in range(window)])
+                elif mode == 'nonblocking':
+                    MPI.Request.waitall([self.comm.isend(message, dest=1, tag=self.tag) for i in range(window)])
+                else:
+                    for i in range(window):
+                        self.send(message, 1, mode, api)
+                self.comm.Recv([acknowledgement, MPI.BYTE], source=1, tag=self.tag + 1)
+            elif self.rank == 1:
+                if mode == 'nonblocking' and api == 'buffer':
+                    MPI.Request.Waitall([self.comm.Irecv([message, MPI.BYTE], source=0, tag=self.tag)
+                                         for i in range(window)])
+                else:
+                    for i in range(window):
+                        self.receive(message, 0, mode, api)
+                self.comm.Send([acknowledgement, MPI.BYTE], dest=0, tag=self.tag + 1)
+
+        if self.rank == 0:
+            return n_windows * window * n_bytes / (MPI.Wtime() - start_time)
+
+    def fit(self, message_sizes, times):
+        """
+        Least squares fit of the latency alpha and the inverse bandwidth beta of t(n) = alpha + beta * n
+        The relative error is minimized, otherwise the largest messages would determine the latency.
+        """
+
+        sizes = np.array(message_sizes, dtype=float)
+        times = np.array(times)
+        matrix = np.column_stack([np.ones_like(sizes), sizes]) / times[:, None]
+        (alpha, beta), _, _, _ = np.linalg.lstsq(matrix, np.ones_like(sizes), rcond=None)
+
+        return {'alpha': float(alpha), 'beta': float(beta),
+                'bandwidth': float(1.0 / beta) if beta > 0.0 else None,
+                'half_bandwidth_size': float(alpha / beta) if beta > 0.0 else None}
+
+    def main(self):
+
+        if self.rank == 0:
+            print("")
+            print("Start point-to-point benchmark between rank 0 and rank 1 ...")
+            print("-----------------------------------------------------------")
+
+        results = []
+
+        for api in self.apis:
+            for mode in self.modes:
+                latencies = []
+                bandwidths = []
+                for n_bytes in self.message_sizes:
+                    self.comm.Barrier()
+                    latency = self.ping_pong(n_bytes, mode, api)
+                    self.comm.Barrier()
+                    bandwidth = self.streaming(n_bytes, mode, api)
+                    if self.rank == 0:
+                        latencies.append(latency)
+                        bandwidths.append(bandwidth)
+
+                if self.rank == 0:
+                    model = self.fit(self.message_sizes, latencies)
+                    results.append({'api': api, 'mode': mode, 'message_sizes': self.message_sizes,
+                                    'ping_pong_time': latencies, 'streaming_bandwidth': bandwidths,
+                                    'model': model})
+
+                    print(api + " API, " + mode + ":")
+                    for n_bytes, latency, bandwidth in zip(self.message_sizes, latencies, bandwidths):
+                        print("    " + str(n_bytes) + " B: " + str(latency * 1e6) + " us, ping-pong " +
+                              str(n_bytes / latency / 1e6) + " MB/s, streaming " + str(bandwidth / 1e6) + " MB/s")
+                    print("    alpha: " + str(model['alpha'] * 1e6) + " us, beta: " + str(model['beta'] * 1e9) +
+                          " ns/B, n_1/2: " + str(model['half_bandwidth_size']) + " B")
+
+        if self.rank == 0:
+            print("-----------------------------------------------------------")
+
+            if self.output_file is not None:
+                with open(self.output_file, 'w') as output:
+                    json.dump(results, output, indent=2, sort_keys=True)
+
+            return results
@@ -0,0 +1,152 @@
+from source.Backend import MPI
+import numpy as np
+import json
+
+
+class Profiler:
+
+    def __init__(self, comm=None, enabled=False, output_file=None):
+        """
+        Named timed regions and MPI call statistics of a workload
+        Every call returns immediately if the profiler is disabled, so it can stay in the code.
+        At the end the per rank values are gathered on rank 0, which reports min/max/mean over
+        all ranks (exposing load imbalance) and writes them to a JSON or CSV file (by extension).
+        """
+
+        self.comm = comm if comm is not None else MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.world_size = self.comm.Get_size()
+        self.enabled = enabled
+        self.output_file = output_file
+
+        # name -> [calls, seconds] and name -> [calls, bytes]
+        self.regions = {}
+        self.mpi_calls = {}
+
+    def start(self):
+        """
+        Start time of a region
+        """
+
+        if not self.enabled:
+            return 0.0
+        return MPI.Wtime()
+
+    def stop(self, name, start_time):
+        """
+        Add the time since start_time to the region name
+        """
+
+        if not self.enabled:
+            return
+        self.add(name, MPI.Wtime() - start_time)
+
+    def add(self, name, seconds, calls=1):
+        """
+        Add an already measured time to the region name
+        """
+
+        if not self.enabled:
+            return
+
+        region = self.regions.get(name)
+        if region is None:
+            self.regions[name] = [calls, seconds]
+        else:
+            region[0] += calls
+            region[1] += seconds
+
+    def count(self, name, n_bytes=0):
+        """
+        Count a call of the MPI operation name moving n_bytes (from the perspective of this rank)
+        """
+
+        if not self.enabled:
+            return
+
+        call = self.mpi_calls.get(name)
+        if call is None:
+            self.mpi_calls[name] = [1, n_bytes]
+        else:
+            call[0] += 1
+            call[1] += n_bytes
+
+    def reset(self):
+        """
+        Clear all regions and MPI call statistics
+        """
+
+        self.regions = {}
+        self.mpi_calls = {}
+
+    def summarize(self, entries):
+        """
+        Min/max/mean over ranks of the calls and values of the entries gathered from all ranks
+        """
+
+        names = sorted(set(name for rank_entries in entries for name in rank_entries))
+        summary = []
+        for name in names:
+            values = np.array([rank_entries.get(name, [0, 0.0]) for rank_entries in entries], dtype=float)
+            summary.append({'name': name,
+                            'calls_min': values[:, 0].min(), 'calls_max': values[:, 0].max(),
+                            'min': values[:, 1].min(), 'max': values[:, 1].max(), 'mean': values[:, 1].mean()})
+        return summary
+
+    def gather(self):
+        """
+        Gather the statistics of all ranks on rank 0 (collective)
+        Returns the summary on rank 0 and None on all other ranks
+        """
+
+        if not self.enabled:
+            return None
+
+        all_regions = self.comm.gather(self.regions, root=0)
+        all_mpi_calls = self.comm.gather(self.mpi_calls, root=0)
+
+        if self.rank != 0:
+            return None
+
+        return {'ranks': self.world_size, 'regions': self.summarize(all_regions),
+                'mpi_calls': self.summarize(all_mpi_calls)}
+
+    def report(self, title="Profile"):
+        """
+        Gather, print and write the statistics of all ranks (collective)
+        """
+
+        summary = self.gather()
+        if summary is None:
+            return
+
+        print("")
+        print(title + " (" + str(summary['ranks']) + " ranks, min/max/mean over ranks)")
+        print("-----------------------------------------------------------")
+        for region in summary['regions']:
+            print("    " + region['name'] + ": " + str(region['min']) + " / " + str(region['max']) + " / " +
+                  str(region['mean']) + " s")
+        for call in summary['mpi_calls']:
+            print("    " + call['name'] + ": " + str(int(call['calls_max'])) + " calls, " + str(call['min']) +
+                  " / " + str(call['max']) + " / " + str(call['mean']) + " bytes")
+        print("-----------------------------------------------------------")
+
+        if self.output_file is not None:
+            self.write(summary)
+
+    def write(self, summary):
+        """
+        Write the summary as JSON or, if the file name ends with .csv, as CSV
+        """
+
+        if self.output_file.endswith('.csv'):
+            with open(self.output_file, 'w') as output:
+                output.write("kind,name,calls_min,calls_max,min,max,mean\n")
+                for kind in ('regions', 'mpi_calls'):
+                    for entry in summary[kind]:
+                        output.write(",".join([kind, entry['name']] +
+                                              [str(entry[key]) for key in ('calls_min', 'calls_max', 'min', 'max',
+                                                                           'mean')]) + "\n")
+        else:
+            with open(self.output_file, 'w') as output:
+                json.dump(summary, output, indent=2, default=float)
@@ -0,0 +1,119 @@
+import json
+import queue
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class ProgressReporter:
+
+    def __init__(self, output, queue_size=1024, history_size=1000):
+        """
+        Progress metrics of a long run, written by a background thread
+        Metrics (dictionaries) are put into a bounded queue without blocking the caller, if the queue is
+        full the metrics are dropped and counted. The thread appends every entry as a JSON line to a file,
+        or, if output is an address like 'http://localhost:8000', serves the latest entry and the recent
+        history as JSON from a local HTTP server (port 0 picks a free port, see address).
+        """
+
+        self.output = output
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.history = deque(maxlen=history_size)
+        self.latest = None
+        self.n_dropped = 0
+        self.lock = threading.Lock()
+
+        self.file = None
+        self.server = None
+        self.address = None
+
+        if output.startswith('http://'):
+            url = urlsplit(output)
+            if url.hostname not in ('localhost', '127.0.0.1'):
+                raise ValueError("Unknown progress host (only localhost is served): " + str(url.hostname))
+            self.server = ThreadingHTTPServer(('127.0.0.1', url.port if url.port is not None else 0),
+                                              self.create_handler())
+            self.server.daemon_threads = True
+            self.address = 'http://127.0.0.1:' + str(self.server.server_address[1])
+        else:
+            self.file = open(output, 'a')
+
+        self.thread = threading.Thread(target=self.run, name='progress-reporter', daemon=True)
+        self.thread.start()
+        if self.server is not None:
+            self.server_thread = threading.Thread(target=self.server.serve_forever, name='progress-server',
+                                                  daemon=True)
+            self.server_thread.start()
+
+    def create_handler(self):
+        """
+        Request handler class answering every GET with the latest metrics and the history
+        """
+
+        reporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = json.dumps(reporter.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def report(self, metrics):
+        """
+        Queue metrics for the background thread, returns immediately
+        """
+
+        try:
+            self.queue.put_nowait(metrics)
+        except queue.Full:
+            self.n_dropped += 1
+
+    def snapshot(self):
+        """
+        Latest metrics, the recent history and the number of dropped entries
+        """
+
+        with self.lock:
+            return {'latest': self.latest, 'history': list(self.history), 'dropped': self.n_dropped}
+
+    def run(self):
+        """
+        Loop of the background thread until close() queues None
+        """
+
+        while True:
+            metrics = self.queue.get()
+            if metrics is None:
+                break
+
+            with self.lock:
+                self.latest = metrics
+                self.history.append(metrics)
+
+            if self.file is not None:
+                self.file.write(json.dumps(metrics, sort_keys=True) + "\n")
+                self.file.flush()
+
+    def close(self):
+        """
+        Write the remaining metrics and stop the thread and the server
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.file is not None:
+            self.file.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class RandomStream:
+
+    def __init__(self, seed_sequence, num_particles, block_size=4096):
+        """
+        Pre-drawn trial moves of a Markov chain from a numpy Generator
+        Particle indices, unit displacements in [-1, 1)^3 and acceptance uniforms are drawn for block_size
+        steps at once and consumed step by step. Every step uses one of each, whether the acceptance
+        uniform is needed or not, so the sequence of moves only depends on the seed. The state of the
+        generator before the current block and the position within the block describe the stream
+        completely, which makes it possible to checkpoint and restore it exactly.
+        """
+
+        self.generator = np.random.default_rng(seed_sequence)
+        self.num_particles = num_particles
+        self.block_size = block_size
+        self.refill()
+
+    def refill(self):
+        """
+        Draw the next block of moves
+        """
+
+        self.block_state = self.generator.bit_generator.state
+        self.particles = self.generator.integers(self.num_particles, size=self.block_size)
+        self.displacements = 2.0 * self.generator.random((self.block_size, 3)) - 1.0
+        self.uniforms = self.generator.random(self.block_size)
+        self.position = 0
+
+    def next_move(self):
+        """
+        Particle index, unit displacement and acceptance uniform of the next step
+        """
+
+        if self.position == self.block_size:
+            self.refill()
+
+        position = self.position
+        self.position += 1
+        return self.particles[position], self.displacements[position], self.uniforms[position]
+
+    def next_moves(self, n_moves):
+        """
+        Particle indices, unit displacements and acceptance uniforms of the next n_moves steps as arrays
+        """
+
+        particles = np.empty(n_moves, dtype=self.particles.dtype)
+        displacements = np.empty([n_moves, 3])
+        uniforms = np.empty(n_moves)
+
+        n_taken = 0
+        while n_taken < n_moves:
+            if self.position == self.block_size:
+                self.refill()
+            n = min(n_moves - n_taken, self.block_size - self.position)
+            particles[n_taken:n_taken + n] = self.particles[self.position:self.position + n]
+            displacements[n_taken:n_taken + n] = self.displacements[self.position:self.position + n]
+            uniforms[n_taken:n_taken + n] = self.uniforms[self.position:self.position + n]
+            self.position += n
+            n_taken += n
+
+        return particles, displacements, uniforms
+
+    def get_state(self):
+        """
+        State of the stream (for checkpoints)
+        """
+
+        return {'block_state': self.block_state, 'position': self.position}
+
+    def set_state(self, state):
+        """
+        Restore a state returned by get_state
+        """
+
+        self.generator.bit_generator.state = state['block_state']
+        self.refill()
+        self.position = state['position']
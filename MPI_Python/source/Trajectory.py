@@ -0,0 +1,70 @@
+from source.Backend import MPI
+import numpy as np
+from source.Partition import Partition
+
+
+class TrajectoryWriter:
+
+    def __init__(self, file_name, n_frames, num_particles, comm=None, use_mpiio=False, resume=False):
+        """
+        Binary trajectory in the NumPy .npy format, preallocated for all frames
+        Without MPI-IO rank 0 writes the frames into a memory-mapped file, so writing a frame is a
+        copy into the page cache. With MPI-IO every rank writes its block of particles of each frame
+        with a collective write at the offset of the frame (all ranks need the same coordinates).
+        The file can be read with np.load(file_name, mmap_mode='r').
+        """
+
+        self.file_name = file_name
+        self.n_frames = n_frames
+        self.num_particles = num_particles
+        self.comm = comm if comm is not None else MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.world_size = self.comm.Get_size()
+        self.use_mpiio = use_mpiio
+
+        mode = 'r+' if resume else 'w+'
+        self.frames = None
+        offset = np.zeros(1, dtype='i8')
+
+        if self.rank == 0:
+            if resume:
+                self.frames = np.lib.format.open_memmap(file_name, mode=mode)
+            else:
+                self.frames = np.lib.format.open_memmap(file_name, mode=mode, dtype=np.float64,
+                                                        shape=(n_frames, num_particles, 3))
+            offset[0] = self.frames.offset
+
+        if self.use_mpiio:
+            # rank 0 created the file and its header, the data is written collectively from now on
+            if self.rank == 0:
+                self.frames.flush()
+                self.frames = None
+            self.comm.Bcast([offset, MPI.INT64_T], root=0)
+            self.header_offset = int(offset[0])
+
+            self.my_start, self.my_end = Partition(num_particles, self.world_size).block(self.rank)
+
+            self.file = MPI.File.Open(self.comm, file_name, MPI.MODE_WRONLY)
+
+    def write(self, frame, coordinates):
+        """
+        Write the coordinates as the given frame (collective if MPI-IO is used)
+        """
+
+        if self.use_mpiio:
+            offset = self.header_offset + (frame * self.num_particles + self.my_start) * 3 * 8
+            block = np.ascontiguousarray(coordinates[self.my_start:self.my_end], dtype=np.float64)
+            self.file.Write_at_all(offset, [block, MPI.DOUBLE])
+        elif self.rank == 0:
+            self.frames[frame] = coordinates
+
+    def close(self):
+        """
+        Flush and close the trajectory file
+        """
+
+        if self.use_mpiio:
+            self.file.Close()
+        elif self.rank == 0:
+            self.frames.flush()
+            self.frames = None
@@ -1,239 +1,927 @@
 import numpy as np
-from mpi4py import MPI
+from source.Backend import MPI, BACKENDS, SerialComm, SharedMemoryPool, load_mpi, wait_all, worker_array, \
+    get_worker_context
+from source.Profiler import Profiler
+from source.Partition import Partition
 
 class VectorAdditionAveraging:
 
-    def __init__(self, N = 100000):
+    def __init__(self, N = 100000, profile=False, profile_file=None, engine='vectorized', chunk_size=1048576,
+                 comm=None, reduction=None, pipeline_depth=4, backend='mpi', n_workers=None, partition='block',
+                 weights=None, rebalance=False, io='memmap'):
+        # only the 'mpi' backend imports mpi4py, otherwise all methods run on a single process communicator
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend: " + str(backend))
+        if backend == 'mpi':
+            load_mpi()
+        self.backend = backend
+        self.n_workers = n_workers
         self.N = N
-        self.world_comm = MPI.COMM_WORLD
+        self.engine = self.get_engine(engine)
+        self.reduction = reduction
+        self.pipeline_depth = pipeline_depth
+        self.chunk_size = chunk_size
+        self.chunk_indices = None
+        self.chunk_buffer = None
+        self.world_comm = comm if comm is not None else MPI.COMM_WORLD
         self.world_size = self.world_comm.Get_size()
         self.rank = self.world_comm.Get_rank()
-
-    def without_communication(self):
+        self.profiler = Profiler(self.world_comm, enabled=profile, output_file=profile_file)
+
+        # the arrays are split in contiguous blocks, of equal size or weighted by the throughput of the ranks
+        if partition not in ('block', 'weighted'):
+            raise ValueError("Unknown partition: " + str(partition))
+        self.partition = Partition(N, self.world_size, partition, weights)
+        self.rebalance = rebalance
+
+        # file access of the scatter/gather method: memory-mapped .npy files or MPI-IO
+        if io not in ('memmap', 'mpiio'):
+            raise ValueError("Unknown io: " + str(io))
+        if io == 'mpiio' and backend != 'mpi':
+            raise ValueError("MPI-IO requires the mpi backend, got: " + str(backend))
+        self.io = io
+        self.result = None
+
+    def report_profile(self):
+        """
+        Report the timed regions and MPI calls of all methods run so far (collective)
+        """
+
+        self.profiler.report("Vector addition and averaging profile")
+
+    def rebalance_partition(self, compute_time):
+        """
+        With rebalance, weight the blocks of the next call by the compute times of all ranks in this one
+        (collective, the times exclude the final reduction)
+        """
+
+        if not self.rebalance:
+            return
+
+        times = self.world_comm.allgather(compute_time)
+        self.profiler.count('allgather', 8)
+        self.partition = self.partition.rebalance(times)
         if self.rank == 0:
-            print("")
-            print("Working with arrays without communication")
-            print("----------------------------------------------------")
+            print("Rebalanced workloads: " + str(self.partition.counts.tolist()))
+
+    def get_engine(self, engine=None):
+        """
+        Kernel engine of a call: 'loop' (element by element), 'vectorized' (NumPy kernels working in place
+        on the arrays) or 'fused' (initialization, addition and sum in chunks without storing a and b)
+        """
+
+        if engine is None:
+            engine = self.engine
+        if engine not in ('loop', 'vectorized', 'fused'):
+            raise ValueError("Unknown engine: " + str(engine))
+        return engine
+
+    def get_chunk_indices(self):
+        """
+        Preallocated chunk of indices 0, 1, ..., chunk_size - 1 and a scratch buffer of the same size
+        """
+
+        if self.chunk_indices is None:
+            self.chunk_indices = np.arange(self.chunk_size, dtype=np.float64)
+            self.chunk_buffer = np.empty(self.chunk_size)
+        return self.chunk_indices
+
+    def get_reduction(self, reduction, default):
+        """
+        Reduction strategy of a call: 'linear' (rank 0 receives from every rank in sequence), 'tree'
+        (binomial tree to rank 0), 'recursive_doubling' (butterfly, result on all ranks), 'reduce' or
+        'allreduce' (built-in collectives) or 'iallreduce' (nonblocking, overlapped with the local sum)
+        """
+
+        if reduction is None:
+            reduction = self.reduction if self.reduction is not None else default
+        if reduction not in ('linear', 'tree', 'recursive_doubling', 'reduce', 'allreduce', 'iallreduce'):
+            raise ValueError("Unknown reduction: " + str(reduction))
+        return reduction
+
+    def initialize_b(self, b, offset):
+        """
+        Vectorized b[i] = 1.0 + (i + offset), chunk by chunk without temporary arrays
+        """
+
+        indices = self.get_chunk_indices()
+        for lo in range(0, len(b), self.chunk_size):
+            hi = min(lo + self.chunk_size, len(b))
+            np.add(indices[:hi - lo], 1.0 + offset + lo, out=b[lo:hi])
+
+    def add_arrays(self, a, b):
+        """
+        Vectorized in place a = a + b
+        """
+
+        np.add(a, b, out=a)
+
+    def sum_array(self, a):
+        """
+        Vectorized (pairwise) sum of an array
+        """
+
+        return float(np.sum(a))
+
+    def partial_sums(self, a, reduction):
+        """
+        Vectorized sums of consecutive blocks of an array
+        With the nonblocking reduction the array is split into pipeline_depth blocks which are summed
+        lazily, so the reduction of a block is in flight while the next block is summed. Otherwise the
+        single block sum is computed right away.
+        """
+
+        n_blocks = self.pipeline_depth if reduction == 'iallreduce' else 1
+        block_size = max(1, -(-len(a) // n_blocks))
+        block_sums = (self.sum_array(a[lo:lo + block_size]) for lo in range(0, max(len(a), 1), block_size))
+        return block_sums if reduction == 'iallreduce' else list(block_sums)
+
+    def reduce_sum(self, partial_sums, reduction):
+        """
+        Sum of the local partial sums over all ranks with the given reduction strategy
+        Returns the sum on rank 0 (on all ranks for the allreduce strategies) and None otherwise
+        """
+
+        if reduction == 'iallreduce':
+            requests = []
+            buffers = []
+            for partial_sum in partial_sums:
+                buffers.append((np.array([partial_sum]), np.zeros(1)))
+                requests.append(self.world_comm.Iallreduce([buffers[-1][0], MPI.DOUBLE],
+                                                           [buffers[-1][1], MPI.DOUBLE], op=MPI.SUM))
+                self.profiler.count('Iallreduce', buffers[-1][0].nbytes)
+            wait_all(requests)
+            world_sum = 0.0
+            for local_sum, block_sum in buffers:
+                world_sum += block_sum[0]
+            return world_sum
+
+        local_sum = 0.0
+        for partial_sum in partial_sums:
+            local_sum += partial_sum
+        local_sum = np.array([local_sum])
+
+        if reduction == 'linear':
+            return self.linear_reduce(local_sum)
+        elif reduction == 'tree':
+            return self.tree_reduce(local_sum)
+        elif reduction == 'recursive_doubling':
+            return self.recursive_doubling_allreduce(local_sum)
+
+        world_sum = np.zeros(1)
+        if reduction == 'reduce':
+            self.world_comm.Reduce([local_sum, MPI.DOUBLE], [world_sum, MPI.DOUBLE], op=MPI.SUM, root=0)
+            self.profiler.count('Reduce', local_sum.nbytes)
+            return world_sum[0] if self.rank == 0 else None
+
+        self.world_comm.Allreduce([local_sum, MPI.DOUBLE], [world_sum, MPI.DOUBLE], op=MPI.SUM)
+        self.profiler.count('Allreduce', local_sum.nbytes)
+        return world_sum[0]
+
+    def linear_reduce(self, local_sum):
+        """
+        Rank 0 receives the sums of all other ranks in sequence, O(P) latency at the root
+        """
 
-        # determine the workload of each rank
-        workloads = [ self.N // self.world_size for i in range(self.world_size) ]
-        for i in range( self.N % self.world_size ):
-            workloads[i] += 1
-        my_start = 0
-        for i in range( self.rank ):
-            my_start += workloads[i]
-        my_end = my_start + workloads[self.rank]
-
-        # initialize a
-        start_time = MPI.Wtime()
-        a = np.ones( self.N )
-        end_time = MPI.Wtime()
         if self.rank == 0:
-            print("Initialize a time: " + str(end_time - start_time))
+            world_sum = local_sum[0]
+            for i in range( 1, self.world_size ):
+                sum_np = np.empty( 1 )
+                self.world_comm.Recv( [sum_np, MPI.DOUBLE], source=i, tag=77 )
+                self.profiler.count('Recv', sum_np.nbytes)
+                world_sum += sum_np[0]
+            return world_sum
+
+        self.world_comm.Send( [local_sum, MPI.DOUBLE], dest=0, tag=77 )
+        self.profiler.count('Send', local_sum.nbytes)
+
+    def tree_reduce(self, local_sum):
+        """
+        Binomial tree reduction to rank 0, O(log P) latency
+        In round k every rank with bit k set sends its partial sum to the rank without this bit and leaves.
+        """
+
+        world_sum = local_sum.copy()
+        sum_np = np.empty(1)
+        mask = 1
+        while mask < self.world_size:
+            if self.rank & mask:
+                self.world_comm.Send([world_sum, MPI.DOUBLE], dest=self.rank ^ mask, tag=77)
+                self.profiler.count('Send', world_sum.nbytes)
+                return None
+            if self.rank | mask < self.world_size:
+                self.world_comm.Recv([sum_np, MPI.DOUBLE], source=self.rank | mask, tag=77)
+                self.profiler.count('Recv', sum_np.nbytes)
+                world_sum += sum_np
+            mask <<= 1
+
+        return world_sum[0]
+
+    def recursive_doubling_allreduce(self, local_sum):
+        """
+        Recursive doubling (butterfly) allreduce, log P rounds of pairwise exchanges
+        For a number of ranks that is not a power of two the first 2 * remainder ranks are folded
+        pairwise onto the odd ranks before and receive the result after the exchanges.
+        """
+
+        world_sum = local_sum.copy()
+        sum_np = np.empty(1)
+        power_of_two = 1 << (self.world_size.bit_length() - 1)
+        remainder = self.world_size - power_of_two
+
+        if self.rank < 2 * remainder:
+            if self.rank % 2 == 0:
+                self.world_comm.Send([world_sum, MPI.DOUBLE], dest=self.rank + 1, tag=77)
+                self.profiler.count('Send', world_sum.nbytes)
+                self.world_comm.Recv([world_sum, MPI.DOUBLE], source=self.rank + 1, tag=77)
+                self.profiler.count('Recv', world_sum.nbytes)
+                return world_sum[0]
+            self.world_comm.Recv([sum_np, MPI.DOUBLE], source=self.rank - 1, tag=77)
+            self.profiler.count('Recv', sum_np.nbytes)
+            world_sum += sum_np
+            new_rank = self.rank // 2
+        else:
+            new_rank = self.rank - remainder
+
+        mask = 1
+        while mask < power_of_two:
+            new_partner = new_rank ^ mask
+            partner = 2 * new_partner + 1 if new_partner < remainder else new_partner + remainder
+            self.world_comm.Sendrecv([world_sum, MPI.DOUBLE], dest=partner, sendtag=77,
+                                     recvbuf=[sum_np, MPI.DOUBLE], source=partner, recvtag=77)
+            self.profiler.count('Sendrecv', 2 * sum_np.nbytes)
+            world_sum += sum_np
+            mask <<= 1
+
+        if self.rank < 2 * remainder:
+            self.world_comm.Send([world_sum, MPI.DOUBLE], dest=self.rank - 1, tag=77)
+            self.profiler.count('Send', world_sum.nbytes)
+
+        return world_sum[0]
+
+    def fused_sum(self, start, end):
+        """
+        Sum of a[i] + b[i] = 1.0 + (1.0 + i) for start <= i < end computed chunk by chunk,
+        so memory is constant in N and the workload is bound by memory bandwidth of the chunk
+        """
+
+        indices = self.get_chunk_indices()
+        total = 0.0
+        for lo in range(start, end, self.chunk_size):
+            n = min(self.chunk_size, end - lo)
+            np.add(indices[:n], 2.0 + lo, out=self.chunk_buffer[:n])
+            total += float(np.sum(self.chunk_buffer[:n]))
+        return total
+
+    def run_fused(self, method, start, end):
+        """
+        Timed fused initialization, addition and local sum of a method
+        """
 
-        # initialize b
         start_time = MPI.Wtime()
-        b = np.zeros( self.N )
-        for i in range( self.N ):
-            b[i] = 1.0 + i
+        sum = self.fused_sum(start, end)
         end_time = MPI.Wtime()
+        self.profiler.add(method + '/fused', end_time - start_time)
         if self.rank == 0:
-            print("Initialize b time: " + str(end_time - start_time))
+            print("Fused initialize, add and sum time: " + str(end_time - start_time))
+        return sum
+
+    @staticmethod
+    def pool_initializer(chunk_size):
+        """
+        Single process instance in every pool worker providing the kernels
+        """
+
+        return VectorAdditionAveraging(N=0, chunk_size=chunk_size, backend='serial', comm=SerialComm())
+
+    @staticmethod
+    def pool_initialize(task):
+        """
+        Initialize the block [start, end) of the shared arrays a and b in a pool worker
+        """
+
+        phase, engine, start, end = task
+        vector_addition_averaging = get_worker_context()
+
+        if phase == 'initialize_a':
+            worker_array('a')[start:end] = 1.0
+        elif engine == 'loop':
+            b = worker_array('b')
+            for i in range(start, end):
+                b[i] = 1.0 + i
+        else:
+            vector_addition_averaging.initialize_b(worker_array('b')[start:end], start)
+
+    @staticmethod
+    def pool_add(task):
+        """
+        Add the block [start, end) of the shared arrays in a pool worker
+        """
+
+        engine, start, end = task
+        a = worker_array('a')
+        b = worker_array('b')
+
+        if engine == 'loop':
+            for i in range(start, end):
+                a[i] = a[i] + b[i]
+        else:
+            get_worker_context().add_arrays(a[start:end], b[start:end])
+
+    @staticmethod
+    def pool_sum(task):
+        """
+        Local sum of the block [start, end) in a pool worker (of the shared array a or fused)
+        """
+
+        engine, start, end = task
+        vector_addition_averaging = get_worker_context()
+
+        if engine == 'fused':
+            return vector_addition_averaging.fused_sum(start, end)
+
+        a = worker_array('a')
+        if engine == 'loop':
+            sum = 0.0
+            for i in range(start, end):
+                sum += a[i]
+            return sum
+        return vector_addition_averaging.sum_array(a[start:end])
+
+    def without_communication(self, engine=None):
+        engine = self.get_engine(engine)
 
-        # add the two arrays
-        start_time = MPI.Wtime()
-        for i in range( self.N ):
-            a[i] = a[i] + b[i]
-        end_time = MPI.Wtime()
         if self.rank == 0:
-            print("Add arrays time: " + str(end_time - start_time))
+            print("")
+            print("Working with arrays without communication")
+            print("----------------------------------------------------")
+
+        if engine == 'fused':
+            sum = self.run_fused('without_communication', 0, self.N)
+        else:
+            # initialize a
+            start_time = MPI.Wtime()
+            a = np.ones( self.N )
+            end_time = MPI.Wtime()
+            self.profiler.add('without_communication/initialize_a', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize a time: " + str(end_time - start_time))
+
+            # initialize b
+            start_time = MPI.Wtime()
+            b = np.zeros( self.N )
+            if engine == 'loop':
+                for i in range( self.N ):
+                    b[i] = 1.0 + i
+            else:
+                self.initialize_b(b, 0)
+            end_time = MPI.Wtime()
+            self.profiler.add('without_communication/initialize_b', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize b time: " + str(end_time - start_time))
+
+            # add the two arrays
+            start_time = MPI.Wtime()
+            if engine == 'loop':
+                for i in range( self.N ):
+                    a[i] = a[i] + b[i]
+            else:
+                self.add_arrays(a, b)
+            end_time = MPI.Wtime()
+            self.profiler.add('without_communication/add', end_time - start_time)
+            if self.rank == 0:
+                print("Add arrays time: " + str(end_time - start_time))
 
         # average the result
         start_time = MPI.Wtime()
-        sum = 0.0
-        for i in range( self.N ):
-            sum += a[i]
+        if engine == 'loop':
+            sum = 0.0
+            for i in range( self.N ):
+                sum += a[i]
+        elif engine == 'vectorized':
+            sum = self.sum_array(a)
         average = sum / self.N
         end_time = MPI.Wtime()
+        self.profiler.add('without_communication/average', end_time - start_time)
         if self.rank == 0:
             print("Average result time: " + str(end_time - start_time))
             print("Average: " + str(average))
 
 
-    def point_to_point_communication(self):
+    def point_to_point_communication(self, engine=None, reduction=None):
+        engine = self.get_engine(engine)
+        reduction = self.get_reduction(reduction, 'linear')
+
         if self.rank == 0:
             print("")
             print("Working with arrays with point to point communication")
             print("----------------------------------------------------")
 
         # determine the workload of each rank
-        workloads = [ self.N // self.world_size for i in range(self.world_size) ]
-        for i in range( self.N % self.world_size ):
-            workloads[i] += 1
-        my_start = 0
-        for i in range( self.rank ):
-            my_start += workloads[i]
-        my_end = my_start + workloads[self.rank]
-
-        # initialize a
-        start_time = MPI.Wtime()
-        a = np.ones( self.N )
-        end_time = MPI.Wtime()
-        if self.rank == 0:
-            print("Initialize a time: " + str(end_time -start_time))
+        my_start, my_end = self.partition.block(self.rank)
+        compute_start_time = MPI.Wtime()
 
-        # initialize b
-        start_time = MPI.Wtime()
-        b = np.zeros( self.N )
-        for i in range(my_start, my_end):
-            b[i] = 1.0 + i
-        end_time = MPI.Wtime()
-        if self.rank == 0:
-            print("Initialize b time: " + str(end_time -start_time))
-
-        # add the two arrays
-        start_time = MPI.Wtime()
-        for i in range(my_start, my_end):
-            a[i] = a[i] + b[i]
-        end_time = MPI.Wtime()
-        if self.rank == 0:
-            print("Add arrays time: " + str(end_time -start_time))
+        if engine == 'fused':
+            sum = self.run_fused('point_to_point_communication', my_start, my_end)
+        else:
+            # initialize a
+            start_time = MPI.Wtime()
+            a = np.ones( self.N )
+            end_time = MPI.Wtime()
+            self.profiler.add('point_to_point_communication/initialize_a', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize a time: " + str(end_time -start_time))
+
+            # initialize b
+            start_time = MPI.Wtime()
+            b = np.zeros( self.N )
+            if engine == 'loop':
+                for i in range(my_start, my_end):
+                    b[i] = 1.0 + i
+            else:
+                self.initialize_b(b[my_start:my_end], my_start)
+            end_time = MPI.Wtime()
+            self.profiler.add('point_to_point_communication/initialize_b', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize b time: " + str(end_time -start_time))
+
+            # add the two arrays
+            start_time = MPI.Wtime()
+            if engine == 'loop':
+                for i in range(my_start, my_end):
+                    a[i] = a[i] + b[i]
+            else:
+                self.add_arrays(a[my_start:my_end], b[my_start:my_end])
+            end_time = MPI.Wtime()
+            self.profiler.add('point_to_point_communication/add', end_time - start_time)
+            if self.rank == 0:
+                print("Add arrays time: " + str(end_time -start_time))
 
         # average the result
         start_time = MPI.Wtime()
-        sum = 0.0
-        for i in range(my_start, my_end):
-            sum += a[i]
+        if engine == 'loop':
+            sum = 0.0
+            for i in range(my_start, my_end):
+                sum += a[i]
+            partial_sums = [sum]
+        elif engine == 'vectorized':
+            partial_sums = self.partial_sums(a[my_start:my_end], reduction)
+        else:
+            partial_sums = [sum]
 
+        compute_time = MPI.Wtime() - compute_start_time
+        world_sum = self.reduce_sum(partial_sums, reduction)
+        if reduction == 'iallreduce':
+            # the pipelined block sums overlap with their reductions, the time includes the reduction
+            compute_time = MPI.Wtime() - compute_start_time
         if self.rank == 0:
-            world_sum = sum
-            for i in range( 1, self.world_size ):
-                sum_np = np.empty( 1 )
-                self.world_comm.Recv( [sum_np, MPI.DOUBLE], source=i, tag=77 )
-                world_sum += sum_np[0]
             average = world_sum / self.N
-        else:
-            sum_np = np.array( [sum] )
-            self.world_comm.Send( [sum_np, MPI.DOUBLE], dest=0, tag=77 )
 
         end_time = MPI.Wtime()
+        self.profiler.add('point_to_point_communication/average', end_time - start_time)
         if self.rank == 0:
             print("Average result time: " + str(end_time -start_time))
             print("Average: " + str(average))
 
+        self.rebalance_partition(compute_time)
+
+
+    def reducing_memory_footprint(self, engine=None, reduction=None):
+        engine = self.get_engine(engine)
+        reduction = self.get_reduction(reduction, 'linear')
 
-    def reducing_memory_footprint(self):
         if self.rank == 0:
             print("")
             print("Reducing memory footprint")
             print("----------------------------------------------------")
 
         # determine the workload of each rank
-        workloads = [ self.N // self.world_size for i in range(self.world_size) ]
-        for i in range( self.N % self.world_size ):
-            workloads[i] += 1
-        my_start = 0
-        for i in range( self.rank ):
-            my_start += workloads[i]
-        my_end = my_start + workloads[self.rank]
-
-        # initialize a
+        my_start, my_end = self.partition.block(self.rank)
+        workload = my_end - my_start
+        compute_start_time = MPI.Wtime()
+
+        if engine == 'fused':
+            sum = self.run_fused('reducing_memory_footprint', my_start, my_end)
+        else:
+            # initialize a
+            start_time = MPI.Wtime()
+            a = np.ones( workload )
+            end_time = MPI.Wtime()
+            self.profiler.add('reducing_memory_footprint/initialize_a', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize a time: " + str(end_time - start_time))
+
+            # initialize b
+            start_time = MPI.Wtime()
+            b = np.zeros( workload )
+            if engine == 'loop':
+                for i in range( workload):
+                    b[i] = 1.0 + ( i + my_start )
+            else:
+                self.initialize_b(b, my_start)
+            end_time = MPI.Wtime()
+            self.profiler.add('reducing_memory_footprint/initialize_b', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize b time: " + str(end_time - start_time))
+
+            # add the two arrays
+            start_time = MPI.Wtime()
+            if engine == 'loop':
+                for i in range( workload ):
+                    a[i] = a[i] + b[i]
+            else:
+                self.add_arrays(a, b)
+            end_time = MPI.Wtime()
+            self.profiler.add('reducing_memory_footprint/add', end_time - start_time)
+            if self.rank == 0:
+                print("Add arrays time: " + str(end_time - start_time))
+
+        # average the result
         start_time = MPI.Wtime()
-        a = np.ones( workloads[self.rank] )
-        end_time = MPI.Wtime()
+        if engine == 'loop':
+            sum = 0.0
+            for i in range( workload ):
+                sum += a[i]
+            partial_sums = [sum]
+        elif engine == 'vectorized':
+            partial_sums = self.partial_sums(a, reduction)
+        else:
+            partial_sums = [sum]
+
+        compute_time = MPI.Wtime() - compute_start_time
+        world_sum = self.reduce_sum(partial_sums, reduction)
+        if reduction == 'iallreduce':
+            # the pipelined block sums overlap with their reductions, the time includes the reduction
+            compute_time = MPI.Wtime() - compute_start_time
         if self.rank == 0:
-            print("Initialize a time: " + str(end_time - start_time))
+            average = world_sum / self.N
 
-        # initialize b
-        start_time = MPI.Wtime()
-        b = np.zeros( workloads[self.rank] )
-        for i in range( workloads[self.rank]):
-            b[i] = 1.0 + ( i + my_start )
         end_time = MPI.Wtime()
+        self.profiler.add('reducing_memory_footprint/average', end_time - start_time)
         if self.rank == 0:
-            print("Initialize b time: " + str(end_time - start_time))
+            print("Average result time: " + str(end_time - start_time))
+            print("Average: " + str(average))
+
+        self.rebalance_partition(compute_time)
+
+    def collective_communication(self, engine=None, reduction=None):
+        engine = self.get_engine(engine)
+        reduction = self.get_reduction(reduction, 'reduce')
 
-        # add the two arrays
-        start_time = MPI.Wtime()
-        for i in range( workloads[self.rank] ):
-            a[i] = a[i] + b[i]
-        end_time = MPI.Wtime()
         if self.rank == 0:
-            print("Add arrays time: " + str(end_time - start_time))
+            print("")
+            print("Collective communication")
+            print("----------------------------------------------------")
+
+        # determine the workload of each rank
+        my_start, my_end = self.partition.block(self.rank)
+        workload = my_end - my_start
+        compute_start_time = MPI.Wtime()
+
+        if engine == 'fused':
+            sum = self.run_fused('collective_communication', my_start, my_end)
+        else:
+            # initialize a
+            start_time = MPI.Wtime()
+            a = np.ones(workload)
+            end_time = MPI.Wtime()
+            self.profiler.add('collective_communication/initialize_a', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize a time: " + str(end_time - start_time))
+
+            # initialize b
+            start_time = MPI.Wtime()
+            b = np.zeros(workload)
+            if engine == 'loop':
+                for i in range(workload):
+                    b[i] = 1.0 + (i + my_start)
+            else:
+                self.initialize_b(b, my_start)
+            end_time = MPI.Wtime()
+            self.profiler.add('collective_communication/initialize_b', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize b time: " + str(end_time - start_time))
+
+            # add the two arrays
+            start_time = MPI.Wtime()
+            if engine == 'loop':
+                for i in range(workload):
+                    a[i] = a[i] + b[i]
+            else:
+                self.add_arrays(a, b)
+            end_time = MPI.Wtime()
+            self.profiler.add('collective_communication/add', end_time - start_time)
+            if self.rank == 0:
+                print("Add arrays time: " + str(end_time - start_time))
 
         # average the result
         start_time = MPI.Wtime()
-        sum = 0.0
-        for i in range( workloads[self.rank] ):
-            sum += a[i]
+        if engine == 'loop':
+            sum = 0.0
+            for i in range(workload):
+                sum += a[i]
+            partial_sums = [sum]
+        elif engine == 'vectorized':
+            partial_sums = self.partial_sums(a, reduction)
+        else:
+            partial_sums = [sum]
 
+        compute_time = MPI.Wtime() - compute_start_time
+        world_sum = self.reduce_sum(partial_sums, reduction)
+        if reduction == 'iallreduce':
+            # the pipelined block sums overlap with their reductions, the time includes the reduction
+            compute_time = MPI.Wtime() - compute_start_time
         if self.rank == 0:
-            world_sum = sum
-            for i in range( 1, self.world_size ):
-                sum_np = np.empty( 1 )
-                self.world_comm.Recv( [sum_np, MPI.DOUBLE], source=i, tag=77 )
-                world_sum += sum_np[0]
             average = world_sum / self.N
-        else:
-            sum_np = np.array( [sum] )
-            self.world_comm.Send( [sum_np, MPI.DOUBLE], dest=0, tag=77 )
 
         end_time = MPI.Wtime()
+        self.profiler.add('collective_communication/average', end_time - start_time)
         if self.rank == 0:
             print("Average result time: " + str(end_time - start_time))
             print("Average: " + str(average))
 
-    def collective_communication(self):
+        self.rebalance_partition(compute_time)
+
+    def create_input_file(self, file_name):
+        """
+        Write a = 1 and b[i] = 1 + i as the rows of a (2, N) .npy file, every rank writes its block (collective)
+        """
+
+        if self.rank == 0:
+            data = np.lib.format.open_memmap(file_name, mode='w+', dtype=np.float64, shape=(2, self.N))
+            data.flush()
+            del data
+        self.world_comm.Barrier()
+
+        my_start, my_end = self.partition.block(self.rank)
+        data = np.load(file_name, mmap_mode='r+')
+        data[0, my_start:my_end] = 1.0
+        self.initialize_b(data[1, my_start:my_end], my_start)
+        data.flush()
+        del data
+        self.world_comm.Barrier()
+
+    def get_pieces(self):
+        """
+        Pipeline steps of the scatter/gather method: every rank receives its block in pieces of
+        chunk_size / world_size elements, step k holds piece k of every block
+        Returns the piece size and the number of steps
+        """
+
+        piece = max(1, self.chunk_size // self.world_size)
+        return piece, -(-int(np.max(self.partition.counts)) // piece)
+
+    def post_scatter(self, a, b, step, piece, a_buffer, b_buffer):
+        """
+        Start the Iscatterv of piece step of every block of a and b from rank 0
+        """
+
+        counts, displacements = self.partition.buffer_counts()
+        offsets = np.minimum(step * piece, counts)
+        counts = np.minimum(counts - offsets, piece)
+        displacements = displacements + offsets
+        n = int(counts[self.rank])
+
+        requests = [self.world_comm.Iscatterv([data, counts, displacements, MPI.DOUBLE] if self.rank == 0 else None,
+                                              [buffer[:n], MPI.DOUBLE], root=0)
+                    for data, buffer in ((a, a_buffer), (b, b_buffer))]
+        self.profiler.count('Iscatterv', 2 * n * 8)
+        return requests
+
+    def read_pieces(self, input_file):
+        """
+        Generator of the pieces (a, b) of the block of this rank read from the (2, N) input file,
+        through a memory map or with nonblocking MPI-IO reads pipeline_depth pieces ahead
+        """
+
+        my_start, my_end = self.partition.block(self.rank)
+        piece, _ = self.get_pieces()
+
+        if self.io == 'memmap':
+            data = np.load(input_file, mmap_mode='r')
+            if data.shape != (2, self.N):
+                raise ValueError("Unknown input shape: " + str(data.shape))
+            for lo in range(my_start, my_end, piece):
+                hi = min(lo + piece, my_end)
+                yield data[0, lo:hi], data[1, lo:hi]
+            return
+
+        offset = np.zeros(1, dtype='i8')
+        if self.rank == 0:
+            data = np.load(input_file, mmap_mode='r')
+            if data.shape != (2, self.N):
+                raise ValueError("Unknown input shape: " + str(data.shape))
+            offset[0] = data.offset
+            del data
+        self.world_comm.Bcast([offset, MPI.INT64_T], root=0)
+
+        file = MPI.File.Open(self.world_comm, input_file, MPI.MODE_RDONLY)
+        buffers = np.empty([self.pipeline_depth, 2, piece])
+        pending = []
+
+        def post(lo):
+            n = min(piece, my_end - lo)
+            slot = (lo - my_start) // piece % self.pipeline_depth
+            requests = [file.Iread_at(int(offset[0]) + 8 * lo, [buffers[slot, 0, :n], MPI.DOUBLE]),
+                        file.Iread_at(int(offset[0]) + 8 * (self.N + lo), [buffers[slot, 1, :n], MPI.DOUBLE])]
+            pending.append((slot, n, requests))
+
+        starts = list(range(my_start, my_end, piece))
+        for lo in starts[:self.pipeline_depth]:
+            post(lo)
+        for k in range(len(starts)):
+            slot, n, requests = pending.pop(0)
+            MPI.Request.Waitall(requests)
+            yield buffers[slot, 0, :n], buffers[slot, 1, :n]
+            if k + self.pipeline_depth < len(starts):
+                post(starts[k + self.pipeline_depth])
+
+        file.Close()
+
+    def scatter_gather(self, source='root', input_file=None, output_file=None, reduction=None):
+        """
+        Vector addition and averaging of input data that does not originate on every rank
+        With source 'root' rank 0 holds a and b and scatters them with Iscatterv in pieces of
+        chunk_size / world_size elements per rank, pipeline_depth pieces ahead of the computation.
+        With source 'file' every rank reads its block of the (2, N) input_file (see create_input_file)
+        by itself. Every rank only keeps its block of the result c = a + b (N / world_size), which is
+        written to output_file by all ranks or otherwise gathered into self.result on rank 0.
+        """
+
+        reduction = self.get_reduction(reduction, 'reduce')
+        if source not in ('root', 'file'):
+            raise ValueError("Unknown source: " + str(source))
+        if source == 'file' and input_file is None:
+            raise ValueError("Reading the input from a file requires an input file")
+
         if self.rank == 0:
             print("")
-            print("Collective communication")
+            print("Scatter/gather data distribution")
             print("----------------------------------------------------")
 
-        # determine the workload of each rank
-        workloads = [self.N // self.world_size for i in range(self.world_size)]
-        for i in range(self.N % self.world_size):
-            workloads[i] += 1
-        my_start = 0
-        for i in range(self.rank):
-            my_start += workloads[i]
-        my_end = my_start + workloads[self.rank]
-
-        # initialize a
+        my_start, my_end = self.partition.block(self.rank)
+        c = np.empty(my_end - my_start)
+        piece, n_steps = self.get_pieces()
+        sum = 0.0
+
         start_time = MPI.Wtime()
-        a = np.ones(workloads[self.rank])
+        if source == 'root':
+            # only rank 0 holds the full input
+            a, b = None, None
+            if self.rank == 0:
+                a = np.ones(self.N)
+                b = np.empty(self.N)
+                self.initialize_b(b, 0)
+            a_buffers = np.empty([self.pipeline_depth, piece])
+            b_buffers = np.empty([self.pipeline_depth, piece])
+
+            pending = [self.post_scatter(a, b, step, piece, a_buffers[step], b_buffers[step])
+                       for step in range(min(self.pipeline_depth, n_steps))]
+            for step in range(n_steps):
+                wait_all(pending.pop(0))
+                slot = step % self.pipeline_depth
+                lo = min(step * piece, len(c))
+                hi = min(lo + piece, len(c))
+                np.add(a_buffers[slot, :hi - lo], b_buffers[slot, :hi - lo], out=c[lo:hi])
+                sum += self.sum_array(c[lo:hi])
+                # the slot is free again, the piece pipeline_depth steps ahead can be received into it
+                if step + self.pipeline_depth < n_steps:
+                    pending.append(self.post_scatter(a, b, step + self.pipeline_depth, piece, a_buffers[slot],
+                                                     b_buffers[slot]))
+        else:
+            lo = 0
+            for a_piece, b_piece in self.read_pieces(input_file):
+                hi = lo + len(a_piece)
+                np.add(a_piece, b_piece, out=c[lo:hi])
+                sum += self.sum_array(c[lo:hi])
+                lo = hi
         end_time = MPI.Wtime()
+        self.profiler.add('scatter_gather/distribute_and_add', end_time - start_time)
         if self.rank == 0:
-            print("Initialize a time: " + str(end_time - start_time))
+            print("Distribute and add time: " + str(end_time - start_time))
 
-        # initialize b
+        # write back or gather the result
         start_time = MPI.Wtime()
-        b = np.zeros(workloads[self.rank])
-        for i in range(workloads[self.rank]):
-            b[i] = 1.0 + (i + my_start)
+        if output_file is not None:
+            self.write_result(output_file, c, my_start)
+        else:
+            counts, displacements = self.partition.buffer_counts()
+            self.result = np.empty(self.N) if self.rank == 0 else None
+            self.world_comm.Gatherv([c, MPI.DOUBLE], [self.result, counts, displacements, MPI.DOUBLE], root=0)
+            self.profiler.count('Gatherv', c.nbytes)
         end_time = MPI.Wtime()
+        self.profiler.add('scatter_gather/result', end_time - start_time)
         if self.rank == 0:
-            print("Initialize b time: " + str(end_time - start_time))
+            print("Write result time: " + str(end_time - start_time))
 
-        # add the two arrays
+        # average the result
         start_time = MPI.Wtime()
-        for i in range(workloads[self.rank]):
-            a[i] = a[i] + b[i]
+        world_sum = self.reduce_sum([sum], reduction)
         end_time = MPI.Wtime()
+        self.profiler.add('scatter_gather/average', end_time - start_time)
         if self.rank == 0:
-            print("Add arrays time: " + str(end_time - start_time))
+            print("Average result time: " + str(end_time - start_time))
+            print("Average: " + str(world_sum / self.N))
 
-        # average the result
-        start_time = MPI.Wtime()
-        sum = 0.0
-        for i in range(workloads[self.rank]):
-            sum += a[i]
+    def write_result(self, output_file, c, my_start):
+        """
+        Write the block of the result of every rank at its offset into the .npy output_file (collective)
+        """
 
-        sum = np.array([sum])
-        world_sum = np.zeros(1)
-        self.world_comm.Reduce([sum, MPI.DOUBLE], [world_sum, MPI.DOUBLE], op=MPI.SUM, root=0)
+        offset = np.zeros(1, dtype='i8')
+        if self.rank == 0:
+            result = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float64, shape=(self.N,))
+            offset[0] = result.offset
+            result.flush()
+            del result
+        self.world_comm.Bcast([offset, MPI.INT64_T], root=0)
+
+        if self.io == 'mpiio':
+            file = MPI.File.Open(self.world_comm, output_file, MPI.MODE_WRONLY)
+            file.Write_at_all(int(offset[0]) + 8 * my_start, [c, MPI.DOUBLE])
+            file.Close()
+        else:
+            result = np.load(output_file, mmap_mode='r+')
+            result[my_start:my_start + len(c)] = c
+            result.flush()
+            del result
+            self.world_comm.Barrier()
+
+    def shared_memory_pool(self, engine=None):
+        """
+        Vector addition and averaging on a pool of n_workers processes without MPI
+        The arrays a and b live in shared memory and every worker handles a contiguous block of them,
+        the partial sums returned by the workers are added by the parent process.
+        """
+
+        engine = self.get_engine(engine)
+
+        if self.rank == 0:
+            print("")
+            print("Shared memory pool")
+            print("----------------------------------------------------")
+
+        pool = SharedMemoryPool(self.n_workers)
+        blocks = pool.blocks(self.N)
+
+        if engine != 'fused':
+            a = pool.array('a', (self.N,))
+            b = pool.array('b', (self.N,))
+        pool.start(VectorAdditionAveraging.pool_initializer, (self.chunk_size,))
+
+        if engine == 'fused':
+            start_time = MPI.Wtime()
+            sums = pool.map(VectorAdditionAveraging.pool_sum, [(engine, start, end) for start, end in blocks])
+            end_time = MPI.Wtime()
+            self.profiler.add('shared_memory_pool/fused', end_time - start_time)
+            if self.rank == 0:
+                print("Fused initialize, add and sum time: " + str(end_time - start_time))
+
+            # average the result
+            start_time = MPI.Wtime()
+        else:
+            # initialize a
+            start_time = MPI.Wtime()
+            pool.map(VectorAdditionAveraging.pool_initialize,
+                     [('initialize_a', engine, start, end) for start, end in blocks])
+            end_time = MPI.Wtime()
+            self.profiler.add('shared_memory_pool/initialize_a', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize a time: " + str(end_time - start_time))
+
+            # initialize b
+            start_time = MPI.Wtime()
+            pool.map(VectorAdditionAveraging.pool_initialize,
+                     [('initialize_b', engine, start, end) for start, end in blocks])
+            end_time = MPI.Wtime()
+            self.profiler.add('shared_memory_pool/initialize_b', end_time - start_time)
+            if self.rank == 0:
+                print("Initialize b time: " + str(end_time - start_time))
+
+            # add the two arrays
+            start_time = MPI.Wtime()
+            pool.map(VectorAdditionAveraging.pool_add, [(engine, start, end) for start, end in blocks])
+            end_time = MPI.Wtime()
+            self.profiler.add('shared_memory_pool/add', end_time - start_time)
+            if self.rank == 0:
+                print("Add arrays time: " + str(end_time - start_time))
+
+            # average the result
+            start_time = MPI.Wtime()
+            sums = pool.map(VectorAdditionAveraging.pool_sum, [(engine, start, end) for start, end in blocks])
+
+        world_sum = 0.0
+        for sum in sums:
+            world_sum += sum
         average = world_sum / self.N
 
         end_time = MPI.Wtime()
+        self.profiler.add('shared_memory_pool/average', end_time - start_time)
         if self.rank == 0:
             print("Average result time: " + str(end_time - start_time))
-            print("Average: " + str(average[0]))
\ No newline at end of file
+            print("Average: " + str(average))
+
+        # the shared arrays can only be released without views pointing into them
+        if engine != 'fused':
+            del a, b
+        pool.close()
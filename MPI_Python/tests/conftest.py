@@ -0,0 +1,34 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+
+# the tests import the sources as the scripts do, relative to the MPI_Python directory
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, PACKAGE_DIR)
+
+
+@pytest.fixture
+def mpiexec():
+    """
+    Run a Python script given as a string on n_ranks ranks with mpiexec (skips the test without mpiexec)
+    The script gets the MPI_Python directory and the JSON encoded arguments in sys.argv and prints
+    the JSON encoded result on rank 0 as its last line, which is returned decoded.
+    """
+
+    if shutil.which('mpiexec') is None:
+        pytest.skip("mpiexec not found")
+
+    # allow Open MPI to run as root and with more ranks than cores (ignored by other implementations)
+    environment = dict(os.environ, OMPI_ALLOW_RUN_AS_ROOT='1', OMPI_ALLOW_RUN_AS_ROOT_CONFIRM='1',
+                       OMPI_MCA_rmaps_base_oversubscribe='1')
+
+    def run(n_ranks, script, *arguments):
+        output = subprocess.run(['mpiexec', '-n', str(n_ranks), sys.executable, '-c', script, PACKAGE_DIR] +
+                                [json.dumps(argument) for argument in arguments],
+                                env=environment, capture_output=True, text=True, timeout=300, check=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    return run
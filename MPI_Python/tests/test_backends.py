@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from source.MonteCarlo import MonteCarlo
+
+
+@pytest.mark.parametrize('incremental_energy', [True, False])
+def test_pool_batches_match_mpi_batches(incremental_energy):
+    energies = []
+    for backend in ('mpi', 'multiprocessing'):
+        mc = MonteCarlo(backend=backend, n_workers=2, mpi_mode='batched', batch_size=8, plot=False, n_steps=400,
+                        freq=200, num_particles=500, build_method='fcc', incremental_energy=incremental_energy)
+        mc.main()
+        energies.append(np.array(mc.energy_array))
+        assert mc.n_batches > 0
+
+    assert np.allclose(energies[0], energies[1], rtol=1e-12)
+
+
+def worker_mpi_state(task):
+    """
+    MPI stand-in and communicator seen by a pool worker
+    """
+
+    from source.Backend import MPI, SerialMPI, get_worker_context
+    return MPI.Wtime is SerialMPI.Wtime, type(get_worker_context().world_comm).__name__
+
+
+def test_pool_workers_never_use_mpi():
+    from mpi4py import MPI as mpi4py_MPI
+    from source.Backend import MPI, SharedMemoryPool
+
+    assert MPI.Wtime is mpi4py_MPI.Wtime
+
+    pool = SharedMemoryPool(2)
+    pool.array('coordinates', (4, 3))
+    pool.array('particle_energies', (4,))
+    pool.start(MonteCarlo.pool_initializer, (dict(num_particles=4),))
+    try:
+        states = pool.map(worker_mpi_state, range(2))
+    finally:
+        pool.close()
+
+    assert states == [(True, 'SerialComm')] * 2
+    assert MPI.Wtime is mpi4py_MPI.Wtime
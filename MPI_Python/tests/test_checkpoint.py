@@ -0,0 +1,37 @@
+import shutil
+import numpy as np
+import pytest
+from source.Backend import SerialComm
+from source.MonteCarlo import MonteCarlo
+
+SETTINGS = {'plot': False, 'num_particles': 32, 'n_steps': 400, 'freq': 100, 'build_method': 'fcc', 'seed': 3}
+
+
+@pytest.mark.parametrize('use_mpi', [False, True])
+@pytest.mark.parametrize('mpi_mode', ['replicated', 'shared_rng', 'batched'])
+def test_restart_continues_the_run_bit_identically(tmp_path, use_mpi, mpi_mode):
+    comm = SerialComm() if use_mpi else None
+    checkpoint_file = str(tmp_path / 'checkpoint.pkl')
+    trajectory_file = str(tmp_path / 'trajectory.npy')
+    restart_trajectory_file = str(tmp_path / 'restart_trajectory.npy')
+
+    # the checkpoint is written at the beginning of the middle step of the uninterrupted run
+    mc = MonteCarlo(use_mpi=use_mpi, comm=comm, mpi_mode=mpi_mode, checkpoint_file=checkpoint_file,
+                    checkpoint_freq=SETTINGS['n_steps'] // 2, trajectory_file=trajectory_file, **SETTINGS)
+    mc.main()
+
+    # the restarted run has to write the frames of the second half again
+    shutil.copy(trajectory_file, restart_trajectory_file)
+    frames = np.load(restart_trajectory_file, mmap_mode='r+')
+    frames[len(frames) // 2:] = 0.0
+    frames.flush()
+    del frames
+
+    restarted = MonteCarlo(use_mpi=use_mpi, comm=comm, mpi_mode=mpi_mode, restart_file=checkpoint_file,
+                           trajectory_file=restart_trajectory_file, **SETTINGS)
+    restarted.main()
+
+    assert np.array_equal(restarted.energy_array, mc.energy_array)
+    assert np.array_equal(np.load(restart_trajectory_file), np.load(trajectory_file))
+    assert restarted.get_random_state() == mc.get_random_state()
+    assert restarted.max_displacement == mc.max_displacement
@@ -0,0 +1,50 @@
+import numpy as np
+from source.MonteCarlo import MonteCarlo
+from source import Kernels
+
+
+def test_compare_compiled_kernels():
+    mc = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method='fcc', energy_engine='compiled')
+    coordinates = mc.generate_initial_state(method='fcc')
+    coordinates += 0.05 * (np.random.default_rng(3).random(coordinates.shape) - 0.5)
+    total_energy = abs(mc.calculate_total_pair_energy_vectorized(coordinates))
+
+    for i_particle in (0, 50, 107):
+        particle_deviation, total_deviation = mc.compare_compiled_kernels(coordinates, i_particle=i_particle)
+        assert particle_deviation <= 1e-10 * total_energy
+        assert total_deviation <= 1e-10 * total_energy
+
+
+def test_compiled_chain_matches_numpy_chain():
+    mc = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method='fcc')
+    random = np.random.default_rng(5)
+    n_steps = 200
+    particles = random.integers(108, size=n_steps)
+    displacements = (2.0 * random.random((n_steps, 3)) - 1.0) * 0.1
+    random_numbers = random.random(n_steps)
+
+    results = []
+    for chain in (Kernels.metropolis_chain, Kernels.metropolis_chain_numpy):
+        coordinates = mc.generate_initial_state(method='fcc')
+        delta_energies = np.zeros(n_steps)
+        n_accept = chain(coordinates, particles, displacements, random_numbers, mc.beta, mc.box_length,
+                         mc.simulation_cutoff2, delta_energies)
+        results.append((n_accept, coordinates, delta_energies))
+
+    assert results[0][0] == results[1][0]
+    assert np.allclose(results[0][1], results[1][1])
+    assert np.allclose(results[0][2], results[1][2])
+
+
+def test_compiled_pair_energies_match_vectorized():
+    compiled = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method='fcc', energy_engine='compiled')
+    vectorized = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method='fcc')
+    coordinates = compiled.generate_initial_state(method='fcc')
+    position = coordinates[10] + 0.1
+
+    for start, stride in ((0, 1), (1, 3)):
+        neighbors, energies = compiled.get_pair_energies(coordinates, 10, position, start, stride)
+        reference_neighbors, reference_energies = vectorized.get_pair_energies(coordinates, 10, position, start,
+                                                                               stride)
+        assert np.array_equal(neighbors, reference_neighbors)
+        assert np.allclose(energies, reference_energies, rtol=1e-12, atol=1e-12)
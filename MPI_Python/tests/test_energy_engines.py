@@ -0,0 +1,60 @@
+import threading
+import numpy as np
+import pytest
+from source.MonteCarlo import MonteCarlo
+
+
+@pytest.mark.parametrize('build_method', ['random', 'fcc'])
+def test_loop_and_vectorized_engines_agree(build_method):
+    mc = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method=build_method)
+    coordinates = mc.generate_initial_state(method=build_method)
+
+    for i_particle in (0, 17, 107):
+        assert np.isclose(mc.get_particle_energy_vectorized(coordinates, i_particle),
+                          mc.get_particle_energy_loop(coordinates, i_particle), rtol=1e-10)
+
+    assert np.isclose(mc.calculate_total_pair_energy_vectorized(coordinates),
+                      mc.calculate_total_pair_energy_loop(coordinates), rtol=1e-10)
+
+
+def test_compare_energy_engines():
+    mc = MonteCarlo(use_mpi=False, plot=False, num_particles=108, build_method='fcc')
+    coordinates = mc.generate_initial_state(method='fcc')
+    total_energy = abs(mc.calculate_total_pair_energy_loop(coordinates))
+
+    particle_deviation, total_deviation = mc.compare_energy_engines(coordinates, i_particle=5)
+    assert particle_deviation <= 1e-10 * total_energy
+    assert total_deviation <= 1e-10 * total_energy
+
+
+
+def test_incremental_loop_engine_matches_vectorized():
+    engines = [MonteCarlo(use_mpi=False, plot=False, num_particles=32, n_steps=200, freq=100, build_method='fcc',
+                          energy_engine=energy_engine) for energy_engine in ('loop', 'vectorized')]
+    coordinates = engines[0].generate_initial_state(method='fcc')
+    position = coordinates[3] + 0.1
+
+    (neighbors, energies), (reference_neighbors, reference_energies) = [
+        mc.get_pair_energies(coordinates, 3, position) for mc in engines]
+    assert np.array_equal(neighbors, reference_neighbors)
+    assert np.allclose(energies, reference_energies, rtol=1e-12, atol=1e-12)
+
+    for mc in engines:
+        mc.main()
+    assert np.allclose(engines[0].energy_array, engines[1].energy_array, rtol=1e-10)
+
+
+def test_threads_match_single_thread_and_are_shut_down():
+    engines = [MonteCarlo(use_mpi=False, plot=False, num_particles=32, n_steps=200, freq=100, build_method='fcc',
+                          n_threads=n_threads, thread_chunk_size=4) for n_threads in (1, 2)]
+    n_threads_before = threading.active_count()
+
+    for mc in engines:
+        mc.main()
+    assert np.allclose(engines[1].energy_array, engines[0].energy_array, rtol=1e-10)
+    assert engines[1].thread_pool is None
+    assert threading.active_count() == n_threads_before
+
+    # a second run starts a new pool
+    engines[1].main()
+    assert threading.active_count() == n_threads_before
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from source.MonteCarlo import MonteCarlo
+
+
+def brute_force_energy(mc, coordinates, i_particle):
+    """
+    Energy of a particle with all other particles, without any neighbor search
+    """
+
+    rij2 = mc.minimum_image_distances(coordinates[i_particle], np.delete(coordinates, i_particle, axis=0))
+    return mc.lennard_jones_sum(rij2)
+
+
+@pytest.mark.parametrize('neighbor_method', ['cell', 'verlet'])
+def test_neighbor_energies_match_brute_force(neighbor_method):
+    mc = MonteCarlo(use_mpi=False, plot=False, num_particles=1372, simulation_cutoff=2.5, build_method='fcc',
+                    neighbor_method=neighbor_method, verlet_skin=0.3)
+    coordinates = mc.generate_initial_state(method='fcc')
+    mc.neighbor_list = mc.build_neighbor_list(coordinates)
+    random = np.random.default_rng(7)
+
+    # the box holds more than 3 cells per dimension, so the neighbor search actually restricts the pairs,
+    # and displacements beyond half the skin force the Verlet list to update the moved particles
+    for _ in range(1000):
+        i_particle = random.integers(len(coordinates))
+        new_position = coordinates[i_particle] + (2.0 * random.random(3) - 1.0) * 0.4
+        new_position -= mc.box_length * np.round(new_position / mc.box_length)
+        coordinates[i_particle] = new_position
+        mc.neighbor_list.update(i_particle, new_position)
+
+    for i_particle in range(len(coordinates)):
+        assert np.isclose(mc.get_particle_energy_neighbors(coordinates, i_particle),
+                          brute_force_energy(mc, coordinates, i_particle), rtol=1e-10, atol=1e-10)
+
+    assert np.isclose(mc.calculate_total_pair_energy(coordinates),
+                      mc.calculate_total_pair_energy_vectorized(coordinates), rtol=1e-10)
+    if neighbor_method == 'verlet':
+        assert mc.neighbor_list.n_builds == 1
+        assert mc.neighbor_list.n_updates > 0
@@ -0,0 +1,17 @@
+import pytest
+from source.MonteCarlo import MonteCarlo
+
+
+@pytest.mark.parametrize('n_steps', [100, 300])
+def test_replicated_run_samples_every_report_step(n_steps):
+    mc = MonteCarlo(use_mpi=True, plot=False, n_steps=n_steps, freq=100, num_particles=32, build_method='fcc',
+                    observables=True)
+    mc.main()
+
+    serial = MonteCarlo(use_mpi=False, plot=False, n_steps=n_steps, freq=100, num_particles=32, build_method='fcc',
+                        observables=True)
+    serial.main()
+
+    assert mc.observables.n_samples == n_steps // 100
+    assert mc.observables.pressure(mc.reduced_temperature) == \
+        pytest.approx(serial.observables.pressure(serial.reduced_temperature), rel=1e-10)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from source.Partition import Partition, PARTITION_METHODS
+
+
+def make_partition(n, n_parts, method):
+    weights = np.arange(1, n_parts + 1) if method == 'weighted' else None
+    return Partition(n, n_parts, method, weights)
+
+
+@pytest.mark.parametrize('method', PARTITION_METHODS)
+@pytest.mark.parametrize('n, n_parts', [(0, 3), (2, 5), (10, 1), (10, 3), (101, 4), (1000, 7)])
+def test_every_index_is_covered_once(method, n, n_parts):
+    partition = make_partition(n, n_parts, method)
+
+    indices = np.concatenate([partition.indices(part) for part in range(n_parts)])
+    assert np.array_equal(np.sort(indices), np.arange(n))
+    assert np.array_equal(partition.order(), indices)
+    assert [len(partition.indices(part)) for part in range(n_parts)] == \
+        [partition.count(part) for part in range(n_parts)]
+
+    counts, displacements = partition.buffer_counts(3)
+    assert np.array_equal(counts, 3 * partition.counts)
+    assert np.array_equal(displacements, np.concatenate([[0], np.cumsum(counts)[:-1]]))
+
+
+@pytest.mark.parametrize('n, n_parts', [(10, 3), (101, 4), (1000, 7)])
+def test_block_sizes_differ_by_at_most_one(n, n_parts):
+    counts = Partition(n, n_parts).counts
+    assert counts.max() - counts.min() <= 1
+    assert np.all(np.diff(counts) <= 0)
+
+
+def test_weighted_counts_follow_the_weights():
+    partition = Partition(100, 4, 'weighted', [1.0, 1.0, 2.0, 0.0])
+    assert partition.counts.tolist() == [25, 25, 50, 0]
+
+
+def test_rebalance_keeps_every_index():
+    partition = Partition(101, 4)
+    rebalanced = partition.rebalance([1.0, 2.0, 1.0, 4.0])
+
+    assert rebalanced.method == 'weighted'
+    assert np.array_equal(np.concatenate([rebalanced.indices(part) for part in range(4)]), np.arange(101))
+    assert rebalanced.count(0) > rebalanced.count(3)
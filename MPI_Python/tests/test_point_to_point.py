@@ -0,0 +1,33 @@
+import pytest
+from source.PointToPoint import PointToPointBenchmark
+
+
+class PairComm:
+    """
+    Communicator stand-in of rank 0 of two ranks, enough to construct the benchmark
+    """
+
+    def Get_size(self):
+        return 2
+
+    def Get_rank(self):
+        return 0
+
+
+@pytest.mark.parametrize('max_total_bytes', [2 ** 20, 2 ** 30])
+def test_streaming_warmup_is_never_empty(max_total_bytes):
+    benchmark = PointToPointBenchmark(max_bytes=2 ** 28, max_total_bytes=max_total_bytes, comm=PairComm())
+
+    for n_bytes in benchmark.message_sizes:
+        window = min(benchmark.window, benchmark.get_repetitions(n_bytes))
+        n_windows = benchmark.get_repetitions(n_bytes) // window
+        n_warmup = benchmark.get_warmup_windows(n_bytes, window, n_windows)
+        assert 1 <= n_warmup <= benchmark.n_warmup
+
+
+def test_streaming_warmup_respects_budget_for_small_messages():
+    benchmark = PointToPointBenchmark(n_warmup=10, window=16, comm=PairComm())
+    assert benchmark.get_warmup_windows(8, 16, 6) == 10
+
+    benchmark = PointToPointBenchmark(n_warmup=0, comm=PairComm())
+    assert benchmark.get_warmup_windows(8, 16, 6) == 0
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+from source.Backend import MPI, SerialComm
+from source.MonteCarlo import MonteCarlo
+
+SETTINGS = {'plot': False, 'num_particles': 32, 'n_steps': 300, 'freq': 100, 'build_method': 'fcc', 'seed': 7}
+MPI_MODES = ['replicated', 'shared_rng', 'batched']
+
+# runs a few modes on all ranks of mpiexec and prints the energies and final coordinates of rank 0
+RUN_SCRIPT = """
+import json, sys
+import numpy as np
+sys.path.insert(0, sys.argv[1])
+from source.Backend import MPI
+from source.MonteCarlo import MonteCarlo
+settings = json.loads(sys.argv[2])
+results = {}
+for mpi_mode in json.loads(sys.argv[3]):
+    trajectory_file = json.loads(sys.argv[4]) + '_' + mpi_mode + '.npy'
+    mc = MonteCarlo(use_mpi=True, mpi_mode=mpi_mode, trajectory_file=trajectory_file, **settings)
+    mc.main()
+    if MPI.COMM_WORLD.Get_rank() == 0:
+        results[mpi_mode] = [mc.energy_array.tolist(), np.load(trajectory_file)[-1].tolist()]
+mc = MonteCarlo(use_mpi=True, **settings)
+initial_state = mc.generate_initial_state_parallel(method='random')
+if MPI.COMM_WORLD.Get_rank() == 0:
+    results['initial_state'] = initial_state.tolist()
+    print(json.dumps(results))
+"""
+
+
+def run(tmp_path, mpi_mode, **kwargs):
+    """
+    Energies of all steps and the final coordinates of a run
+    """
+
+    trajectory_file = str(tmp_path / (mpi_mode + '_' + str(len(os.listdir(tmp_path))) + '.npy'))
+    mc = MonteCarlo(mpi_mode=mpi_mode, trajectory_file=trajectory_file, **SETTINGS, **kwargs)
+    mc.main()
+    return mc.energy_array, np.load(trajectory_file)[-1]
+
+
+@pytest.mark.parametrize('mpi_mode', MPI_MODES)
+def test_mpi_run_matches_serial_run(tmp_path, mpi_mode):
+    energies, coordinates = run(tmp_path, mpi_mode, use_mpi=False)
+
+    for comm in (SerialComm(), MPI.COMM_WORLD.Split(color=MPI.COMM_WORLD.Get_rank())):
+        mpi_energies, mpi_coordinates = run(tmp_path, mpi_mode, use_mpi=True, comm=comm)
+        assert np.allclose(mpi_energies, energies, rtol=1e-12)
+        assert np.allclose(mpi_coordinates, coordinates, rtol=1e-12)
+
+
+def test_parallel_initial_state_matches_serial_initial_state():
+    coordinates = MonteCarlo(use_mpi=False, **SETTINGS).generate_initial_state(method='random')
+    mc = MonteCarlo(use_mpi=True, comm=SerialComm(), **SETTINGS)
+    assert np.array_equal(mc.generate_initial_state_parallel(method='random'), coordinates)
+
+
+def test_results_do_not_depend_on_rank_count(tmp_path, mpiexec):
+    serial = MonteCarlo(use_mpi=False, **SETTINGS)
+    initial_state = serial.generate_initial_state(method='random')
+
+    results = mpiexec(3, RUN_SCRIPT, SETTINGS, MPI_MODES, str(tmp_path / 'trajectory'))
+
+    assert np.array_equal(results['initial_state'], initial_state)
+    for mpi_mode in MPI_MODES:
+        energies, coordinates = run(tmp_path, mpi_mode, use_mpi=False)
+        assert np.allclose(results[mpi_mode][0], energies, rtol=1e-12)
+        assert np.allclose(results[mpi_mode][1], coordinates, rtol=1e-12)
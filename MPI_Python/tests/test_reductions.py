@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from source.Backend import SerialComm
+from source.VectorAdditionAveraging import VectorAdditionAveraging
+
+REDUCTIONS = ['linear', 'tree', 'recursive_doubling', 'reduce', 'allreduce', 'iallreduce']
+# these reductions return the sum on rank 0 only
+ROOTED_REDUCTIONS = ('linear', 'tree', 'reduce')
+
+# every rank sums its block of the same array with each reduction, rank 0 prints the results
+REDUCE_SCRIPT = """
+import json, sys
+import numpy as np
+sys.path.insert(0, sys.argv[1])
+from source.VectorAdditionAveraging import VectorAdditionAveraging
+n, reductions = json.loads(sys.argv[2]), json.loads(sys.argv[3])
+vector = VectorAdditionAveraging(N=n, backend='mpi')
+start, end = vector.partition.block(vector.rank)
+a = np.random.default_rng(5).random(n)
+results = {}
+for reduction in reductions:
+    world_sum = vector.reduce_sum(vector.partial_sums(a[start:end], reduction), reduction)
+    results[reduction] = vector.world_comm.gather(world_sum, root=0)
+if vector.rank == 0:
+    print(json.dumps(results))
+"""
+
+
+@pytest.mark.parametrize('reduction', REDUCTIONS)
+@pytest.mark.parametrize('n', [1, 10, 1001])
+def test_reduction_matches_sum_on_serial_comm(reduction, n):
+    vector = VectorAdditionAveraging(N=n, backend='serial', comm=SerialComm(), pipeline_depth=4)
+    a = np.random.default_rng(5).random(n)
+
+    assert np.isclose(vector.reduce_sum(vector.partial_sums(a, reduction), reduction), np.sum(a), rtol=1e-12)
+
+
+@pytest.mark.parametrize('n_ranks', [3, 4])
+def test_reduction_matches_sum_on_all_ranks(mpiexec, n_ranks):
+    n = 1001
+    results = mpiexec(n_ranks, REDUCE_SCRIPT, n, REDUCTIONS)
+    expected = np.sum(np.random.default_rng(5).random(n))
+
+    for reduction in REDUCTIONS:
+        if reduction in ROOTED_REDUCTIONS:
+            assert np.isclose(results[reduction][0], expected, rtol=1e-12), reduction
+            assert results[reduction][1:] == [None] * (n_ranks - 1), reduction
+        else:
+            assert np.allclose(results[reduction], expected, rtol=1e-12), reduction